@@ -0,0 +1,248 @@
+"""
+Benchmarks of the simple graph engine on synthetic pipelines (see
+'graphs.py').
+
+For every shape, size and kind of units, the following operations are
+timed:
+
+    connect     connecting all units of a pipeline (with the cycle checks)
+    is_acyclic  one full cycle check
+    to_dict     the REST representation of the pipeline, its units and edges
+    save, load  writing and reading the pipeline file
+    run         'Pipeline.run' with each of the selected executors
+    read_ports  reading all of the outputs after a run
+
+The results are written as JSON, one record per benchmark, so that they can
+be compared across versions. 'run' and 'read_ports' records of the no-op
+units include the number of unit executions (not counted for the
+'processes' executor), which has to be equal to the number of units for a
+run, and to 0 for reading the outputs.
+
+Usage (from the root of the repository, if earlPipeline is not installed):
+
+    PYTHONPATH=. python benchmarks/bench_engine.py --sizes 10,100 -o res.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from earlpipeline.backends.base_simple_engine import Pipeline
+
+import graphs
+
+BENCHMARKS = ('connect', 'is_acyclic', 'to_dict', 'save', 'load', 'run',
+        'read_ports')
+
+
+def timed(func, setup=None, repeat=3):
+    """
+    Calls the function several times, and measures the time of each call
+
+    Parameters
+    ----------
+    func : callable
+        called with the result of 'setup', if given
+    setup : callable, optional
+        called before every call of 'func' (not timed)
+    repeat : int, optional
+        number of calls
+
+    Returns
+    -------
+    times : list
+        durations of the calls in seconds
+    result : object
+        the result of the last call
+    """
+
+    times = []
+    result = None
+    for _ in range(repeat):
+        args = setup is not None and (setup(),) or ()
+        start = timeit.default_timer()
+        result = func(*args)
+        times.append(timeit.default_timer() - start)
+
+    return times, result
+
+
+def bench_graph(shape, size, kind, executors, benchmarks, repeat, folder):
+    """Runs the benchmarks on one pipeline. Yields the result records"""
+
+    ppl, edges = graphs.make_pipeline(shape, size, kind)
+    common = {
+            'shape': shape,
+            'size': size,
+            'kind': kind,
+            'units': len(ppl.units),
+            'edges': len(edges),
+            }
+
+    def record(name, times, **extra):
+        res = dict(common)
+        res.update(extra)
+        res.update({
+            'benchmark': name,
+            'times': times,
+            'best': min(times),
+            })
+        return res
+
+    if 'connect' in benchmarks:
+        def setup():
+            return graphs.make_pipeline(shape, size, kind, connect=False)[0]
+        times, _ = timed(lambda p: graphs.connect_pipeline(p, edges, kind),
+                setup, repeat)
+        yield record('connect', times)
+
+    if 'is_acyclic' in benchmarks:
+        times, _ = timed(ppl.is_acyclic, repeat=repeat)
+        yield record('is_acyclic', times)
+
+    if 'to_dict' in benchmarks:
+        def to_dict():
+            return json.dumps({
+                'pipeline': ppl.to_dict(),
+                'units': [unit.to_dict() for unit in ppl.units],
+                'edges': [edge.to_dict() for edge in ppl.edges],
+                })
+        times, _ = timed(to_dict, repeat=repeat)
+        yield record('to_dict', times)
+
+    fname = os.path.join(folder, ppl.name + ".ppl")
+    if 'save' in benchmarks or 'load' in benchmarks:
+        times, _ = timed(lambda: ppl.save(fname), repeat=repeat)
+        if 'save' in benchmarks:
+            yield record('save', times, file_size=os.path.getsize(fname))
+    if 'load' in benchmarks:
+        times, _ = timed(lambda: Pipeline.load(fname), repeat=repeat)
+        yield record('load', times)
+
+    for executor in executors:
+        if 'run' not in benchmarks and 'read_ports' not in benchmarks:
+            break
+
+        counted = kind == 'noop' and executor != 'processes'
+
+        def setup():
+            return graphs.make_pipeline(shape, size, kind, executor)[0]
+
+        def run(p):
+            start_runs = graphs.count_runs()
+            p.run()
+            return p, graphs.count_runs() - start_runs
+
+        times, (run_ppl, runs) = timed(run, setup, repeat)
+        if 'run' in benchmarks:
+            yield record('run', times, executor=executor,
+                    executions=runs if counted else None)
+
+        if 'read_ports' in benchmarks:
+            def read_ports():
+                start_runs = graphs.count_runs()
+                for unit in run_ppl.units:
+                    for port in unit.get_out_ports():
+                        unit.read_port(port)
+                return graphs.count_runs() - start_runs
+
+            times, runs = timed(read_ports, repeat=repeat)
+            yield record('read_ports', times, executor=executor,
+                    executions=runs if counted else None)
+
+
+def get_revision():
+    """Returns the git revision of the working tree, or None"""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(shapes, sizes, kinds, executors, benchmarks, repeat=3):
+    """
+    Runs the benchmarks on all combinations of the shapes, sizes and kinds
+
+    Returns
+    -------
+    report : dict
+        {'created', 'python', 'platform', 'revision', 'results'}, where
+        'results' is a list of the benchmark records
+    """
+
+    results = []
+    folder = tempfile.mkdtemp()
+    try:
+        for kind in kinds:
+            for shape in shapes:
+                for size in sizes:
+                    for res in bench_graph(shape, size, kind, executors,
+                            benchmarks, repeat, folder):
+                        sys.stderr.write("%-10s %-10s %-8s %6d units %-10s "
+                                "%10.6fs\n" % (res['benchmark'], kind, shape,
+                                    res['units'], res.get('executor', ''),
+                                    res['best']))
+                        results.append(res)
+    finally:
+        shutil.rmtree(folder)
+
+    return {
+            'created': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'revision': get_revision(),
+            'results': results,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the simple "
+            "graph engine on synthetic pipelines")
+    parser.add_argument('--shapes', default=",".join(graphs.SHAPES),
+            help="comma-separated shapes (default: %(default)s)")
+    parser.add_argument('--sizes', default="10,100,1000",
+            help="comma-separated numbers of units (default: %(default)s)")
+    parser.add_argument('--kinds', default="noop",
+            help="comma-separated kinds of units: %s (default: "
+            "%%(default)s)" % ", ".join(sorted(graphs.KINDS)))
+    parser.add_argument('--executors', default="serial",
+            help="comma-separated executors for 'run' (default: "
+            "%(default)s)")
+    parser.add_argument('--benchmarks', default=",".join(BENCHMARKS),
+            help="comma-separated benchmarks (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="number of measurements of each benchmark (default: "
+            "%(default)s)")
+    parser.add_argument('-o', '--output',
+            help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # status events are not delivered anywhere
+    logging.getLogger('backend').addHandler(logging.NullHandler())
+
+    split = lambda value: [item for item in value.split(",") if item]
+    report = run_suite(split(args.shapes), [int(s) for s in split(args.sizes)],
+            split(args.kinds), split(args.executors), split(args.benchmarks),
+            args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark of the shared memory transport of the 'processes' executor (see
+'earlpipeline/backends/shared_memory.py').
+
+A source unit creates a large NumPy array, which is read by several units.
+The pipeline is run with the transport enabled ('shared') and disabled
+('pickled', i.e. share_threshold = None). For every mode the best run time is
+reported, along with the peak RSS of the pipeline process and of its
+largest worker. Every mode is measured in a separate process, so that the
+peak RSS values don't affect each other.
+
+Usage (from the root of the repository, if earlPipeline is not installed):
+
+    PYTHONPATH=. python benchmarks/bench_shared_memory.py --size 200 \\
+            --readers 3 -o res.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing as mp
+import platform
+import resource
+import sys
+
+import numpy as np
+
+from earlpipeline.backends.base_simple_engine import Pipeline, Unit, InPort, \
+        OutPort, Parameter
+from earlpipeline.backends.executors import ProcessExecutor
+
+from bench_engine import timed, get_revision
+
+MODES = ('shared', 'pickled')
+
+
+class ArraySource(Unit):
+    """Outputs an array of 'size' megabytes"""
+    out = OutPort('out')
+    size = Parameter('size', 'input', float, 1.0, datatype='number')
+
+    def run(self):
+        self.out = np.ones(int(self.size * 2**20) // 8)
+
+
+class ArraySum(Unit):
+    """Sums its input array"""
+    inp = InPort('inp')
+    out = OutPort('out')
+
+    def run(self):
+        self.out = float(self.inp.sum())
+
+
+def make_pipeline(size, readers):
+    """Creates a pipeline of a source and 'readers' units reading it"""
+    ppl = Pipeline("shared_memory_%d" % readers, 'processes', readers)
+    source = ArraySource()
+    source.size = size
+    ppl.add_unit(source, 'source')
+    for i in range(readers):
+        ppl.add_unit(ArraySum(), 'sum%d' % i)
+        ppl.connect('source', 'out', 'sum%d' % i, 'inp')
+    return ppl
+
+
+def measure(mode, size, readers, repeat, conn):
+    """Runs the pipeline in one of the 'MODES', and sends the result record
+    through the connection. Called in a separate process"""
+    if mode == 'pickled':
+        ProcessExecutor.share_threshold = None
+
+    times, _ = timed(lambda p: p.run(),
+            lambda: make_pipeline(size, readers), repeat)
+
+    # in kilobytes on Linux. The workers are joined by now
+    conn.send({
+        'benchmark': 'run',
+        'mode': mode,
+        'size_mb': size,
+        'readers': readers,
+        'times': times,
+        'best': min(times),
+        'peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024.,
+        'worker_peak_rss_mb': resource.getrusage(
+            resource.RUSAGE_CHILDREN).ru_maxrss / 1024.,
+        })
+    conn.close()
+
+
+def run_suite(modes, size, readers, repeat=3):
+    """
+    Measures every mode in a separate process
+
+    Returns
+    -------
+    report : dict
+        {'created', 'python', 'platform', 'revision', 'results'}
+    """
+
+    results = []
+    for mode in modes:
+        recv, send = mp.Pipe(False)
+        p = mp.Process(target=measure, args=(mode, size, readers, repeat,
+            send))
+        p.start()
+        res = recv.recv()
+        p.join()
+
+        sys.stderr.write("%-8s %6.1f MB x %d readers %10.6fs  peak RSS "
+                "%.0f MB, worker %.0f MB\n" % (mode, size, readers,
+                    res['best'], res['peak_rss_mb'],
+                    res['worker_peak_rss_mb']))
+        results.append(res)
+
+    return {
+            'created': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'revision': get_revision(),
+            'results': results,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the shared "
+            "memory transport of the 'processes' executor")
+    parser.add_argument('--size', type=float, default=200,
+            help="size of the array in megabytes (default: %(default)s)")
+    parser.add_argument('--readers', type=int, default=3,
+            help="number of units reading the array (default: %(default)s)")
+    parser.add_argument('--modes', default=",".join(MODES),
+            help="comma-separated modes (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="number of measurements of each mode (default: "
+            "%(default)s)")
+    parser.add_argument('-o', '--output',
+            help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # status events are not delivered anywhere
+    logging.getLogger('backend').addHandler(logging.NullHandler())
+
+    report = run_suite([mode for mode in args.modes.split(",") if mode],
+            args.size, args.readers, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark of starting pipeline runs in a large server process.
+
+The server's heap is inflated with 'ballast' megabytes of small objects
+(after the worker pool has been created, as the pipelines are loaded by a
+running server), and the following operations are timed:
+
+    fork     forking the server for a run, until the first event of the
+             pipeline is received
+    pool     submitting the pipeline to an idle 'WorkerPool' worker, until
+             the first event of the pipeline is received
+    replace  starting a worker, which replaces a recycled one: by the
+             'WorkerZygote' ('zygote'), or by forking the server ('server')
+
+Usage (from the root of the repository, if earlPipeline is not installed):
+
+    PYTHONPATH=. python benchmarks/bench_worker_pool.py --ballast 300 \\
+            -o res.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing as mp
+import platform
+import sys
+import timeit
+
+from logutils.queue import QueueHandler
+
+from earlpipeline import tools
+from earlpipeline.backends import calculator
+
+from bench_engine import timed, get_revision
+
+BENCHMARKS = ('fork', 'pool', 'replace')
+
+
+def make_ballast(size):
+    """Returns about 'size' megabytes of small objects"""
+    # a 100-character string takes about 140 bytes
+    return ["%100d" % i for i in xrange(int(size * 2**20) // 140)]
+
+
+def make_pipeline(name):
+    ppl = calculator.Pipeline(name)
+    ppl.add_unit(calculator.Number(), 'n')
+    return ppl
+
+
+def wait_event(queue):
+    """Waits for an event of the pipeline, and returns the time after it
+    has been received"""
+    queue.get(True, 10)
+    return timeit.default_timer()
+
+
+def drain(queue):
+    """Removes the remaining events of a run"""
+    try:
+        while True:
+            queue.get(True, 0.2)
+    except Exception:
+        pass
+
+
+def time_fork(queue, repeat):
+    ppl = make_pipeline('fork')
+    ppl.logger.addHandler(QueueHandler(queue))
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        p = mp.Process(target=tools.run_pipeline, args=(ppl,))
+        p.start()
+        times.append(wait_event(queue) - start)
+        p.join()
+        drain(queue)
+    return times
+
+
+def time_pool(pool, queue, repeat):
+    ppl = make_pipeline('pool')
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        worker = pool.submit(ppl)
+        times.append(wait_event(queue) - start)
+        drain(queue)
+        pool.release(worker)
+    return times
+
+
+def start_forked_worker(queue):
+    """Starts a worker the way the pool did before the zygote: by forking
+    the server"""
+    tasks = mp.Queue()
+    p = mp.Process(target=tools.pool_worker_main,
+            args=(tasks, mp.Queue(), queue))
+    p.start()
+    return p, tasks
+
+
+def run_suite(ballast, benchmarks, repeat=5):
+    """
+    Runs the benchmarks
+
+    Returns
+    -------
+    report : dict
+        {'created', 'python', 'platform', 'revision', 'results'}
+    """
+
+    queue = mp.Queue()
+    pool = tools.WorkerPool(queue, size=1, max_runs=None)
+    heap = make_ballast(ballast)
+
+    results = []
+
+    def record(name, times, **extra):
+        res = {
+                'benchmark': name,
+                'ballast_mb': ballast,
+                'times': times,
+                'best': min(times),
+                }
+        res.update(extra)
+        sys.stderr.write("%-8s %-8s %6.0f MB %10.6fs\n" % (name,
+            extra.get('mode', ''), ballast, res['best']))
+        results.append(res)
+
+    try:
+        if 'fork' in benchmarks:
+            record('fork', time_fork(queue, repeat))
+
+        if 'pool' in benchmarks:
+            record('pool', time_pool(pool, queue, repeat))
+
+        if 'replace' in benchmarks:
+            zygote = pool._zygote
+
+            def start_zygote():
+                worker = tools.PoolWorker(zygote)
+                worker.stop()
+                return worker
+
+            times, _ = timed(start_zygote, repeat=repeat)
+            record('replace', times, mode='zygote')
+
+            workers = []
+            times, _ = timed(lambda: workers.append(
+                start_forked_worker(queue)), repeat=repeat)
+            record('replace', times, mode='server')
+            for p, tasks in workers:
+                tasks.put(None)
+                p.join()
+    finally:
+        pool.shutdown()
+        del heap
+
+    return {
+            'created': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'revision': get_revision(),
+            'results': results,
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of starting "
+            "pipeline runs in a large server process")
+    parser.add_argument('--ballast', type=float, default=300,
+            help="size of the server's heap in megabytes (default: "
+            "%(default)s)")
+    parser.add_argument('--benchmarks', default=",".join(BENCHMARKS),
+            help="comma-separated benchmarks (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5,
+            help="number of measurements of each benchmark (default: "
+            "%(default)s)")
+    parser.add_argument('-o', '--output',
+            help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # pipelines only log INFO messages and above
+    logging.getLogger('backend').setLevel(logging.INFO)
+
+    report = run_suite(args.ballast, [name for name in
+        args.benchmarks.split(",") if name], args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Generators of synthetic pipelines for the simple graph engine benchmarks.
+
+Every pipeline consists of a source unit (no inputs, one output) and binary
+units (two inputs, one output), built either from the 'calculator' backend
+units (Number and Add), or from the no-op units defined here. The shapes are:
+
+    chain    a line of units, each connected to the previous one
+    diamond  a line of diamonds: a unit fans out to two units, which are
+             joined by the next one
+    fan      the source fanned out to 'size' / 2 units, which are reduced to
+             a single sink by a binary tree
+    random   a random DAG: every unit is connected to two randomly chosen
+             units preceding it
+"""
+
+import random
+
+from earlpipeline.backends import calculator
+from earlpipeline.backends.base_simple_engine import Pipeline, Unit, InPort, \
+        OutPort, Parameter
+
+
+class Source(Unit):
+    """Outputs its parameter"""
+    out = OutPort('out')
+    value = Parameter('value', 'input', float, 1.0, datatype='number')
+
+    # number of executions of 'run' in this process
+    runs = 0
+
+    def run(self):
+        Source.runs += 1
+        self.out = self.value
+
+
+class NoOp(Unit):
+    """Passes one of its inputs through"""
+    a = InPort('a')
+    b = InPort('b')
+    out = OutPort('out')
+
+    runs = 0
+
+    def run(self):
+        NoOp.runs += 1
+        self.b
+        self.out = self.a
+
+
+# (source class, its OutPort, binary class, its InPorts, its OutPort)
+KINDS = {
+        'noop': (Source, 'out', NoOp, ('a', 'b'), 'out'),
+        'calculator': (calculator.Number, 'out', calculator.Add,
+            ('num1', 'num2'), 'res'),
+        }
+
+SHAPES = ('chain', 'diamond', 'fan', 'random')
+
+
+def count_runs():
+    """Returns the total number of executions of the no-op units"""
+    return Source.runs + NoOp.runs
+
+
+def make_graph(shape, size, seed=0):
+    """
+    Generates the structure of a pipeline
+
+    Parameters
+    ----------
+    shape : str
+        one of 'SHAPES'
+    size : int
+        approximate number of units
+    seed : int, optional
+        seed of the 'random' shape
+
+    Returns
+    -------
+    edges : list
+        (src_unit, dest_unit, dest_input) tuples, where units are indices,
+        and dest_input is 0 or 1. The units are numbered in a topological
+        order. Unit 0 is the only source, the rest are binary units
+    """
+
+    size = max(size, 2)
+    edges = []
+
+    if shape == 'chain':
+        for i in range(1, size):
+            edges.append((i - 1, i, 0))
+            edges.append((i - 1, i, 1))
+
+    elif shape == 'diamond':
+        # 0 -> (1, 2) -> 3 -> (4, 5) -> 6 ...
+        n_diamonds = max((size - 1) // 3, 1)
+        for d in range(n_diamonds):
+            top = 3 * d
+            for side in (top + 1, top + 2):
+                edges.append((top, side, 0))
+                edges.append((top, side, 1))
+            edges.append((top + 1, top + 3, 0))
+            edges.append((top + 2, top + 3, 1))
+
+    elif shape == 'fan':
+        width = max(size // 2, 2)
+        level = range(1, width + 1)
+        for unit in level:
+            edges.append((0, unit, 0))
+            edges.append((0, unit, 1))
+        next_unit = width + 1
+        while len(level) > 1:
+            next_level = []
+            for i in range(0, len(level) - 1, 2):
+                edges.append((level[i], next_unit, 0))
+                edges.append((level[i + 1], next_unit, 1))
+                next_level.append(next_unit)
+                next_unit += 1
+            if len(level) % 2:
+                next_level.append(level[-1])
+            level = next_level
+
+    elif shape == 'random':
+        rng = random.Random(seed)
+        for unit in range(1, size):
+            for inp in (0, 1):
+                edges.append((rng.randrange(unit), unit, inp))
+
+    else:
+        raise ValueError("Unknown shape '%s'. Available shapes: %s"
+                % (shape, ", ".join(SHAPES)))
+
+    return edges
+
+
+def make_pipeline(shape, size, kind='noop', executor='serial',
+        max_workers=None, seed=0, connect=True):
+    """
+    Creates a pipeline of the given shape
+
+    Parameters
+    ----------
+    shape : str
+        one of 'SHAPES'
+    size : int
+        approximate number of units
+    kind : str, optional
+        'noop' or 'calculator' units
+    executor : str, optional
+        executor of the pipeline
+    max_workers : int, optional
+        number of the executor's workers
+    seed : int, optional
+        seed of the 'random' shape
+    connect : bool, optional
+        if False, the units are added, but not connected. The connections
+        can be made with 'connect_pipeline'
+
+    Returns
+    -------
+    ppl : Pipeline
+    edges : list
+        see 'make_graph'
+    """
+
+    source_cls, _, binary_cls, _, _ = KINDS[kind]
+    edges = make_graph(shape, size, seed)
+    n_units = max(dst for _, dst, _ in edges) + 1
+
+    ppl = Pipeline("%s_%s_%d" % (kind, shape, size), executor, max_workers)
+    for unit in range(n_units):
+        cls = unit == 0 and source_cls or binary_cls
+        ppl.add_unit(cls(), unit_name(unit))
+
+    if connect:
+        connect_pipeline(ppl, edges, kind)
+
+    return ppl, edges
+
+
+def connect_pipeline(ppl, edges, kind='noop'):
+    """Connects the units of a pipeline, created by 'make_pipeline' with
+    connect=False"""
+    _, source_out, _, binary_in, binary_out = KINDS[kind]
+    for src, dst, inp in edges:
+        src_port = src == 0 and source_out or binary_out
+        ppl.connect(unit_name(src), src_port, unit_name(dst), binary_in[inp])
+
+
+def unit_name(index):
+    return "u%d" % index
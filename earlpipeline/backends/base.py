@@ -9,15 +9,87 @@ equipping it with a simple engine
 from abc import ABCMeta, abstractmethod, abstractproperty
 import inspect
 import logging
+import sys
+import traceback
 from earlpipeline import tools
 
 ROOT_LOG_NAME = "backend"
 
+# Parameter descriptor
+class Parameter(object):
+    """Descriptor class for unit parameter. Is uses abstract methods
+    'get_parameter' and 'set_parameter' on the underlying unit instance for
+    getting/setting itself."""
+    def __init__(self, name, parameter_type, before_write,
+            default_value, after_read=None, **parameter_args):
+        """Initialize parameter.
+
+        Parameters
+        ----------
+        name: str
+            Name of the parameter
+        parameter_type: str
+            Type of the parameter. This field will be sent to the frontend to
+            render appropriate input field for this parameter
+        before_write: callable
+            Python callable, used to cast the string, returned by the
+            frontend, before writing it to python object
+        default_value: object
+            default value of the parameter
+        after_read: callable
+            Python callable, used to transform the python object read as a
+            property, before it is sent to the frontend as a string.
+        parameter_args: kwargs (value: JSON string)
+            Arguments to be passed to the front-end along with the parameter
+            type. These arguments are used by front-end to render the
+            appropriate input for this parameter. Refer to the frontend
+            documentation to see which types are supported and what arguments
+            do they require.
+        """
+
+        super(Parameter, self).__init__()
+        self.name = name
+        self.parameter_type = parameter_type
+        self.before_write = before_write
+        self.default_value = default_value
+        self.after_read = after_read
+        self.parameter_args = parameter_args
+        self.init_flag_attr = '_%s_initialized' % self.name
+
+    def __get__(self, obj, objtype):
+        # for inspection
+        if not obj:
+            return self
+
+        if not hasattr(obj, self.init_flag_attr):
+            setattr(obj, self.init_flag_attr, True)
+            obj.set_parameter(self.name, self.default_value)
+
+        return obj.get_parameter(self.name)
+
+    def __set__(self, obj, value):
+        if not hasattr(obj, self.init_flag_attr):
+            setattr(obj, self.init_flag_attr, True)
+        obj.set_parameter(self.name, value)
+
+
+class UnitMeta(ABCMeta):
+    """Metaclass of the units. Collects the 'Parameter' descriptors of the
+    unit class once, when the class is created, and exposes them as a
+    read-only '_parameters' map {parameter_name: descriptor}"""
+    def __init__(cls, name, bases, dct):
+        super(UnitMeta, cls).__init__(name, bases, dct)
+
+        isparameter = lambda p: issubclass(type(p), Parameter)
+        cls._parameters = tools.FrozenDict((p.name, p)
+                for _, p in inspect.getmembers(cls, isparameter))
+
+
 class GenericUnit(tools.Runnable):
     """
     An abstract base class for unit, a main building block 
     """
-    __metaclass__ = ABCMeta
+    __metaclass__ = UnitMeta
 
     # API specification
 
@@ -66,9 +138,7 @@ class GenericUnit(tools.Runnable):
     @property
     def parameters_info(self):
         parameters = {}
-        cls = self.__class__
-        isparameter = lambda p: issubclass(type(p), Parameter)
-        for name, p in inspect.getmembers(cls, isparameter):
+        for p in self._parameters.values():
             parameters[p.name] = {
                 'name': p.name,
                 'type': p.parameter_type,
@@ -80,6 +150,16 @@ class GenericUnit(tools.Runnable):
 
         return parameters
 
+    @classmethod
+    def get_parameter_descriptor(cls, name):
+        """Returns the 'Parameter' descriptor of this class by the parameter
+        name"""
+        try:
+            return cls._parameters[name]
+        except KeyError:
+            raise ValueError("Unit %s doesn't have a parameter named %s"
+                % (cls.__name__, name))
+
     @property
     def logger(self):
         """Logger instance for this unit.
@@ -170,6 +250,10 @@ class GenericPipeline(tools.Runnable):
 
     __metaclass__ = ABCMeta
 
+    # runs of the pipelines with higher priority are started first, when
+    # they are waiting in the PipelineManager's queue
+    priority = 0
+
     @abstractproperty
     def name(self):
         """Name of this pipeline instance"""
@@ -302,17 +386,21 @@ class GenericPipeline(tools.Runnable):
         msg = tools.EventTool.create_status_msg(self.status)
         self.logger.info(msg)
 
-    def to_dict(self):
+    def to_dict(self, include_log=False):
         """Returns a dict, conforming to the 'pipeline' model definition on the
         front-end (models.js)
+
+        Parameters
+        ----------
+        include_log : bool, optional
+            whether to include the log of the last run. The log may be long,
+            so by default it is only available from a separate endpoint
         
         Returns
         -------
         res : dict
             JSON-serializable version of this object"""
 
-        log = hasattr(self, "_log") and self._log or []
-
         res = {
                 'id': self.name,
                 'status': self.status,
@@ -320,11 +408,145 @@ class GenericPipeline(tools.Runnable):
                         'nodes': '/api/pipelines/'+self.name+'/units',
                         'edges': '/api/pipelines/'+self.name+'/edges',
                     },
-                'log': log
                 }
 
+        if include_log:
+            res['log'] = list(getattr(self, "_log", []))
+
         return res
 
+    def apply_batch(self, operations):
+        """
+        Applies several graph modifications atomically: if any of them fails,
+        or the resulting pipeline is not valid, all the already applied ones
+        are reverted and the error is re-raised. A revert, which fails, is
+        logged, and the rest are still reverted. Each operation is a dict with
+        the 'op' field, and the following arguments:
+
+        - 'add_unit': 'unit' (GenericUnit instance), 'name'
+        - 'remove_unit': 'name'
+        - 'connect', 'disconnect': 'src', 'srcPort', 'dst', 'dstPort'
+        - 'set_parameter': 'unit' (unit name), 'name', 'value'
+        - 'set_position': 'unit' (unit name), 'top', 'left'
+
+        Backends may defer expensive validation until the end of the batch by
+        overloading 'validate_batch'.
+
+        Parameters
+        ----------
+        operations : list of dict
+            operations to apply, in order
+
+        Returns
+        -------
+        results : list of dict
+            JSON-serializable result of each operation: the added edge for
+            'connect', the affected unit for 'add_unit', 'set_parameter' and
+            'set_position', and an empty dict otherwise
+        """
+
+        self.check_batch_names(operations)
+
+        undo = []
+        results = []
+        try:
+            for operation in operations:
+                result, revert = self._apply_operation(dict(operation))
+                undo.append(revert)
+                results.append(result)
+
+            self.validate_batch()
+        except:
+            # the reverts may replace the exception being handled
+            exc_info = sys.exc_info()
+            for revert in reversed(undo):
+                try:
+                    revert()
+                except Exception:
+                    self.logger.error("Can't revert an operation of the "
+                            "failed batch:\n%s" % traceback.format_exc())
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        return results
+
+    def check_batch_names(self, operations):
+        """Raises a ValueError, if the batch adds a unit under a name, which
+        is taken at that point. Called before anything is applied, so that
+        reverting a failed batch never removes an existing unit"""
+        names = set(unit.name for unit in self.units)
+        for operation in operations:
+            op = operation.get('op')
+            if op == 'add_unit':
+                name = operation['name']
+                if name in names:
+                    raise ValueError("Unit '%s' already exists" % name)
+                names.add(name)
+            elif op == 'remove_unit':
+                names.discard(operation['name'])
+
+    def validate_batch(self):
+        """Called by 'apply_batch' after all operations have been applied.
+        Should raise an exception, if the pipeline is not valid."""
+        pass
+
+    def _apply_operation(self, operation):
+        """Applies one operation of the batch. Returns its result and a
+        callable, which reverts it"""
+
+        op = operation.pop('op', None)
+
+        if op == 'add_unit':
+            unit, name = operation['unit'], operation['name']
+            self.add_unit(unit, name)
+            return unit.to_dict(), lambda: self.remove_unit(name)
+
+        elif op == 'remove_unit':
+            name = operation['name']
+            unit = self.get_unit(name)
+            edges = [edge for edge in self.edges
+                    if edge.src == name or edge.dst == name]
+            self.remove_unit(name)
+
+            def revert():
+                self.add_unit(unit, name)
+                for edge in edges:
+                    self.connect(edge.src, edge.srcPort, edge.dst, edge.dstPort)
+
+            return {}, revert
+
+        elif op == 'connect':
+            args = (operation['src'], operation['srcPort'],
+                    operation['dst'], operation['dstPort'])
+            edge = self.connect(*args)
+            return edge.to_dict(), lambda: self.disconnect(*args)
+
+        elif op == 'disconnect':
+            args = (operation['src'], operation['srcPort'],
+                    operation['dst'], operation['dstPort'])
+            self.disconnect(*args)
+            return {}, lambda: self.connect(*args)
+
+        elif op == 'set_parameter':
+            unit = self.get_unit(operation['unit'])
+            name = operation['name']
+            old_value = unit.parameters_info[name]['value']
+            unit.set_parameter(name, operation['value'])
+            return unit.to_dict(), lambda: unit.set_parameter(name, old_value)
+
+        elif op == 'set_position':
+            unit = self.get_unit(operation['unit'])
+            old_position = (getattr(unit, 'top', None),
+                    getattr(unit, 'left', None))
+            unit.top, unit.left = operation['top'], operation['left']
+
+            def revert():
+                unit.top, unit.left = old_position
+
+            return unit.to_dict(), revert
+
+        else:
+            raise ValueError("Unknown batch operation: %s" % op)
+
 
 # Edge object
 class Edge(object):
@@ -359,61 +581,3 @@ class Edge(object):
                 }
 
         return res
-
-
-# Parameter descriptor
-class Parameter(object):
-    """Descriptor class for unit parameter. Is uses abstract methods
-    'get_parameter' and 'set_parameter' on the underlying unit instance for
-    getting/setting itself."""
-    def __init__(self, name, parameter_type, before_write,
-            default_value, after_read=None, **parameter_args):
-        """Initialize parameter.
-
-        Parameters
-        ----------
-        name: str
-            Name of the parameter
-        parameter_type: str
-            Type of the parameter. This field will be sent to the frontend to
-            render appropriate input field for this parameter
-        before_write: callable
-            Python callable, used to cast the string, returned by the
-            frontend, before writing it to python object
-        default_value: object
-            default value of the parameter
-        after_read: callable
-            Python callable, used to transform the python object read as a
-            property, before it is sent to the frontend as a string.
-        parameter_args: kwargs (value: JSON string)
-            Arguments to be passed to the front-end along with the parameter
-            type. These arguments are used by front-end to render the
-            appropriate input for this parameter. Refer to the frontend
-            documentation to see which types are supported and what arguments
-            do they require.
-        """
-
-        super(Parameter, self).__init__()
-        self.name = name
-        self.parameter_type = parameter_type
-        self.before_write = before_write
-        self.default_value = default_value
-        self.after_read = after_read
-        self.parameter_args = parameter_args
-        self.init_flag_attr = '_%s_initialized' % self.name
-
-    def __get__(self, obj, objtype):
-        # for inspection
-        if not obj:
-            return self
-
-        if not hasattr(obj, self.init_flag_attr):
-            setattr(obj, self.init_flag_attr, True)
-            obj.set_parameter(self.name, self.default_value)
-
-        return obj.get_parameter(self.name)
-
-    def __set__(self, obj, value):
-        if not hasattr(obj, self.init_flag_attr):
-            setattr(obj, self.init_flag_attr, True)
-        obj.set_parameter(self.name, value)
@@ -9,10 +9,21 @@ and graph management systems. Otherwise, one should implement 'GenericUnit' and
 """
 
 from earlpipeline.backends.base import GenericUnit, GenericPipeline, Edge, Parameter
+from earlpipeline.backends import base
 from abc import ABCMeta, abstractmethod
 from bidict import namedbidict
+from collections import deque
 import inspect
+import itertools
+import pickle
 from earlpipeline import tools
+from earlpipeline.backends.executors import get_executor
+from earlpipeline.backends.result_cache import ResultCache
+from earlpipeline.backends import storage
+from earlpipeline.backends import sweep
+from earlpipeline.backends.profiling import Measurement
+from earlpipeline.backends.coroutines import is_coroutine_function, \
+        run_coroutine
 
 UnitMap = namedbidict('UnitMap', 'by_name', 'by_instance')
 
@@ -94,16 +105,224 @@ class InPort(Port):
         if obj is None:
             return self
 
+        # data, passed forward by the pipeline scheduler
+        if obj._inputs.has_key(self.name):
+            return obj._inputs[self.name]
+
+        # otherwise, pull it from the connected unit
         ppl = obj.pipeline
         name = obj.get_name()
         src_unit, src_port = ppl.get_source(name, self.name)
-        return ppl.get_unit(src_unit).read_port(src_port)
+        data = ppl.get_unit(src_unit).read_port(src_port)
+        return self.convert(data, ppl.count_readers(src_unit, src_port))
     
     def __set__(self, obj, value):
         raise IOError("'InPort' descriptors are not writable. Use\
                 'Pipeline.connect' to direct data from the OutPort to this\
                 port")
 
+    def convert(self, data, n_readers=1):
+        """
+        Converts the data, exposed by the connected OutPort, to the form this
+        port provides. A 'Stream' is collected into a single value.
+
+        Parameters
+        ----------
+        data : object
+            content of the connected OutPort
+        n_readers : int, optional
+            number of InPorts, connected to the same OutPort
+
+        Returns
+        -------
+        data : object
+        """
+
+        if isinstance(data, Stream):
+            return data.read_all(n_readers)
+        return data
+
+
+def _iter_chunks(items, chunk_size):
+    """Groups the items into lists of at most 'chunk_size' items"""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Stream(object):
+    """
+    Data, which is produced and consumed chunk by chunk, so that it doesn't
+    have to fit into memory at once. Whatever is written to a
+    'StreamOutPort' is wrapped into a 'Stream'.
+
+    The chunks are produced lazily, while the connected units are reading
+    them. Thus, the errors of the producing unit are raised in the units
+    reading the stream.
+
+    Parameters
+    ----------
+    source : iterable or callable
+        chunks of data. A callable (e.g. a generator function) is called
+        without arguments every time the stream is opened, so each reader
+        gets a fresh iterator and only the current chunk is kept in memory.
+        The same holds for iterables, which can be iterated several times
+        (e.g. lists). One-shot iterators (e.g. generator objects) are shared
+        by the readers using 'itertools.tee', which keeps the chunks, not
+        yet consumed by all the readers, in memory.
+    chunk_size : int, optional
+        if given, the items produced by the source are grouped into lists of
+        'chunk_size' items, which become the chunks of the stream
+    collect : callable, optional
+        function, which takes an iterator over the chunks and returns a
+        single value. Used to feed the stream to non-streaming InPorts. By
+        default, a list of the chunks is returned or, if 'chunk_size' is
+        given, a list of the items.
+    """
+
+    def __init__(self, source, chunk_size=None, collect=None):
+        super(Stream, self).__init__()
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("Invalid chunk size: %s" % chunk_size)
+
+        self.source = source
+        self.chunk_size = chunk_size
+        self.collect = collect
+        self._readers = None
+
+    def open(self, n_readers=1):
+        """
+        Starts reading the stream
+
+        Parameters
+        ----------
+        n_readers : int, optional
+            total number of readers of a one-shot stream. Has to be the same
+            for all of them
+
+        Returns
+        -------
+        chunks : iterator
+        """
+
+        if callable(self.source):
+            chunks = iter(self.source())
+        elif iter(self.source) is not self.source:
+            chunks = iter(self.source)
+        else:
+            # one-shot iterator, shared by the readers
+            if self._readers is None:
+                if n_readers > 1:
+                    self._readers = list(itertools.tee(self.source,
+                        n_readers))
+                else:
+                    self._readers = [self.source]
+            if not self._readers:
+                raise IOError("The stream has already been read")
+            chunks = self._readers.pop()
+
+        if self.chunk_size:
+            chunks = _iter_chunks(chunks, self.chunk_size)
+        return chunks
+
+    def read_all(self, n_readers=1):
+        """Reads the whole stream and collects it into a single value (see
+        'collect')"""
+
+        chunks = self.open(n_readers)
+        if self.collect is not None:
+            return self.collect(chunks)
+        if self.chunk_size:
+            return list(itertools.chain.from_iterable(chunks))
+        return list(chunks)
+
+
+class StreamOutPort(OutPort):
+    """
+    An OutPort, which exposes data as a 'Stream' of chunks. The unit writes
+    an iterable of chunks (e.g. a generator), a callable returning such an
+    iterable (e.g. a generator function), or a 'Stream' instance to it.
+
+    Units with StreamOutPorts are always 'volatile', because streams are
+    produced lazily and are not retained between the runs, nor cached.
+
+    Parameters
+    ----------
+    name : str
+        name of the port, to be used from the outside
+    chunk_size : int, optional
+        if given, the items written by the unit are grouped into chunks of
+        this size. Overridden by the 'chunk_size' of a written 'Stream'
+    collect : callable, optional
+        default 'collect' function of the written streams (see 'Stream')
+    """
+
+    def __init__(self, name, chunk_size=None, collect=None):
+        super(StreamOutPort, self).__init__(name)
+        self.chunk_size = chunk_size
+        self.collect = collect
+
+    def __set__(self, obj, value):
+        if isinstance(value, Stream):
+            if value.chunk_size is None:
+                value.chunk_size = self.chunk_size
+            if value.collect is None:
+                value.collect = self.collect
+        else:
+            value = Stream(value, self.chunk_size, self.collect)
+
+        obj._output[self.name] = value
+
+
+class StreamInPort(InPort):
+    """
+    An InPort, which provides an iterator over the chunks of the connected
+    'StreamOutPort'. If an ordinary OutPort is connected, its content is
+    provided as a single chunk.
+    """
+
+    def convert(self, data, n_readers=1):
+        if isinstance(data, Stream):
+            return data.open(n_readers)
+        return iter([data])
+
+
+class UnitMeta(base.UnitMeta):
+    """Metaclass of the simple engine units. In addition to the parameters,
+    collects the 'Port' descriptors of the unit class once, when the class is
+    created. They are exposed as read-only maps '_ports' {port_name:
+    descriptor} and '_ports_dict' {port_name: port_type_name}, lists
+    '_in_ports' and '_out_ports' of port names, the '_streaming' flag,
+    which is set if the unit has streaming ports, and the '_async' flag, set
+    if its 'run' method is a coroutine (see 'Unit.coroutine')"""
+    def __init__(cls, name, bases, dct):
+        super(UnitMeta, cls).__init__(name, bases, dct)
+
+        isport = lambda p: issubclass(type(p), Port)
+        ports = dict((p.name, p) for _, p in inspect.getmembers(cls, isport))
+
+        cls._ports = tools.FrozenDict(ports)
+        cls._ports_dict = tools.FrozenDict((name, p.__class__.__name__)
+                for name, p in ports.items())
+        cls._in_ports = [name for name, p in ports.items()
+                if isinstance(p, InPort)]
+        cls._out_ports = [name for name, p in ports.items()
+                if isinstance(p, OutPort)]
+
+        # streams are read while the consuming units run, so the units on
+        # both sides of a stream have to run in the same process
+        cls._streaming = any(isinstance(p, (StreamInPort, StreamOutPort))
+                for p in ports.values())
+        if any(isinstance(p, StreamOutPort) for p in ports.values()):
+            cls.volatile = True
+
+        # coroutines are driven by an IOLoop (see 'coroutines.py')
+        cls._async = cls.coroutine or is_coroutine_function(cls.run)
+
+
 # TODO: think on the implementation of Unit's settings
 class Unit(GenericUnit):
     """
@@ -112,6 +331,8 @@ class Unit(GenericUnit):
     Unit implements most of the GenericUnit API, so that the user only has to
     implement the 'update' method of the unit
     """
+    __metaclass__ = UnitMeta
+
     # API implementation
 
     @property
@@ -120,13 +341,11 @@ class Unit(GenericUnit):
 
     @classmethod
     def get_in_ports(cls):
-        return [name for name, t in cls.get_ports_dict().items()
-                if t == "InPort"]
+        return list(cls._in_ports)
 
     @classmethod
     def get_out_ports(cls):
-        return [name for name, t in cls.get_ports_dict().items()
-                if t == "OutPort"]
+        return list(cls._out_ports)
     
     def _get_pipeline(self):
         if self._pipeline:
@@ -148,10 +367,36 @@ class Unit(GenericUnit):
 
     # Main implementation
 
+    # Outputs of the units are retained between the runs, and only the units
+    # affected by changes are updated. Set this to True in the subclasses,
+    # which have side effects or produce non-deterministic results, to
+    # update them (and all units depending on them) on every run
+    volatile = False
+
+    # Set this to True in the subclasses, which implement 'run' as a plain
+    # generator coroutine, yielding Tornado futures (see 'coroutines.py').
+    # Decorated ('tornado.gen.coroutine') and 'async def' methods are
+    # recognized without it
+    coroutine = False
+
+    # generation of the pipeline run, which produced the content of '_output'.
+    # Kept at class level as well, so that units pickled before this field
+    # was introduced are treated as having no valid output
+    _output_generation = None
+
+    # incremented every time the unit becomes stale. Used to discard the
+    # outputs, computed from an outdated state of the unit
+    _version = 0
+
+    # content of the InPorts, passed forward by the pipeline scheduler
+    _inputs = {}
+
     def __init__(self):
         super(Unit, self).__init__()
         self._pipeline = None
         self._output = {}
+        self._output_generation = None
+        self._inputs = {}
 
     def get_name(self):
         """
@@ -171,6 +416,10 @@ class Unit(GenericUnit):
         created. The implementation should ONLY use the information from the
         available 'InPort's and write ONLY to the available 'OutPort's. The
         implementation should return nothing.
+
+        I/O-bound units may implement it as a coroutine instead (see
+        'coroutines.py' and 'coroutine'), so that the 'async' executor can
+        run them concurrently.
         """
         pass
 
@@ -178,16 +427,72 @@ class Unit(GenericUnit):
         """Wrapper of the user-defined 'run' method, doing all necessary
         actions, e.g. setting running status for this unit"""
         self.status = tools.Status.RUNNING
+        self.clear_output()
+        measurement = Measurement()
         try:
-            self.run()
+            if self._async:
+                run_coroutine(self.run)
+            else:
+                self.run()
         except:
+            self.log_profile(measurement.finish(failed=True))
             self.status = tools.Status.FAILED
             # Propagate the error. Traceback message will be sent by the
             # pipeline
             raise
         else:
+            self.log_profile(measurement.finish(self._output))
+            self._output_generation = self.pipeline.generation
             self.status = tools.Status.FINISHED
 
+    def log_profile(self, stats):
+        """Sends the execution statistics of the unit (see 'profiling.py') to
+        the front-end"""
+        self.logger.info(tools.EventTool.create_profile_msg(stats))
+
+    def clear_output(self):
+        """Drops the content of the OutPorts, so that the unit is updated on
+        the next read"""
+        self._output = {}
+        self._output_generation = None
+
+    def mark_stale(self):
+        """Drops the retained output of this unit, because the unit itself or
+        something it depends on has changed"""
+        self.clear_output()
+        self._version += 1
+
+    def invalidate(self):
+        """Marks this unit, and all units which depend on it, as stale, if the
+        unit is in the pipeline"""
+        if self._pipeline is not None:
+            self._pipeline.invalidate(self.get_name())
+        else:
+            self.mark_stale()
+
+    def is_output_valid(self):
+        """Checks whether the content of the OutPorts can be used without
+        updating the unit, i.e. whether it was produced during the current
+        run of the pipeline, or retained from a previous one and nothing has
+        changed since then"""
+        if self._output_generation is None:
+            return False
+
+        if self._output_generation == self.pipeline.generation:
+            return True
+
+        return not self.volatile
+
+    def __getstate__(self):
+        state = super(Unit, self).__getstate__()
+
+        # outputs are retained in memory only
+        state['_output'] = {}
+        state['_output_generation'] = None
+        state['_inputs'] = {}
+
+        return state
+
     def read_port(self, name):
         """
         Read the data form OutPort. This method should be used from the outside
@@ -205,11 +510,10 @@ class Unit(GenericUnit):
 
         self.assert_has_port(name, OutPort)
 
-        # TODO: return caching back, and make it smart
-        #if self._output.has_key(name):
-            #return self._output[name]
-        #else:
-        self.update()
+        # every unit is updated at most once per pipeline run
+        if not self.is_output_valid():
+            self.update()
+
         try:
             return self._output[name]
         except:
@@ -220,7 +524,8 @@ class Unit(GenericUnit):
     def get_ports_dict(cls):
         """
         Returns a dictionary of all available ports in the form {port_name,
-        port_type}
+        port_type}. The dictionary is computed once per class and is
+        read-only.
 
         Returns
         -------
@@ -228,12 +533,7 @@ class Unit(GenericUnit):
             {port_name, port_type}
         """
 
-        ports = {}
-        isport = lambda p: issubclass(type(p), Port)
-        for name, p in inspect.getmembers(cls, isport):
-            ports[p.name] = p.__class__.__name__
-        
-        return ports
+        return cls._ports_dict
 
     @classmethod
     def assert_has_port(cls, name, port_type=None):
@@ -248,9 +548,9 @@ class Unit(GenericUnit):
             Additionally checks if the port has proper type
         """
 
-        pts = cls.get_ports_dict()
-        if pts.has_key(name):
-            if not port_type or port_type.__name__ == pts[name]:
+        ports = cls._ports
+        if ports.has_key(name):
+            if not port_type or isinstance(ports[name], port_type):
                     return True
 
         raise ValueError("Unit %s doesn't have an OutPort named %s"
@@ -260,7 +560,23 @@ class Unit(GenericUnit):
         return getattr(self, "__" + name)
 
     def set_parameter(self, name, value):
-        setattr(self, "__" + name, value)
+        attr = "__" + name
+        if hasattr(self, attr):
+            old_value = getattr(self, attr)
+        else:
+            # not initialized yet, i.e. has the default value
+            old_value = self.get_parameter_descriptor(name).default_value
+
+        setattr(self, attr, value)
+
+        # retained outputs are only outdated if the value has really changed
+        try:
+            changed = bool(old_value != value)
+        except Exception:
+            changed = True
+
+        if changed:
+            self.invalidate()
 
 
 class ProcessingUnit(Unit):
@@ -286,6 +602,7 @@ class Connections(object):
         self._connections = {}
         self._units = UnitMap()
         self.path_delimiter = '.'
+        self._rebuild_indices()
 
     # Implements necessary abstract properties
     @property
@@ -294,17 +611,131 @@ class Connections(object):
 
     @property
     def edges(self):
-        edges = []
-        for dst_path, src_path in self._connections.items():
-            edges.append(self.edge_from_path(src_path, dst_path))
-
-        return edges
+        return self._edges.values()
 
     def edge_from_path(self, src_path, dst_path):
         src, src_port = self.split_path(src_path)
         dst, dst_port = self.split_path(dst_path)
         return Edge(src, src_port, dst, dst_port)
 
+    # set during 'apply_batch', to check for cycles only once, at the end
+    _defer_cycle_check = False
+
+    # attributes holding the graph indices, derived from '_units' and
+    # '_connections'. They are maintained incrementally, and are not pickled
+    _index_attrs = ('_edges', '_in_edges', '_out_edges', '_successors',
+            '_predecessors', '_init_nodes', '_term_nodes')
+
+    def _rebuild_indices(self):
+        """Builds the graph indices from scratch"""
+
+        # {dest_path: Edge}
+        self._edges = {}
+        # {unit_name: {dest_path: Edge}} of incoming and outgoing connections
+        self._in_edges = {}
+        self._out_edges = {}
+        # {unit_name: {unit_name: number of port connections}}
+        self._successors = {}
+        self._predecessors = {}
+        # units without incoming/outgoing connections
+        self._init_nodes = set()
+        self._term_nodes = set()
+
+        for unit_name in self._units.by_name:
+            self._index_unit(unit_name)
+
+        for dest_path, src_path in self._connections.items():
+            self._index_connection(src_path, dest_path)
+
+    def _index_unit(self, unit_name):
+        for index in (self._in_edges, self._out_edges, self._successors,
+                self._predecessors):
+            index.setdefault(unit_name, {})
+
+        if not self._predecessors[unit_name]:
+            self._init_nodes.add(unit_name)
+        if not self._successors[unit_name]:
+            self._term_nodes.add(unit_name)
+
+    def _unindex_unit(self, unit_name):
+        for index in (self._in_edges, self._out_edges, self._successors,
+                self._predecessors):
+            del index[unit_name]
+
+        self._init_nodes.discard(unit_name)
+        self._term_nodes.discard(unit_name)
+
+    def _index_connection(self, src_path, dest_path):
+        edge = self.edge_from_path(src_path, dest_path)
+        src, dest = edge.src, edge.dst
+
+        self._edges[dest_path] = edge
+        self._out_edges[src][dest_path] = edge
+        self._in_edges[dest][dest_path] = edge
+
+        successors = self._successors[src]
+        successors[dest] = successors.get(dest, 0) + 1
+        predecessors = self._predecessors[dest]
+        predecessors[src] = predecessors.get(src, 0) + 1
+
+        self._term_nodes.discard(src)
+        self._init_nodes.discard(dest)
+
+    def _unindex_connection(self, dest_path):
+        edge = self._edges.pop(dest_path)
+        src, dest = edge.src, edge.dst
+
+        del self._out_edges[src][dest_path]
+        del self._in_edges[dest][dest_path]
+
+        successors = self._successors[src]
+        successors[dest] -= 1
+        if not successors[dest]:
+            del successors[dest]
+            if not successors:
+                self._term_nodes.add(src)
+
+        predecessors = self._predecessors[dest]
+        predecessors[src] -= 1
+        if not predecessors[src]:
+            del predecessors[src]
+            if not predecessors:
+                self._init_nodes.add(dest)
+
+    def is_reachable(self, src_name, dest_name):
+        """
+        Checks whether 'dest_name' unit depends on 'src_name' unit, i.e. can
+        be reached from it following the connections. Only the part of the
+        graph downstream of 'src_name' is visited.
+
+        Parameters
+        ----------
+        src_name : str
+            name of the unit to start from
+        dest_name : str
+            name of the unit to look for
+
+        Returns
+        -------
+        reachable : bool
+            True, if the units are the same or connected by a path
+        """
+
+        if src_name == dest_name:
+            return True
+
+        visited = set([src_name])
+        stack = [src_name]
+        while stack:
+            for child in self._successors[stack.pop()]:
+                if child == dest_name:
+                    return True
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+        return False
+
     # TODO: do not overwrite if the unit with conflicting name is added,
     # raise exception.
     # TODO: implement naming resolution, in general
@@ -321,8 +752,12 @@ class Connections(object):
         """
         
         if isinstance(unit, Unit):
+            if unit_name in self._units.by_name:
+                raise ValueError("Unit '%s' already exists in the pipeline "
+                        "'%s'" % (unit_name, self.name))
             unit.pipeline = self
             self._units.by_name[unit_name] = unit
+            self._index_unit(unit_name)
         else:
             raise TypeError("Only instances of 'Unit' or its subclasses can "
                     "be added; got %s instead" % unit.__class__.__name__)
@@ -359,16 +794,47 @@ class Connections(object):
         # because an input port can have only one incoming connection, it's
         # convenient to use destination path as a key
         if not self._connections.has_key(dest_path):
-            self._connections[dest_path] = src_path
-            if not self.is_acyclic():
-                self.disconnect(src_name, src_port, dest_name, dest_port)
+            # the new connection closes a cycle, if the source unit already
+            # depends on the destination one
+            if not self._defer_cycle_check and \
+                    self.is_reachable(dest_name, src_name):
                 raise ValueError("Connection '%s --> %s' creates a cyclic" 
                         " dependency" % (src_path, dest_path))
+            self._connections[dest_path] = src_path
+            self._index_connection(src_path, dest_path)
+            self.invalidate(dest_name)
         else:
             raise ValueError("Input port %s is already connected to some port (%s)"
                     % (dest_path, self._connections[dest_path]))
 
-        return self.edge_from_path(src_path, dest_path)
+        return self._edges[dest_path]
+
+    def set_connections(self, connections):
+        """
+        Replaces all connections at once. Unlike calling 'connect' for every
+        connection, the graph is checked for cycles only once
+
+        Parameters
+        ----------
+        connections : dict
+            {dest_path: src_path}
+        """
+
+        for dest_path, src_path in connections.items():
+            self.assert_valid_path(src_path, OutPort)
+            self.assert_valid_path(dest_path, InPort)
+
+        old_connections = self._connections
+        self._connections = dict(connections)
+        self._rebuild_indices()
+
+        if not self.is_acyclic():
+            self._connections = old_connections
+            self._rebuild_indices()
+            raise ValueError("Connections contain a cyclic dependency")
+
+        for unit in self.units:
+            unit.mark_stale()
 
     def assert_valid_path(self, path, port_type=None):
         """
@@ -421,38 +887,10 @@ class Connections(object):
         Checks whether the connections' graph is a Directed Acyclic Graph. A
         topological sorting algorithm is used.
         """
-        #import pdb; pdb.set_trace()
-
-        N, E = self.get_unit_graph()
-
-        # find initial nodes
-        init_nodes, _ = self.get_init_term_nodes()
-
-        def find_input_set(node):
-            I = set()
-            for c in E:
-                if c[0] == node:
-                    I.add(c[1])
-            return I
-
-        def find_output_set(node):
-            O = set()
-            for c in E:
-                if c[1] == node:
-                    O.add(c[0])
-            return O
-
-        # do topological sorting
-        L = set()
-        while len(init_nodes) > 0:
-            n = init_nodes.pop()
-            L.add(n)
-            for m in find_output_set(n):
-                E.remove((m, n))
-                if len(find_input_set(m)) == 0:
-                    init_nodes.add(m)
-
-        if len(E) > 0:
+
+        try:
+            self.get_execution_plan()
+        except ValueError:
             return False
         return True
 
@@ -471,11 +909,244 @@ class Connections(object):
 
         N = set(self._units.by_name.keys())
         E = set()
-        for dst, src in self._connections.items():
-            E.add((self.split_path(dst)[0], self.split_path(src)[0]))
+        for src, successors in self._successors.items():
+            for dst in successors:
+                E.add((dst, src))
         
         return N, E
 
+    def get_descendants(self, unit_name):
+        """
+        Get a set of units, which depend (directly or indirectly) on the
+        given unit
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        descendants : set of str
+            a set of unit names, not including 'unit_name' itself
+        """
+
+        self.assert_has_unit(unit_name)
+
+        descendants = set()
+        stack = [unit_name]
+        while stack:
+            for child in self._successors[stack.pop()]:
+                if child not in descendants:
+                    descendants.add(child)
+                    stack.append(child)
+
+        return descendants
+
+    def get_ancestors(self, unit_name):
+        """
+        Get a set of units, the given unit depends on (directly or
+        indirectly)
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        ancestors : set of str
+            a set of unit names, not including 'unit_name' itself
+        """
+
+        self.assert_has_unit(unit_name)
+
+        ancestors = set()
+        stack = [unit_name]
+        while stack:
+            for parent in self._predecessors[stack.pop()]:
+                if parent not in ancestors:
+                    ancestors.add(parent)
+                    stack.append(parent)
+
+        return ancestors
+
+    def invalidate(self, unit_name):
+        """
+        Marks the unit and all its descendants as stale, dropping their
+        retained outputs, so that they are updated on the next run
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        """
+
+        self.get_unit(unit_name).mark_stale()
+        for name in self.get_descendants(unit_name):
+            self.get_unit(name).mark_stale()
+
+    def get_execution_plan(self):
+        """
+        Get a topologically sorted list of units, i.e. such that every unit
+        comes after all the units it depends on. Kahn's algorithm is used, so
+        the cost is linear in the size of the graph.
+
+        Returns
+        -------
+        plan : list of str
+            unit names in the execution order
+        """
+
+        n_parents = dict((name, len(predecessors))
+                for name, predecessors in self._predecessors.items())
+
+        # sorting only makes the order reproducible
+        ready = deque(sorted(self._init_nodes))
+        plan = []
+        while ready:
+            node = ready.popleft()
+            plan.append(node)
+            for child in sorted(self._successors[node]):
+                n_parents[child] -= 1
+                if n_parents[child] == 0:
+                    ready.append(child)
+
+        if len(plan) != len(n_parents):
+            raise ValueError("Pipeline contains a cyclic dependency")
+
+        return plan
+
+    def get_parents(self, unit_name):
+        """
+        Get a set of units, connected to the InPorts of the given unit
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        parents : set of str
+            a set of unit names
+        """
+
+        self.assert_has_unit(unit_name)
+        return set(self._predecessors[unit_name])
+
+    def get_children(self, unit_name):
+        """
+        Get a set of units, connected to the OutPorts of the given unit
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        children : set of str
+            a set of unit names
+        """
+
+        self.assert_has_unit(unit_name)
+        return set(self._successors[unit_name])
+
+    def get_unit_edges(self, unit_name):
+        """
+        Get the connections of the given unit
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        in_edges : list of Edge
+            connections to the InPorts of the unit
+        out_edges : list of Edge
+            connections from the OutPorts of the unit
+        """
+
+        self.assert_has_unit(unit_name)
+        return self._in_edges[unit_name].values(), \
+                self._out_edges[unit_name].values()
+
+    def needs_update(self, unit_name):
+        """
+        Checks whether the unit has to be updated during the current run,
+        i.e. whether it has no valid output, or some of the units it depends
+        on have been updated during this run.
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        """
+
+        if not self.get_unit(unit_name).is_output_valid():
+            return True
+
+        for parent in self.get_parents(unit_name):
+            if self.get_unit(parent)._output_generation == self.generation:
+                return True
+
+        return False
+
+    def get_inputs(self, unit_name):
+        """
+        Collect the data, currently exposed by the OutPorts connected to the
+        given unit. Ports which are not connected, or connected to the ports
+        which were never written, are omitted. The data is converted by the
+        InPorts, e.g. streams are opened for reading.
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+
+        Returns
+        -------
+        inputs : dict
+            {in_port_name: data}
+        """
+
+        unit = self.get_unit(unit_name)
+        inputs = {}
+        for port in unit._in_ports:
+            dest_path = self.make_path(unit_name, port)
+            if self._connections.has_key(dest_path):
+                src_unit, src_port = self.split_path(
+                        self._connections[dest_path])
+                output = self.get_unit(src_unit)._output
+                if output.has_key(src_port):
+                    inputs[port] = unit._ports[port].convert(
+                            output[src_port],
+                            self.count_readers(src_unit, src_port))
+
+        return inputs
+
+    def count_readers(self, unit_name, port_name):
+        """
+        Counts the InPorts, connected to the given OutPort
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        port_name : str
+            name of the OutPort
+
+        Returns
+        -------
+        n_readers : int
+        """
+
+        return sum(1 for edge in self._out_edges[unit_name].values()
+                if edge.srcPort == port_name)
+
     def get_init_term_nodes(self):
         """Get sets of initial (no inputs) and terminal (no outputs) nodes
         
@@ -486,16 +1157,8 @@ class Connections(object):
         term_nodes: set of str
             a set of terminal nodes (unit names)
         """
-        N, E = self.get_unit_graph()
-
-        nodes_with_input = set([conn[0] for conn in E])
-        init_nodes = N - nodes_with_input
-
-        nodes_with_output = set([conn[1] for conn in E])
-        term_nodes = N - nodes_with_output
-
-
-        return init_nodes, term_nodes
+        # copies, because callers may modify them
+        return set(self._init_nodes), set(self._term_nodes)
 
     def disconnect(self, src_name, src_port, dest_name, dest_port):
         """
@@ -520,6 +1183,8 @@ class Connections(object):
             
         # make sure there is something to disconnect
         self.get_source(*self.split_path(dest_path))
+        self.invalidate(dest_name)
+        self._unindex_connection(dest_path)
         del self._connections[dest_path]
 
     # TODO: don't forget to clean the unit's pipeline property
@@ -534,15 +1199,17 @@ class Connections(object):
         """
         unit = self.get_unit(unit_name)
 
-        for dest_path, src_path in self._connections.items():
-            src_unit, src_port = self.split_path(src_path)
-            dest_unit, dest_port = self.split_path(dest_path)
+        # whatever depended on this unit is outdated now
+        self.invalidate(unit_name)
 
-            if src_unit == unit_name or dest_unit == unit_name:
-                self.disconnect(src_unit, src_port, dest_unit, dest_port)
+        edges = self._in_edges[unit_name].values() + \
+                self._out_edges[unit_name].values()
+        for edge in edges:
+            self.disconnect(edge.src, edge.srcPort, edge.dst, edge.dstPort)
 
         unit.pipeline = None
         del self._units.by_name[unit_name]
+        self._unindex_unit(unit_name)
 
     def get_source(self, dest_unit, dest_port):
         """
@@ -612,9 +1279,26 @@ class Pipeline(Connections, GenericPipeline):
     """Pipeline class extends 'Connections' to make sure that it contains units
     for reading and writing data, which outline the main data-flow in the
     system."""
-    def __init__(self, name='UnnamedPpl'):
+    # counter of the pipeline runs. Unit outputs are cached within one run
+    # only. Kept at class level for the pipelines pickled before this field
+    # was introduced
+    _generation = 0
+
+    # name of the executor, used to run the units (see 'executors.py'), and
+    # the maximal number of its workers. Class-level defaults are used by the
+    # pipelines pickled before these fields were introduced
+    executor = 'serial'
+    max_workers = None
+
+    # optional 'ResultCache' instance (see 'result_cache.py'), shared by all
+    # pipelines
+    result_cache = None
+
+    def __init__(self, name='UnnamedPpl', executor='serial', max_workers=None):
         self.name = name
+        self._generation = 0
         super(Pipeline, self).__init__()
+        self.set_executor(executor, max_workers)
 
     # required 'name' property
     def _get_name(self):
@@ -625,13 +1309,267 @@ class Pipeline(Connections, GenericPipeline):
 
     name = property(_get_name, _set_name)
 
-    def run(self):
-        """Calls 'update' methods on all terminal nodes. Terminal
-        nodes must take care of writing the results to disk, or
-        logging them"""
+    def save(self, fname):
+        """Writes the pipeline to a file in the compact JSON format (see
+        'storage.py')"""
+        storage.save(self, fname)
+
+    @classmethod
+    def load(cls, fname):
+        """Reads a pipeline, written by 'save' (or pickled)"""
+        return storage.load(cls, fname)
+
+    def dumps(self):
+        """Returns the content of the file, written by 'save'"""
+        return storage.dumps(self)
+
+    @classmethod
+    def loads(cls, data):
+        """Inverse of 'dumps'"""
+        return storage.loads(cls, data)
+
+    def __getstate__(self):
+        state = super(Pipeline, self).__getstate__()
+        for attr in self._index_attrs:
+            del state[attr]
+        return state
+
+    def __setstate__(self, state):
+        super(Pipeline, self).__setstate__(state)
+        self._rebuild_indices()
+
+    @property
+    def generation(self):
+        """Number of the current (or the last) run of this pipeline"""
+        return self._generation
+
+    def set_executor(self, executor, max_workers=None):
+        """
+        Selects the way units of this pipeline are executed
+
+        Parameters
+        ----------
+        executor : str
+            'serial' (default) updates units one by one, 'threads' and
+            'processes' run independent units concurrently in a pool of
+            threads or processes respectively. 'async' runs the coroutine
+            units concurrently on an IOLoop, and the rest in a pool of
+            threads
+        max_workers : int, optional
+            maximal number of units running at the same time (not counting
+            the coroutine units of the 'async' executor). Defaults to the
+            number of CPUs
+        """
+
+        # fails for unknown executors
+        get_executor(executor, max_workers)
+
+        self.executor = executor
+        self.max_workers = max_workers
+
+    def run(self, units=None):
+        """
+        Updates all units in the topological order, passing the outputs of
+        each unit forward to the units connected to it. Depending on the
+        selected executor, independent units may run concurrently. Terminal
+        nodes must take care of writing the results to disk, or logging them.
+        Each unit is updated at most once per run.
+
+        Parameters
+        ----------
+        units : iterable of str, optional
+            update only these units and the units they depend on
+        """
+
+        if units is not None:
+            units = set(units)
+            for unit_name in list(units):
+                units.update(self.get_ancestors(unit_name))
+
+        self._generation += 1
+
+        get_executor(self.executor, self.max_workers).execute(self, units)
+
+    def sweep(self, grid=None, variants=None, outputs=None, max_workers=None,
+            copy=True):
+        """Runs the pipeline for every combination of the parameter values
+        (see 'sweep.sweep')"""
+        return sweep.sweep(self, grid, variants, outputs, max_workers, copy)
+
+    def get_cache_key(self, unit_name, cache_keys):
+        """
+        Computes the result cache key of the unit, based on its class, its
+        parameter values and the keys of the units connected to it
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        cache_keys : dict
+            {unit_name: key} of the units, the given unit depends on
+
+        Returns
+        -------
+        key : str or None
+            None, if the unit can not be cached
+        """
+
+        unit = self.get_unit(unit_name)
+        if unit.volatile:
+            return None
+
+        inputs = []
+        for port in unit._in_ports:
+            dest_path = self.make_path(unit_name, port)
+            if self._connections.has_key(dest_path):
+                src_unit, src_port = self.split_path(
+                        self._connections[dest_path])
+                src_key = cache_keys.get(src_unit)
+                if src_key is None:
+                    return None
+                inputs.append((port, src_key, src_port))
+            else:
+                inputs.append((port, None, None))
+
+        parameters = [(name, info['value'])
+                for name, info in unit.parameters_info.items()]
+
+        return ResultCache.make_key(unit.__class__, parameters, inputs)
+
+    def reuse_output(self, unit_name, cache_keys):
+        """
+        Checks whether the unit can skip updating during the current run,
+        i.e. whether its retained output is still valid, or its output can be
+        loaded from the result cache (if enabled).
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        cache_keys : dict
+            {unit_name: key} of the units, the given unit depends on. The key
+            of the given unit is added to it
+
+        Returns
+        -------
+        reused : bool
+            True, if the unit has a valid output and doesn't need updating
+        """
+
+        if self.result_cache is not None:
+            cache_keys[unit_name] = self.get_cache_key(unit_name, cache_keys)
+
+        if not self.needs_update(unit_name):
+            return True
+
+        key = cache_keys.get(unit_name)
+        if key is None:
+            return False
+
+        try:
+            output = self.result_cache.get(key)
+        except KeyError:
+            return False
+
+        unit = self.get_unit(unit_name)
+        unit._output = output
+        unit._output_generation = self.generation
+        unit.logger.info("Output loaded from the result cache")
+        unit.status = tools.Status.FINISHED
+
+        return True
+
+    def store_output(self, unit_name, cache_keys):
+        """
+        Stores the output of a just updated unit in the result cache, if it
+        is enabled and the unit is cacheable
+
+        Parameters
+        ----------
+        unit_name : str
+            name of the unit
+        cache_keys : dict
+            {unit_name: key}, as filled by 'reuse_output'
+        """
+
+        key = cache_keys.get(unit_name)
+        if key is None:
+            return
+
+        unit = self.get_unit(unit_name)
+        try:
+            self.result_cache.put(key, unit._output)
+        except Exception as e:
+            unit.logger.warning("Output could not be cached: %s" % e)
+
+    def apply_batch(self, operations):
+        """Applies several graph modifications atomically (see
+        'GenericPipeline.apply_batch'). Acyclicity is checked once, after all
+        operations have been applied"""
+
+        self._defer_cycle_check = True
+        try:
+            return super(Pipeline, self).apply_batch(operations)
+        finally:
+            del self._defer_cycle_check
+
+    def validate_batch(self):
+        if not self.is_acyclic():
+            raise ValueError("The batch creates a cyclic dependency")
+
+    def export_outputs(self, retained=False):
+        """
+        Collects the outputs of the units, which were updated during the last
+        run, so that they can be retained by another copy of this pipeline
+        (pipelines are run in separate processes). Unpicklable outputs are
+        skipped, and the corresponding units will be updated on the next run.
+
+        Parameters
+        ----------
+        retained : bool, optional
+            export all retained outputs, e.g. to pass them to the process,
+            which is going to run the pipeline
+
+        Returns
+        -------
+        outputs : dict
+            a picklable object, to be passed to 'import_outputs'
+        """
+
+        units = {}
+        for unit in self.units:
+            if unit._output_generation == self.generation or (retained and
+                    unit.is_output_valid()):
+                try:
+                    output = pickle.dumps(unit._output, pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    continue
+                units[unit.name] = (unit._version, output)
+
+        return {'generation': self.generation, 'units': units}
+
+    def import_outputs(self, outputs):
+        """
+        Retains the outputs, exported by another copy of this pipeline with
+        'export_outputs'. Outputs of the units, which have changed since the
+        export, are discarded.
+
+        Parameters
+        ----------
+        outputs : dict
+            result of 'export_outputs'
+        """
+
+        generation = outputs['generation']
+        self._generation = max(self._generation, generation)
 
-        _, term_nodes = self.get_init_term_nodes()
+        for unit_name, (version, output) in outputs['units'].items():
+            try:
+                unit = self.get_unit(unit_name)
+            except ValueError:
+                # removed in the meantime
+                continue
 
-        for node_name in term_nodes:
-            unit = self.get_unit(node_name)
-            unit.update()
+            if unit._version == version:
+                unit._output = pickle.loads(output)
+                unit._output_generation = generation
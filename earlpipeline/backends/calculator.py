@@ -2,6 +2,7 @@
 # simple_graph_engine API
 
 from earlpipeline.backends.base_simple_engine import Pipeline, Unit, InPort, OutPort, Parameter
+from earlpipeline.backends.base_simple_engine import StreamInPort, StreamOutPort
 import time
 
 class Number(Unit):
@@ -61,8 +62,39 @@ class Delay(Unit):
         self.logger.info("waiting %s seconds" % self.delay_sec)
         time.sleep(self.delay_sec)
 
+class AsyncDelay(Unit):
+    inp = InPort('inp')
+    out = OutPort('out')
+    delay_sec = Parameter('delay_sec', 'dropdown', int, 3, items=[1, 2, 3, 4, 5])
+
+    # a coroutine: with the 'async' executor, several of these wait at the
+    # same time
+    coroutine = True
+
+    def run(self):
+        from tornado import gen
+        self.logger.info("waiting %s seconds" % self.delay_sec)
+        yield gen.sleep(self.delay_sec)
+        self.out = self.inp
+
+class Range(Unit):
+    out = StreamOutPort('out', chunk_size=1000)
+    count = Parameter('count', 'input', int, 10, datatype='number')
+
+    def run(self):
+        # produced lazily, 1000 numbers at a time
+        self.out = xrange(self.count)
+
+class Sum(Unit):
+    inp = StreamInPort('inp')
+    res = OutPort('res')
+
+    def run(self):
+        self.res = sum(sum(chunk) for chunk in self.inp)
+
 class ToLog(Unit):
     inp = InPort('inp')
+    volatile = True # print the result on every run
 
     def run(self):
         self.logger.info("Result: %s" % self.inp)
@@ -71,4 +103,5 @@ class ToLog(Unit):
 
 # method, returning types
 def get_unit_types():
-    return [Number, Add, Div, Mul, Pow, Failer, Delay, ToLog]
+    return [Number, Add, Div, Mul, Pow, Failer, Delay, AsyncDelay, Range, Sum,
+            ToLog]
@@ -0,0 +1,80 @@
+"""
+Support of the units with a coroutine 'run' method.
+
+I/O-bound units can implement 'run' as a coroutine, which has to be marked
+explicitly: a generator function decorated with 'tornado.gen.coroutine', a
+generator function of a unit class with 'coroutine = True', or an 'async def'
+method on Python 3. A plain generator 'run' is not a coroutine. Such a unit
+waits for its I/O by yielding Tornado futures, e.g.
+
+    class Fetch(Unit):
+        url = Parameter('url', 'input', str, '')
+        out = OutPort('out')
+
+        coroutine = True
+
+        def run(self):
+            from tornado.httpclient import AsyncHTTPClient
+            response = yield AsyncHTTPClient().fetch(self.url)
+            self.out = response.body
+
+With the 'async' executor (see 'executors.AsyncExecutor'), the ready
+coroutine units of a pipeline run concurrently on one IOLoop, while the
+ordinary units run in a pool of threads. The other executors run every
+coroutine to completion on an IOLoop of its own, one unit at a time.
+
+Tornado is only imported, when a coroutine is run.
+"""
+
+import inspect
+
+# 'async def' functions on Python 3
+_iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None)
+
+
+def is_coroutine_function(func):
+    """Checks whether the function (e.g. the 'run' method of a unit) is
+    marked as a coroutine, which has to be driven by an IOLoop: decorated
+    with 'tornado.gen.coroutine', or an 'async def' function. Generator
+    functions are only coroutines with the 'coroutine' flag of their unit"""
+    func = getattr(func, '__func__', func)
+    if getattr(func, '__tornado_coroutine__', False):
+        return True
+    return _iscoroutinefunction is not None and _iscoroutinefunction(func)
+
+
+def start_coroutine(func):
+    """
+    Calls a coroutine function on the current IOLoop
+
+    Parameters
+    ----------
+    func : callable
+        coroutine function without arguments, e.g. a bound 'run' method. A
+        generator function is run as a 'tornado.gen.coroutine'
+
+    Returns
+    -------
+    future : tornado.concurrent.Future
+        resolved, when the coroutine has finished
+    """
+
+    from tornado import gen
+
+    if not getattr(func, '__tornado_coroutine__', False) and \
+            inspect.isgeneratorfunction(func):
+        func = gen.coroutine(func)
+    return gen.convert_yielded(func())
+
+
+def run_coroutine(func):
+    """Runs a coroutine function to completion on a new IOLoop, and returns
+    its result. Exceptions of the coroutine are propagated"""
+    from tornado.ioloop import IOLoop
+
+    # the current IOLoop of the calling thread (if any) is left alone
+    io_loop = IOLoop(make_current=False)
+    try:
+        return io_loop.run_sync(lambda: start_coroutine(func))
+    finally:
+        io_loop.close()
@@ -0,0 +1,611 @@
+"""
+Executors for the simple graph engine.
+
+An executor takes a 'Pipeline' and runs all of its units, respecting the
+dependencies between them. 'SerialExecutor' updates the units one by one in
+the topological order, while 'ThreadExecutor' and 'ProcessExecutor' dispatch
+every unit to a pool of workers as soon as all of its inputs are available, so
+that independent branches of the graph are executed concurrently.
+'AsyncExecutor' does the same, but runs the units with a coroutine 'run'
+method concurrently on an IOLoop (see 'coroutines.py').
+
+Executors are selected per pipeline by name, using 'Pipeline.set_executor'.
+"""
+
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+from collections import deque
+import pickle
+import Queue
+import signal
+import threading
+import traceback
+
+from earlpipeline import tools
+from earlpipeline.backends.shared_memory import SharedSegment, \
+        export_output, attach_inputs
+from earlpipeline.backends.profiling import Measurement
+from earlpipeline.backends.coroutines import start_coroutine, run_coroutine
+
+
+class SerialExecutor(object):
+    """Updates units one after another, in the topological order"""
+    def __init__(self, max_workers=None):
+        super(SerialExecutor, self).__init__()
+        self.max_workers = 1
+
+    def execute(self, ppl, units=None):
+        """
+        Runs all units of the pipeline
+
+        Parameters
+        ----------
+        ppl : Pipeline
+            pipeline to run
+        units : set, optional
+            run only these units. Has to include all of their ancestors
+        """
+
+        cache_keys = {}
+        for unit_name in ppl.get_execution_plan():
+            if units is not None and unit_name not in units:
+                continue
+
+            if ppl.reuse_output(unit_name, cache_keys):
+                continue
+
+            unit = ppl.get_unit(unit_name)
+            unit._inputs = ppl.get_inputs(unit_name)
+            try:
+                unit.update()
+            finally:
+                unit._inputs = {}
+
+            ppl.store_output(unit_name, cache_keys)
+
+
+class PoolExecutor(object):
+    """
+    Base class for the executors, which dispatch ready units to a pool of
+    workers. The scheduling is done in the calling thread, which is also the
+    only one changing the units' status, so that status events are sent in
+    the same order as for the serial execution.
+
+    Units with streaming ports are run in the calling thread, because the
+    streams are produced lazily, while they are being read.
+
+    Subclasses have to implement 'create_pool' and 'dispatch'.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        maximal number of units running at the same time. Defaults to the
+        number of CPUs
+    """
+
+    # how often (in seconds) the scheduler wakes up while waiting for results.
+    # Waiting with a timeout keeps the scheduler thread responsive to signals
+    poll_interval = 0.1
+
+    def __init__(self, max_workers=None):
+        super(PoolExecutor, self).__init__()
+        self.max_workers = max_workers or mp.cpu_count()
+
+    def create_pool(self):
+        """Returns a new pool with 'apply_async' method"""
+        raise NotImplementedError()
+
+    def dispatch(self, pool, ppl, unit, inputs, callback):
+        """Submits the 'run' method of the unit to the pool. The callback has
+        to be called with the result of 'run_unit' (or a compatible one).
+        Returns the 'AsyncResult' of the task, if the pool may fail it
+        without calling the callback (e.g. when its arguments or result
+        can't be pickled), or None"""
+        raise NotImplementedError()
+
+    def on_unit_done(self, ppl, unit, output):
+        """Stores the output produced by the worker in the unit"""
+        unit._output = output
+
+    def on_inputs_read(self, ppl, unit_name):
+        """Called, when the unit has finished (or failed, or was skipped) and
+        doesn't need its inputs anymore"""
+        pass
+
+    def store_output(self, ppl, unit_name, cache_keys):
+        """Stores the output of the finished unit in the result cache"""
+        ppl.store_output(unit_name, cache_keys)
+
+    def cleanup(self, ppl):
+        """Called after the pool is terminated"""
+        pass
+
+    def execute(self, ppl, units=None):
+        """
+        Runs all units of the pipeline, dispatching them to the pool as soon
+        as all of their dependencies have finished.
+
+        Parameters
+        ----------
+        ppl : Pipeline
+            pipeline to run
+        units : set, optional
+            run only these units. Has to include all of their ancestors
+        """
+
+        if units is None:
+            units = [unit.name for unit in ppl.units]
+        n_parents = dict((name, len(ppl.get_parents(name))) for name in units)
+
+        ready = deque(sorted(n for n in n_parents if n_parents[n] == 0))
+        results = Queue.Queue()
+        # {unit_name: AsyncResult} of the dispatched units (see 'dispatch')
+        tasks = {}
+        cache_keys = {}
+        n_running = 0
+        n_done = 0
+        failure = None
+
+        def release(unit_name):
+            """marks the children of a finished unit as ready, once all of
+            their parents have finished"""
+            for child in sorted(ppl.get_children(unit_name)):
+                if not n_parents.has_key(child):
+                    continue
+                n_parents[child] -= 1
+                if n_parents[child] == 0:
+                    ready.append(child)
+
+        pool = self.create_pool()
+        try:
+            while ready or n_running:
+                # dispatch everything that is ready, unless something failed
+                while ready and not failure:
+                    unit_name = ready.popleft()
+
+                    # retained or cached output can be used as is
+                    if ppl.reuse_output(unit_name, cache_keys):
+                        self.on_inputs_read(ppl, unit_name)
+                        n_done += 1
+                        release(unit_name)
+                        continue
+
+                    unit = ppl.get_unit(unit_name)
+                    unit.status = tools.Status.RUNNING
+                    unit.clear_output()
+
+                    callback = lambda res, name=unit_name: \
+                            results.put((name, res))
+                    inputs = ppl.get_inputs(unit_name)
+                    if unit._streaming:
+                        # streams can't leave this process
+                        callback(run_unit(unit, inputs))
+                    else:
+                        task = self.dispatch(pool, ppl, unit, inputs,
+                                callback)
+                        if task is not None:
+                            tasks[unit_name] = task
+                    n_running += 1
+
+                if not n_running:
+                    break
+
+                # after a failure, the coroutines still running are
+                # abandoned (see 'EventLoopPool.terminate'), instead of
+                # waiting for them
+                if failure and hasattr(pool, 'abandon') and \
+                        pool.abandon(n_running):
+                    break
+
+                try:
+                    unit_name, (ok, payload, stats) = results.get(True,
+                            self.poll_interval)
+                except Queue.Empty:
+                    check_tasks(tasks, results)
+                    continue
+                tasks.pop(unit_name, None)
+
+                n_running -= 1
+                unit = ppl.get_unit(unit_name)
+                self.on_inputs_read(ppl, unit_name)
+                unit.log_profile(stats)
+
+                if not ok:
+                    unit.status = tools.Status.FAILED
+                    if not failure:
+                        failure = (unit_name, payload)
+                    continue
+
+                self.on_unit_done(ppl, unit, payload)
+                unit._output_generation = ppl.generation
+                unit.status = tools.Status.FINISHED
+                self.store_output(ppl, unit_name, cache_keys)
+                n_done += 1
+                release(unit_name)
+        finally:
+            pool.terminate()
+            pool.join()
+            self.cleanup(ppl)
+
+        if failure:
+            raise RuntimeError("Unit '%s' has failed:\n%s" % failure)
+
+        if n_done != len(n_parents):
+            raise ValueError("Pipeline contains a cyclic dependency")
+
+
+def check_tasks(tasks, results):
+    """Puts a failure into the results queue for every task, which the pool
+    has failed without calling its callback, and forgets the finished
+    tasks"""
+    for unit_name, task in tasks.items():
+        if not task.ready():
+            continue
+        del tasks[unit_name]
+        # the successful ones are already in the queue
+        if task.successful():
+            continue
+
+        measurement = Measurement()
+        try:
+            task.get()
+        except:
+            results.put((unit_name, (False, traceback.format_exc(),
+                measurement.finish(failed=True))))
+
+
+def run_unit(unit, inputs):
+    """Runs the unit with the given inputs. Returns a tuple (True, output,
+    stats) on success, or (False, traceback_string, stats) on failure, where
+    'stats' are the execution statistics (see 'profiling.py')"""
+    unit._inputs = inputs
+    measurement = Measurement()
+    try:
+        if unit._async:
+            run_coroutine(unit.run)
+        else:
+            unit.run()
+    except:
+        return False, traceback.format_exc(), measurement.finish(failed=True)
+    else:
+        return True, unit._output, measurement.finish(unit._output)
+    finally:
+        unit._inputs = {}
+
+
+class ThreadExecutor(PoolExecutor):
+    """Runs units in a pool of threads. Suitable for the units, which spend
+    most of their time outside of the interpreter (I/O, sleeping, native
+    extensions releasing the GIL)"""
+
+    def create_pool(self):
+        return ThreadPool(self.max_workers)
+
+    def dispatch(self, pool, ppl, unit, inputs, callback):
+        return pool.apply_async(run_unit, (unit, inputs), callback=callback)
+
+
+class UnitContext(object):
+    """
+    A stand-in for the pipeline of a unit, which is shipped to a worker
+    process. It provides the unit with its name and logger, without pickling
+    the whole pipeline.
+    """
+    def __init__(self, pipeline_name, unit_name):
+        super(UnitContext, self).__init__()
+        self.name = pipeline_name
+        self.unit_name = unit_name
+
+    def get_unit_name(self, unit):
+        return self.unit_name
+
+    def get_source(self, dest_unit, dest_port):
+        raise ValueError("No data was received by %s.%s"
+                % (dest_unit, dest_port))
+
+    def invalidate(self, unit_name):
+        pass
+
+
+def run_detached_unit(unit_cls, state, inputs, share_threshold=None,
+        share_folder=None):
+    """Restores a unit, shipped to a worker process, and runs it. Large
+    outputs are moved to shared memory, if 'share_threshold' is given"""
+    unit = unit_cls.__new__(unit_cls)
+    unit.__setstate__(state)
+    ok, payload, stats = run_unit(unit, attach_inputs(inputs))
+
+    if ok and share_threshold is not None:
+        try:
+            payload = export_output(payload, share_threshold, share_folder)
+        except Exception:
+            # fall back to pickling
+            pass
+
+    if ok:
+        # the output is pickled by the pool, which can't report the error
+        # as a failure of the unit
+        try:
+            pickle.loads(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        except:
+            return False, "Output can't be sent to the pipeline " \
+                    "process:\n%s" % traceback.format_exc(), stats
+
+    return ok, payload, stats
+
+
+def init_worker():
+    """Restores the default SIGTERM handling in a worker process, which
+    inherits the handler installed by 'ProcessExecutor.execute'"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class ProcessExecutor(PoolExecutor):
+    """Runs units in a pool of processes. The units, their inputs and
+    outputs have to be picklable. Log messages of the units are delivered
+    from the workers the same way as from the pipeline process itself.
+
+    Large outputs are passed between the workers through shared memory (see
+    'shared_memory.py'). A segment is mapped into the pipeline process
+    (copy-on-write) and removed, once all of the units connected to it have
+    finished."""
+
+    # outputs (NumPy arrays and strings) of at least this many bytes are
+    # passed through shared memory instead of being pickled. None disables
+    # the shared memory transport
+    share_threshold = 2**20
+
+    # folder for the shared memory segments. Defaults to '/dev/shm'
+    share_folder = None
+
+    def create_pool(self):
+        return mp.Pool(self.max_workers, init_worker)
+
+    def execute(self, ppl, units=None):
+        # {(unit_name, port_name): [segment, number of unfinished readers]}
+        self._segments = {}
+        # {unit_name: cache_keys} of the units, which have to be stored in
+        # the result cache, once their segments are loaded
+        self._pending_store = {}
+
+        # make sure, the workers are not left behind, if the pipeline process
+        # is terminated (e.g. stopped by the user)
+        def on_terminate(signum, frame):
+            raise SystemExit("Terminated")
+
+        try:
+            old_handler = signal.signal(signal.SIGTERM, on_terminate)
+        except ValueError:
+            # not in the main thread
+            old_handler = None
+
+        try:
+            super(ProcessExecutor, self).execute(ppl, units)
+        finally:
+            if old_handler is not None:
+                signal.signal(signal.SIGTERM, old_handler)
+
+    def dispatch(self, pool, ppl, unit, inputs, callback):
+        state = unit.__getstate__()
+        state['_pipeline'] = UnitContext(ppl.name, unit.name)
+
+        return pool.apply_async(run_detached_unit, (unit.__class__, state,
+            inputs, self.share_threshold, self.share_folder),
+            callback=callback)
+
+    def on_unit_done(self, ppl, unit, output):
+        unit._output = output
+
+        unit_name = unit.name
+        out_edges = ppl.get_unit_edges(unit_name)[1]
+        for port, data in output.items():
+            if not isinstance(data, SharedSegment):
+                continue
+
+            readers = [ppl.get_unit(edge.dst) for edge in out_edges
+                    if edge.srcPort == port]
+            # streaming units run in this process, so there is nothing to
+            # share with them
+            if readers and not any(r._streaming for r in readers):
+                self._segments[(unit_name, port)] = [data, len(readers)]
+            else:
+                self.load_segment(ppl, unit_name, port, data)
+
+    def on_inputs_read(self, ppl, unit_name):
+        for edge in ppl.get_unit_edges(unit_name)[0]:
+            key = (edge.src, edge.srcPort)
+            if self._segments.has_key(key):
+                entry = self._segments[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._segments[key]
+                    self.load_segment(ppl, edge.src, edge.srcPort, entry[0])
+
+    def store_output(self, ppl, unit_name, cache_keys):
+        # the output has to be loaded first
+        if any(name == unit_name for name, _ in self._segments):
+            self._pending_store[unit_name] = cache_keys
+        else:
+            ppl.store_output(unit_name, cache_keys)
+
+    def load_segment(self, ppl, unit_name, port_name, segment):
+        """Replaces the segment in the output of the unit with its private
+        mapping, so that the output can be retained, and removes the segment
+        file"""
+        try:
+            ppl.get_unit(unit_name)._output[port_name] = segment.load()
+        finally:
+            segment.unlink()
+
+        if self._pending_store.has_key(unit_name) and \
+                not any(name == unit_name for name, _ in self._segments):
+            ppl.store_output(unit_name, self._pending_store.pop(unit_name))
+
+    def cleanup(self, ppl):
+        # the segments, which were not read because of a failure
+        segments = self._segments
+        self._segments = {}
+        try:
+            for (unit_name, port_name), (segment, _) in segments.items():
+                self.load_segment(ppl, unit_name, port_name, segment)
+        finally:
+            for segment, _ in segments.values():
+                segment.unlink()
+
+
+def run_unit_async(unit, inputs, callback):
+    """Starts the coroutine 'run' method of the unit on the current IOLoop.
+    When it has finished, the callback is called with the same tuple as
+    returned by 'run_unit'. The CPU time of the unit includes the time spent
+    by the other coroutines, running on the same IOLoop at the same time"""
+    from tornado.ioloop import IOLoop
+
+    unit._inputs = inputs
+    measurement = Measurement()
+
+    def on_done(future):
+        unit._inputs = {}
+        try:
+            future.result()
+            res = True, unit._output, measurement.finish(unit._output)
+        except:
+            res = False, traceback.format_exc(), \
+                    measurement.finish(failed=True)
+        callback(res)
+
+    try:
+        future = start_coroutine(unit.run)
+    except:
+        unit._inputs = {}
+        callback((False, traceback.format_exc(),
+            measurement.finish(failed=True)))
+    else:
+        IOLoop.current().add_future(future, on_done)
+
+
+class EventLoopPool(object):
+    """The pool of 'AsyncExecutor': an IOLoop, running in a separate thread,
+    and a pool of threads for the ordinary units"""
+    def __init__(self, max_workers):
+        from tornado.ioloop import IOLoop
+
+        super(EventLoopPool, self).__init__()
+        self.threads = ThreadPool(max_workers)
+        self.io_loop = IOLoop(make_current=False)
+        # units, the coroutines of which have been started, and haven't
+        # reported their result yet
+        self.coroutines = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_loop(self):
+        self.io_loop.make_current()
+        self.io_loop.start()
+
+    def apply_async(self, func, args=(), callback=None):
+        return self.threads.apply_async(func, args, callback=callback)
+
+    def run_coroutine(self, unit, inputs, callback):
+        """Starts the coroutine of the unit on the IOLoop (see
+        'run_unit_async'). The callback is called with a failure, if the
+        coroutine can't be started"""
+        def on_done(res):
+            with self._lock:
+                self.coroutines.discard(unit)
+            callback(res)
+
+        def start():
+            measurement = Measurement()
+            try:
+                run_unit_async(unit, inputs, on_done)
+            except:
+                on_done((False, traceback.format_exc(),
+                    measurement.finish(failed=True)))
+
+        with self._lock:
+            self.coroutines.add(unit)
+        self.io_loop.add_callback(start)
+
+    def abandon(self, n_running):
+        """
+        Checks whether all of the 'n_running' units, the results of which
+        are still awaited, are coroutines. If so, they are marked FAILED, and
+        will be abandoned by 'terminate'
+
+        Returns
+        -------
+        abandoned : bool
+        """
+        with self._lock:
+            if len(self.coroutines) != n_running:
+                return False
+            for unit in self.coroutines:
+                unit.status = tools.Status.FAILED
+                unit.logger.error("Abandoned, as another unit has failed")
+            self.coroutines.clear()
+        return True
+
+    def terminate(self):
+        """Stops the IOLoop (abandoning the coroutines, which are still
+        running) and the threads. The loop stops right away: the abandoned
+        coroutines don't resume"""
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.threads.terminate()
+
+    def join(self):
+        self._thread.join()
+        self.io_loop.close()
+        self.threads.join()
+
+
+class AsyncExecutor(PoolExecutor):
+    """Runs the units with a coroutine 'run' method concurrently on an
+    IOLoop in a separate thread, and the other units in a pool of threads
+    (like 'ThreadExecutor'), so that both kinds can be mixed in one
+    pipeline. The number of the concurrently running coroutines is not
+    limited"""
+
+    def create_pool(self):
+        return EventLoopPool(self.max_workers)
+
+    def dispatch(self, pool, ppl, unit, inputs, callback):
+        if unit._async:
+            pool.run_coroutine(unit, inputs, callback)
+        else:
+            return pool.apply_async(run_unit, (unit, inputs),
+                    callback=callback)
+
+
+EXECUTORS = {
+        'serial': SerialExecutor,
+        'threads': ThreadExecutor,
+        'processes': ProcessExecutor,
+        'async': AsyncExecutor,
+        }
+
+def get_executor(name, max_workers=None):
+    """
+    Creates an executor instance by name
+
+    Parameters
+    ----------
+    name : str
+        one of the keys of 'EXECUTORS'
+    max_workers : int, optional
+        maximal number of concurrently running units
+
+    Returns
+    -------
+    executor : SerialExecutor, ThreadExecutor, ProcessExecutor or
+        AsyncExecutor
+    """
+
+    try:
+        cls = EXECUTORS[name]
+    except KeyError:
+        raise ValueError("Unknown executor '%s'. Available executors: %s"
+                % (name, ", ".join(sorted(EXECUTORS.keys()))))
+
+    return cls(max_workers)
@@ -0,0 +1,148 @@
+"""
+Resource usage of the unit executions in the simple graph engine.
+
+Every execution of a unit's 'run' method is measured with 'Measurement', and
+the statistics are sent to the front-end as a PROFILE event (see
+'tools.EventTool'):
+
+    {
+        'status': 'finished' or 'failed',
+        'wall_time': seconds,
+        'cpu_time': seconds, spent by the thread running the unit,
+        'peak_memory_delta': bytes, the peak resident memory of the process
+            has grown by,
+        'outputs': {port_name: approximate size in bytes, or None},
+        'output_size': total of the known output sizes
+    }
+
+The numbers are approximate: the peak memory is shared by all of the threads
+of a process, and streamed outputs are produced (and measured) by the units
+reading them.
+"""
+
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# CPU time of the current thread is only available on Linux
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+        sys.platform.startswith('linux') and 1 or None)
+
+# ru_maxrss is in kilobytes on Linux, and in bytes on OS X
+MAXRSS_UNIT = sys.platform == 'darwin' and 1 or 1024
+
+
+def cpu_time():
+    """Returns the CPU time of the current thread (or of the process, if not
+    available) in seconds"""
+    if resource is None:
+        return time.clock()
+
+    if RUSAGE_THREAD is not None:
+        try:
+            usage = resource.getrusage(RUSAGE_THREAD)
+        except (ValueError, resource.error):
+            pass
+        else:
+            return usage.ru_utime + usage.ru_stime
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_memory():
+    """Returns the peak resident memory of the process in bytes, or None if
+    not available"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+def get_size(data):
+    """
+    Estimates the size of the data in memory
+
+    Parameters
+    ----------
+    data : object
+        content of an OutPort
+
+    Returns
+    -------
+    size : int or None
+        size in bytes, or None for the data, which is produced lazily
+        (streams, iterators)
+    """
+
+    if isinstance(data, basestring):
+        return sys.getsizeof(data)
+    if np is not None and isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (list, tuple, set, frozenset)):
+        return sys.getsizeof(data) + sum(sys.getsizeof(item)
+                for item in data)
+    if isinstance(data, dict):
+        return sys.getsizeof(data) + sum(sys.getsizeof(key) +
+                sys.getsizeof(value) for key, value in data.iteritems())
+    if hasattr(data, 'next') or hasattr(data, 'open'):
+        return None
+    return sys.getsizeof(data)
+
+
+class Measurement(object):
+    """Measures the resources, used from its creation until 'finish' is
+    called"""
+
+    def __init__(self):
+        super(Measurement, self).__init__()
+        self.start_peak_memory = peak_memory()
+        self.start_cpu_time = cpu_time()
+        self.start_time = time.time()
+
+    def finish(self, output=None, failed=False):
+        """
+        Returns the statistics of the execution
+
+        Parameters
+        ----------
+        output : dict, optional
+            {port_name: data}, the output of the unit
+        failed : bool, optional
+            whether the unit has failed
+
+        Returns
+        -------
+        stats : dict
+            see the module's docstring
+        """
+
+        wall_time = time.time() - self.start_time
+        cpu = cpu_time() - self.start_cpu_time
+
+        memory = peak_memory()
+        if memory is not None and self.start_peak_memory is not None:
+            memory_delta = memory - self.start_peak_memory
+        else:
+            memory_delta = None
+
+        outputs = dict((port, get_size(data))
+                for port, data in (output or {}).items())
+
+        return {
+                'status': failed and 'failed' or 'finished',
+                'wall_time': wall_time,
+                'cpu_time': cpu,
+                'peak_memory_delta': memory_delta,
+                'outputs': outputs,
+                'output_size': sum(size for size in outputs.values()
+                    if size is not None),
+                }
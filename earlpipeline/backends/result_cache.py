@@ -0,0 +1,237 @@
+"""
+Persistent content-addressed cache of unit outputs for the simple graph engine.
+
+The outputs of a unit are stored on disk under a key, which is a hash of the
+unit class, the values of its parameters and the keys of the units connected
+to its inputs. Thus, a unit is found in the cache if exactly the same
+computation has already been done by any pipeline (e.g. a clone), even before
+the server was restarted.
+
+To enable the cache, assign an instance to the 'result_cache' attribute of the
+'Pipeline' class, e.g.
+
+    from earlpipeline.backends.base_simple_engine import Pipeline
+    from earlpipeline.backends.result_cache import ResultCache
+
+    Pipeline.result_cache = ResultCache('cache', max_size=2**30)
+
+The cache is shared with the processes forked afterwards (the pipeline
+processes). The worker pool of the server is forked earlier, so its workers
+receive the configuration of the cache ('get_config') with every run, and
+create a cache of their own in the same folder, with separate counters.
+
+Units with 'volatile' set to True (non-deterministic ones, or ones with side
+effects) are never cached, and neither are the units depending on them.
+"""
+
+import hashlib
+import multiprocessing as mp
+import os
+import pickle
+import tempfile
+
+
+class ResultCache(object):
+    """
+    On-disk cache of unit outputs with LRU eviction. The instance can be
+    shared by processes forked from the one which created it (e.g. the
+    pipeline processes), including the hit/miss counters.
+
+    Parameters
+    ----------
+    folder : str
+        directory to store the cached outputs in. Created, if doesn't exist
+    max_size : int, optional
+        maximal total size of the cached outputs in bytes. The least recently
+        used entries are removed, when the size is exceeded
+    """
+
+    extension = ".pkl"
+
+    def __init__(self, folder, max_size=2**30):
+        super(ResultCache, self).__init__()
+        self.folder = folder
+        self.max_size = max_size
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        size = sum(os.path.getsize(path) for path in self._entries())
+
+        # shared between the forked processes
+        self._size = mp.Value('l', size)
+        self._hits = mp.Value('l', 0)
+        self._misses = mp.Value('l', 0)
+        self._evictions = mp.Value('l', 0)
+
+    def get_config(self):
+        """Returns the keyword arguments, which create a cache of the same
+        entries in another process"""
+        return {'folder': os.path.abspath(self.folder),
+                'max_size': self.max_size}
+
+    @staticmethod
+    def make_key(unit_cls, parameters, inputs):
+        """
+        Computes the cache key of a unit
+
+        Parameters
+        ----------
+        unit_cls : type
+            class of the unit
+        parameters : list of (str, object) tuples
+            names and values of the unit's parameters
+        inputs : list of tuples
+            (in_port, source_key, source_port) for every InPort of the unit
+
+        Returns
+        -------
+        key : str or None
+            hex digest, or None if some of the parameter values can not be
+            pickled
+        """
+
+        try:
+            data = pickle.dumps((unit_cls.__module__, unit_cls.__name__,
+                sorted(parameters), sorted(inputs)), 2)
+        except Exception:
+            return None
+
+        return hashlib.sha1(data).hexdigest()
+
+    def get(self, key):
+        """
+        Loads the cached output
+
+        Parameters
+        ----------
+        key : str
+            cache key of the unit
+
+        Returns
+        -------
+        output : dict
+            {port_name: data}, as it was stored
+
+        Raises
+        ------
+        KeyError
+            if nothing is cached under this key
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                output = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            self._increment(self._misses)
+            raise KeyError(key)
+
+        # mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self._increment(self._hits)
+        return output
+
+    def put(self, key, output):
+        """
+        Stores the output of the unit. The file is written atomically, so
+        that concurrent readers never see a partially written entry.
+
+        Parameters
+        ----------
+        key : str
+            cache key of the unit
+        output : dict
+            {port_name: data}. Has to be picklable
+        """
+
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(output, f, pickle.HIGHEST_PROTOCOL)
+
+            if os.path.exists(path):
+                self._increment(self._size, -os.path.getsize(path))
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._increment(self._size, os.path.getsize(path))
+
+        if self._size.value > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries, until the total size fits
+        into 'max_size'"""
+
+        entries = []
+        for path in self._entries():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._increment(self._evictions)
+
+        with self._size.get_lock():
+            self._size.value = total
+
+    def clear(self):
+        """Removes all entries"""
+        for path in self._entries():
+            os.remove(path)
+
+        with self._size.get_lock():
+            self._size.value = 0
+
+    def stats(self):
+        """
+        Returns the cache statistics
+
+        Returns
+        -------
+        stats : dict
+            with 'hits', 'misses', 'evictions', 'size' (in bytes) and
+            'max_size' fields
+        """
+
+        return {
+                'hits': self._hits.value,
+                'misses': self._misses.value,
+                'evictions': self._evictions.value,
+                'size': self._size.value,
+                'max_size': self.max_size,
+                }
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + self.extension)
+
+    def _entries(self):
+        for fname in os.listdir(self.folder):
+            if fname.endswith(self.extension):
+                yield os.path.join(self.folder, fname)
+
+    @staticmethod
+    def _increment(value, delta=1):
+        with value.get_lock():
+            value.value += delta
@@ -0,0 +1,215 @@
+"""
+Shared memory transport of port data between the worker processes.
+
+Large outputs (NumPy arrays and strings) of the units, executed by
+'ProcessExecutor', are not pickled back to the pipeline process. Instead, the
+worker copies them into a memory-mapped file in a shared memory folder
+('/dev/shm' by default) and returns a small 'SharedSegment' handle. The
+handles are passed to the workers running the connected units, which map the
+segment and get a read-only view of the data (arrays) without copying it.
+
+Every segment is removed, once all of the InPorts connected to it have been
+read (see 'ProcessExecutor'), and its content is loaded into the pipeline
+process, so that the output can be retained and cached as usual. Arrays are
+loaded as private copy-on-write mappings: a page is only copied, when it's
+written to.
+"""
+
+import mmap
+import os
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def default_folder():
+    """Returns the folder, where the segments are created"""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class SharedSegment(object):
+    """
+    Handle of the data, placed in a shared memory segment. Only the handle is
+    pickled, when it is sent between the processes.
+
+    Parameters
+    ----------
+    path : str
+        file, backing the segment
+    size : int
+        size of the data in bytes
+    kind : str
+        'ndarray' or 'str'
+    dtype : str, optional
+        dtype of an array
+    shape : tuple, optional
+        shape of an array
+    """
+
+    prefix = "earlpipeline-"
+
+    def __init__(self, path, size, kind, dtype=None, shape=None):
+        super(SharedSegment, self).__init__()
+        self.path = path
+        self.size = size
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+
+    @classmethod
+    def create(cls, data, folder=None):
+        """
+        Copies the data into a new segment
+
+        Parameters
+        ----------
+        data : numpy.ndarray or str
+            data to share
+        folder : str, optional
+            where to create the segment. Defaults to 'default_folder()'
+
+        Returns
+        -------
+        segment : SharedSegment
+        """
+
+        if isinstance(data, str):
+            segment = cls(None, len(data), 'str')
+        else:
+            segment = cls(None, data.nbytes, 'ndarray', data.dtype.str,
+                    data.shape)
+
+        fd, segment.path = tempfile.mkstemp(prefix=cls.prefix,
+                dir=folder or default_folder())
+        try:
+            os.ftruncate(fd, segment.size)
+            buf = mmap.mmap(fd, segment.size)
+            try:
+                if segment.kind == 'str':
+                    buf[:] = data
+                else:
+                    segment._as_array(buf)[...] = data
+            finally:
+                buf.close()
+        except:
+            segment.unlink()
+            raise
+        finally:
+            os.close(fd)
+
+        return segment
+
+    def attach(self, private=False):
+        """
+        Maps the segment into the memory of the current process
+
+        Parameters
+        ----------
+        private : bool, optional
+            map the segment copy-on-write, so that an array can be modified
+            without affecting the segment. Pages are copied lazily, on the
+            first write
+
+        Returns
+        -------
+        data : numpy.ndarray or str
+            a view of an array (read-only, unless 'private' is True), or a
+            copy of a string
+        """
+
+        access = private and mmap.ACCESS_COPY or mmap.ACCESS_READ
+        with open(self.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), self.size, access=access)
+
+        if self.kind == 'str':
+            try:
+                return buf[:]
+            finally:
+                buf.close()
+
+        # the mapping stays alive as long as the view does, even after the
+        # file is unlinked
+        return self._as_array(buf)
+
+    def load(self):
+        """Returns a private (writable) copy of the data. An array stays
+        mapped, and is only copied page by page, as it's modified"""
+        return self.attach(private=True)
+
+    def unlink(self):
+        """Removes the segment. Already mapped views stay valid"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _as_array(self, buf):
+        dtype = np.dtype(self.dtype)
+        count = self.size // dtype.itemsize
+        return np.frombuffer(buf, dtype, count).reshape(self.shape)
+
+
+def is_shareable(data, threshold):
+    """Checks whether the data is worth placing in a shared memory segment,
+    i.e. whether it's a string or a plain NumPy array of at least
+    'threshold' bytes"""
+
+    # empty segments can't be mapped
+    threshold = max(threshold, 1)
+
+    if isinstance(data, str):
+        return len(data) >= threshold
+
+    return np is not None and type(data) is np.ndarray and \
+            not data.dtype.hasobject and data.nbytes >= threshold
+
+
+def export_output(output, threshold, folder=None):
+    """
+    Moves the large values of a unit's output to shared memory
+
+    Parameters
+    ----------
+    output : dict
+        {port_name: data}
+    threshold : int
+        minimal size of the shared values in bytes
+    folder : str, optional
+        where to create the segments
+
+    Returns
+    -------
+    output : dict
+        a copy of the output, with the large values replaced by
+        'SharedSegment' handles
+    """
+
+    shared = {}
+    try:
+        for port, data in output.items():
+            if is_shareable(data, threshold):
+                shared[port] = SharedSegment.create(data, folder)
+    except:
+        for segment in shared.values():
+            segment.unlink()
+        raise
+
+    output = dict(output)
+    output.update(shared)
+    return output
+
+
+def attach_inputs(inputs):
+    """Replaces the 'SharedSegment' handles in the inputs of a unit with
+    read-only views of their data"""
+
+    if not any(isinstance(data, SharedSegment) for data in inputs.values()):
+        return inputs
+
+    return dict((port, data.attach() if isinstance(data, SharedSegment)
+        else data) for port, data in inputs.items())
@@ -0,0 +1,272 @@
+"""
+Compact, versioned on-disk format of the simple graph engine pipelines.
+
+A pipeline is stored as a JSON document:
+
+    {
+        "format": "earlpipeline",
+        "version": 1,
+        "pipeline": {"name": ..., "executor": ..., "max_workers": ...,
+                     "priority": ...},
+        "units": {
+            unit_name: {
+                "class": "module:ClassName",
+                "parameters": {parameter_name: value, ...},
+                "top": ..., "left": ...
+            },
+            ...
+        },
+        "connections": {"dest_unit.dest_port": "src_unit.src_port", ...},
+        "blobs": {digest: {"json": value} or {"pickle": base64 string}, ...}
+    }
+
+Small JSON-compatible parameter values are stored inline. Large ones, and
+the ones which can only be pickled, are replaced by {"$blob": digest}, and
+stored once in "blobs" under the SHA-1 digest of their content. Only the
+structure of the pipeline is stored; run state (status, retained outputs)
+is not.
+
+Files written by the earlier versions, which pickled the whole pipeline,
+are still loaded.
+"""
+
+import base64
+import hashlib
+import json
+import pickle
+
+FORMAT_NAME = "earlpipeline"
+FORMAT_VERSION = 1
+
+# JSON-encoded parameter values longer than this (in bytes) are stored as
+# blobs
+INLINE_LIMIT = 256
+
+BLOB_KEY = "$blob"
+
+_plain_scalars = (type(None), bool, int, long, float, str, unicode)
+
+
+def _is_plain(value):
+    """Checks whether the value is preserved by a JSON round trip (except
+    for str becoming unicode)"""
+    if isinstance(value, _plain_scalars):
+        return True
+    if type(value) is list:
+        return all(_is_plain(item) for item in value)
+    if type(value) is dict:
+        return all(isinstance(key, basestring) and _is_plain(item)
+                for key, item in value.items())
+    return False
+
+
+def encode_value(value, blobs):
+    """
+    Encodes a parameter value, moving it to 'blobs' if necessary
+
+    Parameters
+    ----------
+    value : object
+        parameter value. Has to be JSON-compatible or picklable
+    blobs : dict
+        {digest: blob} of the document
+
+    Returns
+    -------
+    encoded : object
+        JSON-compatible value
+    """
+
+    if _is_plain(value):
+        try:
+            data = json.dumps(value)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            pass
+        else:
+            ambiguous = isinstance(value, dict) and value.has_key(BLOB_KEY)
+            if len(data) <= INLINE_LIMIT and not ambiguous:
+                return value
+            blob = {'json': value}
+            return {BLOB_KEY: _add_blob(blobs, 'json:' + data, blob)}
+
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    blob = {'pickle': base64.b64encode(data)}
+    return {BLOB_KEY: _add_blob(blobs, 'pickle:' + data, blob)}
+
+
+def _add_blob(blobs, content, blob):
+    digest = hashlib.sha1(content).hexdigest()
+    blobs.setdefault(digest, blob)
+    return digest
+
+
+def decode_value(encoded, blobs):
+    """Inverse of 'encode_value'"""
+    if isinstance(encoded, dict) and encoded.has_key(BLOB_KEY):
+        blob = blobs[encoded[BLOB_KEY]]
+        if blob.has_key('json'):
+            return blob['json']
+        return pickle.loads(base64.b64decode(blob['pickle']))
+
+    return encoded
+
+
+def is_pickled(encoded, blobs):
+    """Checks whether an encoded value refers to a pickled blob"""
+    return isinstance(encoded, dict) and encoded.has_key(BLOB_KEY) and \
+            blobs[encoded[BLOB_KEY]].has_key('pickle')
+
+
+def coerce_value(unit, name, value):
+    """Casts a value, decoded from JSON, with the 'before_write' of the
+    parameter, e.g. strings are decoded as unicode, while the result cache
+    keys are computed from the values, as they were set. The value is kept,
+    if it can't be cast"""
+    try:
+        before_write = unit._parameters[name].before_write
+    except (AttributeError, KeyError):
+        return value
+    if before_write is None:
+        return value
+
+    try:
+        return before_write(value)
+    except Exception:
+        return value
+
+
+def get_class_path(cls):
+    return "%s:%s" % (cls.__module__, cls.__name__)
+
+
+def resolve_class(path):
+    """Imports a class by its 'module:ClassName' path"""
+    module_name, cls_name = path.split(':')
+    module = __import__(module_name, fromlist=[cls_name])
+    return getattr(module, cls_name)
+
+
+def to_document(ppl):
+    """
+    Converts a pipeline to a JSON-compatible document
+
+    Parameters
+    ----------
+    ppl : Pipeline
+        simple engine pipeline
+
+    Returns
+    -------
+    doc : dict
+    """
+
+    blobs = {}
+    units = {}
+    for unit in ppl.units:
+        parameters = {}
+        for name, info in unit.parameters_info.items():
+            parameters[name] = encode_value(info['value'], blobs)
+
+        entry = {
+                'class': get_class_path(unit.__class__),
+                'parameters': parameters,
+                }
+        for attr in ('top', 'left'):
+            if hasattr(unit, attr):
+                entry[attr] = getattr(unit, attr)
+
+        units[unit.name] = entry
+
+    return {
+            'format': FORMAT_NAME,
+            'version': FORMAT_VERSION,
+            'pipeline': {
+                'name': ppl.name,
+                'executor': ppl.executor,
+                'max_workers': ppl.max_workers,
+                'priority': ppl.priority,
+                },
+            'units': units,
+            'connections': dict(ppl._connections),
+            'blobs': blobs,
+            }
+
+
+def from_document(cls, doc):
+    """
+    Creates a pipeline from a document, produced by 'to_document'
+
+    Parameters
+    ----------
+    cls : type
+        the 'Pipeline' class to instantiate
+    doc : dict
+
+    Returns
+    -------
+    ppl : Pipeline
+    """
+
+    if doc.get('format') != FORMAT_NAME:
+        raise ValueError("Not a pipeline document")
+    if doc.get('version', 0) > FORMAT_VERSION:
+        raise ValueError("Pipeline format version %s is not supported "
+                "(the latest supported version is %s)"
+                % (doc.get('version'), FORMAT_VERSION))
+
+    info = doc['pipeline']
+    ppl = cls(info['name'], info.get('executor', 'serial'),
+            info.get('max_workers'))
+    if info.get('priority', ppl.priority) != ppl.priority:
+        ppl.priority = info['priority']
+
+    blobs = doc.get('blobs', {})
+    for unit_name, entry in doc['units'].items():
+        unit = resolve_class(entry['class'])()
+
+        # set before adding the unit, so that nothing is invalidated
+        for name, encoded in entry['parameters'].items():
+            value = decode_value(encoded, blobs)
+            # pickled values keep their type
+            if not is_pickled(encoded, blobs):
+                value = coerce_value(unit, name, value)
+            setattr(unit, name, value)
+        for attr in ('top', 'left'):
+            if entry.has_key(attr):
+                setattr(unit, attr, entry[attr])
+
+        ppl.add_unit(unit, unit_name)
+
+    ppl.set_connections(doc['connections'])
+
+    return ppl
+
+
+def dumps(ppl):
+    """Serializes the pipeline to a string. Keys are sorted, so that the same
+    pipeline always gives the same string"""
+    return json.dumps(to_document(ppl), separators=(',', ':'),
+            sort_keys=True)
+
+
+def loads(cls, data):
+    """Inverse of 'dumps'. Pickled pipelines are accepted as well"""
+    if data.lstrip().startswith('{'):
+        return from_document(cls, json.loads(data))
+
+    # saved by an earlier version
+    return pickle.loads(data)
+
+
+def save(ppl, fname):
+    """Writes the pipeline to a file"""
+    data = dumps(ppl)
+    with open(fname, 'wb') as f:
+        f.write(data)
+
+
+def load(cls, fname):
+    """Reads a pipeline from a file, written either by 'save', or by pickling
+    the pipeline"""
+    with open(fname, 'rb') as f:
+        return loads(cls, f.read())
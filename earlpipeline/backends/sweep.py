@@ -0,0 +1,312 @@
+"""
+Parameter sweeps for the simple graph engine.
+
+A sweep runs a pipeline for every combination of the values of some of its
+parameters. Only the units, which depend on the swept parameters (the units
+owning them and their descendants), are run for every combination. The rest
+of the units, which they depend on, are run once, before the variants, and
+their outputs are shared by all of the variants.
+
+The variants are run by worker processes, forked after the shared units
+have finished, so that the shared outputs are inherited by the workers
+instead of being sent to them. Each worker reuses its copy of the pipeline
+for all of the variants it runs.
+
+The server runs a sweep like a run of the pipeline, in a process of its own
+(see 'PipelineManager.start_sweep').
+
+    result = ppl.sweep({'number0.value': [1, 2, 3], 'pow0.num2': [2, 3]})
+    for values, outputs in result.results.items():
+        print values, outputs['pow0.res']
+"""
+
+import itertools
+import multiprocessing as mp
+import pickle
+import Queue
+import signal
+import traceback
+from collections import OrderedDict
+
+from earlpipeline.backends.executors import init_worker
+
+
+class SweepResult(object):
+    """
+    Outputs of the sweep variants
+
+    Attributes
+    ----------
+    parameters : list of str
+        swept parameters, as 'unit.parameter' paths
+    variants : list of tuples
+        values of the parameters, in the order the variants were given
+    results : OrderedDict
+        {values: {'unit.port': data}} of the successful variants, where
+        'values' is a tuple of the parameter values, in the order of
+        'parameters'
+    errors : OrderedDict
+        {values: traceback string} of the failed variants
+    shared : list of str
+        units, which were run once for all of the variants
+    """
+
+    def __init__(self, parameters, variants, shared):
+        super(SweepResult, self).__init__()
+        self.parameters = parameters
+        self.variants = variants
+        self.shared = shared
+        self.results = OrderedDict()
+        self.errors = OrderedDict()
+
+    def to_dict(self):
+        """Returns the table as a list of rows {'values': {path: value},
+        'outputs': {path: data} or None, 'error': str or None}, ordered as
+        the variants were given"""
+        rows = []
+        for values in self.variants:
+            rows.append({
+                'values': dict(zip(self.parameters, values)),
+                'outputs': self.results.get(values),
+                'error': self.errors.get(values),
+                })
+
+        return {'parameters': self.parameters, 'shared': self.shared,
+                'rows': rows}
+
+
+def make_variants(grid):
+    """
+    Converts a grid to the list of variants
+
+    Parameters
+    ----------
+    grid : dict
+        {'unit.parameter': list of values}. If it's an OrderedDict, the
+        parameters are varied in its order, otherwise they are sorted
+
+    Returns
+    -------
+    parameters : list of str
+    variants : list of tuples
+        all combinations of the values
+    """
+
+    if isinstance(grid, OrderedDict):
+        parameters = grid.keys()
+    else:
+        parameters = sorted(grid.keys())
+
+    variants = list(itertools.product(*[grid[path] for path in parameters]))
+    return parameters, variants
+
+
+def run_variant(ppl, parameters, units, outputs):
+    """
+    Runs the pipeline with the given parameter values
+
+    Parameters
+    ----------
+    ppl : Pipeline
+        the worker's copy of the pipeline
+    parameters : list of tuples
+        (unit_name, parameter_name, value)
+    units : set of str
+        units to update
+    outputs : list of tuples
+        (unit_name, port_name) to return
+
+    Returns
+    -------
+    ok : bool
+    payload : dict or str
+        {'unit.port': data}, or the traceback, if the variant has failed
+    """
+
+    try:
+        for unit_name, par_name, value in parameters:
+            setattr(ppl.get_unit(unit_name), par_name, value)
+        ppl.run(units)
+
+        result = dict((ppl.make_path(unit_name, port_name),
+            ppl.get_unit(unit_name).read_port(port_name))
+            for unit_name, port_name in outputs)
+
+        # fail here, rather than in the queue's thread
+        pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False, traceback.format_exc()
+
+    return True, result
+
+
+def variant_worker_main(ppl, units, outputs, tasks, results):
+    """Main loop of a sweep worker process. Runs the variants, received over
+    the 'tasks' queue as (index, parameters), on its copy of the pipeline,
+    inherited from the sweeping process, until None is received"""
+    init_worker()
+    for index, parameters in iter(tasks.get, None):
+        results.put((index, run_variant(ppl, parameters, units, outputs)))
+
+
+def run_variants(ppl, tasks, units, outputs, max_workers):
+    """Runs the variants in 'max_workers' processes, forked from the
+    current one. Returns the results of 'run_variant' in the order of the
+    tasks"""
+    task_queue = mp.Queue()
+    result_queue = mp.Queue()
+    workers = [mp.Process(target=variant_worker_main, args=(ppl, units,
+        outputs, task_queue, result_queue))
+        for _ in range(min(max_workers, len(tasks)))]
+
+    # make sure, the workers are not left behind, if the sweeping process is
+    # terminated (e.g. the sweep is stopped by the user)
+    def on_terminate(signum, frame):
+        raise SystemExit("Terminated")
+
+    try:
+        old_handler = signal.signal(signal.SIGTERM, on_terminate)
+    except ValueError:
+        # not in the main thread
+        old_handler = None
+
+    try:
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        for index, parameters in enumerate(tasks):
+            task_queue.put((index, parameters))
+        for worker in workers:
+            task_queue.put(None)
+
+        payloads = [None] * len(tasks)
+        received = 0
+        while received < len(tasks):
+            try:
+                index, payload = result_queue.get(True, 1)
+            except Queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError("The sweep workers have exited, "
+                            "%d variants were not run"
+                            % (len(tasks) - received))
+                continue
+            payloads[index] = payload
+            received += 1
+
+        # killing a worker, which is still sending its events, could leave
+        # the event queue locked
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        if old_handler is not None:
+            signal.signal(signal.SIGTERM, old_handler)
+
+    return payloads
+
+
+def sweep(ppl, grid=None, variants=None, outputs=None, max_workers=None,
+        copy=True):
+    """
+    Runs the pipeline for every combination of the parameter values. The
+    pipeline itself is not modified, unless 'copy' is False.
+
+    Parameters
+    ----------
+    ppl : Pipeline
+        simple engine pipeline
+    grid : dict, optional
+        {'unit.parameter': list of values}, all combinations of which are run
+    variants : list of dicts, optional
+        [{'unit.parameter': value}, ...], the combinations to run, instead of
+        a grid. All of them have to set the same parameters
+    outputs : list of str, optional
+        'unit.port' paths of the outputs to collect. Defaults to all OutPorts
+        of the units without children, which depend on the swept parameters
+    max_workers : int, optional
+        number of processes, running the variants. Defaults to the number of
+        CPUs. With 1, the variants are run in the calling process
+    copy : bool, optional
+        if False, the shared units and the variants are run on the pipeline
+        itself, e.g. in a process, which owns a copy of it
+
+    Returns
+    -------
+    result : SweepResult
+        parameter values must be hashable, as they are used as keys
+    """
+
+    if grid is not None:
+        parameters, combinations = make_variants(grid)
+    elif variants:
+        parameters = sorted(variants[0].keys())
+        combinations = [tuple(variant[path] for path in parameters)
+                for variant in variants]
+    else:
+        raise ValueError("Either a grid or a list of variants is required")
+
+    # validate the parameters
+    swept = []
+    for path in parameters:
+        unit_name, par_name = ppl.split_path(path)
+        if not ppl.get_unit(unit_name)._parameters.has_key(par_name):
+            raise ValueError("Unit '%s' has no parameter '%s'"
+                    % (unit_name, par_name))
+        swept.append((unit_name, par_name))
+
+    affected = set(unit_name for unit_name, _ in swept)
+    for unit_name in list(affected):
+        affected.update(ppl.get_descendants(unit_name))
+
+    if outputs is None:
+        sinks = [unit_name for unit_name in sorted(affected)
+                if not ppl.get_children(unit_name)]
+        outputs = [(unit_name, port_name) for unit_name in sinks
+                for port_name in sorted(ppl.get_unit(unit_name).get_out_ports())]
+    else:
+        outputs = [ppl.split_path(path) for path in outputs]
+        for unit_name, port_name in outputs:
+            ppl.get_unit(unit_name).assert_has_port(port_name)
+
+    # everything the outputs depend on
+    units = set(unit_name for unit_name, _ in outputs)
+    for unit_name in list(units):
+        units.update(ppl.get_ancestors(unit_name))
+    shared = units - affected
+
+    if copy:
+        # keeping the outputs, which are still valid
+        base = pickle.loads(pickle.dumps(ppl, pickle.HIGHEST_PROTOCOL))
+        base.import_outputs(ppl.export_outputs(retained=True))
+    else:
+        base = ppl
+
+    if shared:
+        base.run(shared)
+
+    result = SweepResult(parameters, combinations, sorted(shared))
+
+    tasks = [[(unit_name, par_name, value) for (unit_name, par_name), value
+        in zip(swept, values)] for values in combinations]
+
+    if max_workers == 1 or len(tasks) == 1:
+        payloads = [run_variant(base, task, units, outputs) for task in tasks]
+    else:
+        # daemonic workers can't have children
+        if base.executor == 'processes':
+            base.set_executor('serial')
+
+        payloads = run_variants(base, tasks, units, outputs,
+                max_workers or mp.cpu_count())
+
+    for values, (ok, payload) in zip(combinations, payloads):
+        if ok:
+            result.results[values] = payload
+        else:
+            result.errors[values] = payload
+
+    return result
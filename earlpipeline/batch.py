@@ -0,0 +1,396 @@
+"""
+Headless batch runner of the saved pipelines.
+
+Runs pipeline files without the web server: every pipeline is run in a
+separate process (at most 'jobs' of them at a time), its log is written to
+a stream or to a file of its own, and the status and the timing of every run
+are reported, when all of them have stopped. Nothing here imports Tornado.
+
+From the command line:
+
+    $ python -m earlpipeline.batch -b earlpipeline.backends.calculator \\
+            -j 4 --log-dir logs --report report.json pipelines/*.ppl
+
+The exit status is 0, if all of the pipelines have finished successfully,
+and 1 otherwise. From Python:
+
+    from earlpipeline import batch
+    from earlpipeline.backends import calculator
+
+    runs = batch.run_batch(calculator, ['a.ppl', 'b.ppl'], jobs=2)
+    failed = [run for run in runs if run.status != Status.FINISHED]
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import Queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from earlpipeline.tools import Status, LogEventServer, CallbackHandler, \
+        RunProfile, read_pipeline, run_pipeline
+from earlpipeline.backends.base import ROOT_LOG_NAME
+
+
+class BatchRun(object):
+    """
+    A run of one pipeline file
+
+    Attributes
+    ----------
+    fname : str
+        the pipeline file
+    ppl : Pipeline or None
+        the pipeline, if it has been loaded
+    status : int
+        Status.QUEUED before the run, Status.RUNNING during it, and
+        Status.FINISHED or Status.FAILED afterwards
+    error : str or None
+        why the pipeline has failed, if not because of an exception in the
+        pipeline itself (which is in its log)
+    started, stopped : float or None
+        time of the start and of the end of the run
+    profile : RunProfile
+        statistics of the unit executions
+    """
+
+    def __init__(self, fname):
+        super(BatchRun, self).__init__()
+        self.fname = fname
+        self.ppl = None
+        self.status = Status.QUEUED
+        self.error = None
+        self.started = None
+        self.stopped = None
+        self.profile = RunProfile()
+        self.process = None
+        # where the log of the pipeline is written
+        self.log = None
+
+    @property
+    def name(self):
+        return self.ppl is not None and self.ppl.name or None
+
+    @property
+    def wall_time(self):
+        if self.started is None or self.stopped is None:
+            return None
+        return self.stopped - self.started
+
+    def to_dict(self):
+        return {
+                'file': self.fname,
+                'pipeline': self.name,
+                'status': self.status == Status.FINISHED and 'finished'
+                    or 'failed',
+                'error': self.error,
+                'started': self.started,
+                'wall_time': self.wall_time,
+                'profile': self.profile.to_dict(),
+                }
+
+
+class BatchRunner(object):
+    """
+    Runs the pipeline files in separate processes, and writes their logs
+
+    Parameters
+    ----------
+    backend : module
+        backend, the pipelines belong to
+    jobs : int, optional
+        maximal number of the pipelines running at the same time
+    stream : file, optional
+        stream to write the logs (unless 'log_folder' is given) and the
+        summary to. Defaults to sys.stdout
+    log_folder : str, optional
+        folder to write the log of every pipeline to, as 'name.log'
+    timeout : float, optional
+        time (in seconds) after which a running pipeline is terminated
+    """
+
+    def __init__(self, backend, jobs=1, stream=None, log_folder=None,
+            timeout=None):
+        super(BatchRunner, self).__init__()
+        self.backend = backend
+        self.jobs = max(jobs, 1)
+        self.stream = stream or sys.stdout
+        self.log_folder = log_folder
+        self.timeout = timeout
+
+        # {ppl_name: BatchRun} of the loaded pipelines
+        self._runs = {}
+        # log files and the stream are written from the event server's
+        # thread as well
+        self._write_lock = threading.Lock()
+        # names of the pipelines, which have reported their final status
+        self._stopped = Queue.Queue()
+
+    def write(self, run, line):
+        """Writes a line to the log of the run"""
+        out = run is not None and run.log or self.stream
+        with self._write_lock:
+            out.write(line + "\n")
+            out.flush()
+
+    def load(self, fname):
+        """Loads a pipeline file. Returns its BatchRun, which has already
+        failed, if the file can't be loaded"""
+        run = BatchRun(fname)
+        try:
+            ppl = read_pipeline(self.backend, fname)
+        except Exception:
+            run.status = Status.FAILED
+            run.error = "Can't load the pipeline:\n" + traceback.format_exc()
+            self.write(None, "%s: %s" % (fname, run.error))
+            return run
+
+        # the events are told apart by the pipeline names
+        if self._runs.has_key(ppl.name):
+            run.status = Status.FAILED
+            run.error = "Pipeline '%s' is already loaded from %s" \
+                    % (ppl.name, self._runs[ppl.name].fname)
+            self.write(None, "%s: %s" % (fname, run.error))
+            return run
+
+        run.ppl = ppl
+        self._runs[ppl.name] = run
+        return run
+
+    def format_event(self, data):
+        """Formats a log event as a line of the log"""
+        src = data['src']
+        if self.log_folder:
+            # the file of the pipeline
+            source = src['unit'] or ""
+        else:
+            source = src['unit'] and "%s.%s" % (src['pipeline'], src['unit']) \
+                    or src['pipeline'] or ""
+        stamp = time.strftime("%H:%M:%S", time.localtime(data['time']))
+        if not source:
+            return "%s %s" % (stamp, data['msg'])
+        return "%s %s: %s" % (stamp, source, data['msg'])
+
+    def on_event(self, event):
+        """Handles a parsed event. Called from the event server's thread"""
+        if event is None:
+            return
+
+        data = event['data']
+        if event['type'] == 'log':
+            run = self._runs.get(data['src']['pipeline'])
+            self.write(run, self.format_event(data))
+
+        elif event['type'] == 'profile':
+            run = self._runs.get(data['pipeline'])
+            if run is not None:
+                run.profile.add(data)
+
+        elif event['type'] == 'status':
+            if data['target_type'] != 'pipeline':
+                return
+            status = int(data['status'])
+            if status == Status.FINISHED or status == Status.FAILED:
+                run = self._runs.get(data['pipeline'])
+                if run is not None and run.stopped is None:
+                    run.stopped = data['time']
+                self._stopped.put(data['pipeline'])
+
+    def start(self, run, event_server):
+        """Starts the run in a new process"""
+        if self.log_folder:
+            run.log = open(os.path.join(self.log_folder, run.name + ".log"),
+                    'w')
+
+        event_server.add_pipeline(run.ppl)
+        run.started = time.time()
+        run.status = Status.RUNNING
+        run.ppl.status = Status.RUNNING
+
+        run.process = mp.Process(target=run_pipeline, args=(run.ppl,))
+        run.process.start()
+
+    def finish(self, run, error=None):
+        """Collects the result of a run, the process of which has exited"""
+        run.process.join()
+        if run.stopped is None:
+            run.stopped = time.time()
+
+        # the status is shared with the forked process
+        status = run.ppl.status
+        if error is None and status == Status.RUNNING:
+            error = "The process has exited with code %s" \
+                    % run.process.exitcode
+        if error is not None:
+            status = Status.FAILED
+            run.error = error
+            self.write(run, "%s: %s" % (run.name, error))
+        run.status = status
+
+        self.write(None, "%s: %s in %.3f s" % (run.name, status ==
+            Status.FINISHED and "finished" or "failed", run.wall_time))
+
+    def run(self, fnames):
+        """
+        Runs the pipelines
+
+        Parameters
+        ----------
+        fnames : list of str
+            pipeline files
+
+        Returns
+        -------
+        runs : list of BatchRun
+            in the order of 'fnames'
+        """
+
+        if self.log_folder and not os.path.isdir(self.log_folder):
+            os.makedirs(self.log_folder)
+
+        # pipelines only log INFO messages and above
+        logging.getLogger(ROOT_LOG_NAME).setLevel(logging.INFO)
+
+        event_server = LogEventServer()
+        event_server.start()
+        event_server.add_client("BatchRunner", CallbackHandler(self.on_event))
+
+        runs = [self.load(fname) for fname in fnames]
+        pending = deque(run for run in runs if run.ppl is not None)
+        running = []
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.jobs:
+                    run = pending.popleft()
+                    self.start(run, event_server)
+                    running.append(run)
+
+                # wake up, when one of the pipelines reports its status
+                try:
+                    name = self._stopped.get(True, 0.5)
+                except Queue.Empty:
+                    pass
+                else:
+                    run = self._runs[name]
+                    if run in running:
+                        run.process.join()
+
+                now = time.time()
+                for run in list(running):
+                    error = None
+                    if self.timeout is not None and run.process.is_alive() \
+                            and now - run.started > self.timeout:
+                        run.process.terminate()
+                        error = "Terminated after %s s" % self.timeout
+                    elif run.process.is_alive():
+                        continue
+
+                    running.remove(run)
+                    self.finish(run, error)
+        finally:
+            for run in running:
+                run.process.terminate()
+                run.process.join()
+
+            # delivers the remaining events
+            event_server.stop()
+            for run in runs:
+                if run.log is not None:
+                    run.log.close()
+
+        return runs
+
+    def write_summary(self, runs, wall_time):
+        """Writes the status and the timing of the runs to the stream"""
+        lines = [""]
+        for run in runs:
+            wall = run.wall_time
+            lines.append("%-9s %10s  %s (%s)" % (run.status == Status.FINISHED
+                and "finished" or "failed", wall is not None and "%.3f s"
+                % wall or "-", run.name or "-", run.fname))
+
+        failed = len([run for run in runs if run.status != Status.FINISHED])
+        lines.append("%d pipelines, %d failed, %.3f s" % (len(runs), failed,
+            wall_time))
+        self.write(None, "\n".join(lines))
+
+
+def run_batch(backend, fnames, jobs=1, stream=None, log_folder=None,
+        timeout=None, report=None):
+    """
+    Runs the pipeline files headless. See 'BatchRunner' for the parameters
+
+    Parameters
+    ----------
+    report : str, optional
+        file to write the JSON report of the runs to
+
+    Returns
+    -------
+    runs : list of BatchRun
+        in the order of 'fnames'
+    """
+
+    runner = BatchRunner(backend, jobs, stream, log_folder, timeout)
+
+    start = time.time()
+    runs = runner.run(fnames)
+    wall_time = time.time() - start
+
+    runner.write_summary(runs, wall_time)
+
+    if report:
+        with open(report, 'w') as f:
+            json.dump({
+                'created': datetime.datetime.utcnow().isoformat(),
+                'backend': backend.__name__,
+                'jobs': runner.jobs,
+                'wall_time': wall_time,
+                'runs': [run.to_dict() for run in runs],
+                }, f, indent=1)
+
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs pipeline files "
+            "without the web server")
+    parser.add_argument('files', nargs='+', metavar='FILE',
+            help="pipeline files")
+    parser.add_argument('-b', '--backend', required=True,
+            help="module of the backend, e.g. earlpipeline.backends.calculator")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help="number of pipelines to run in parallel (default: "
+            "%(default)s)")
+    parser.add_argument('--log-dir',
+            help="folder to write the log of each pipeline to, instead of "
+            "stdout")
+    parser.add_argument('--timeout', type=float,
+            help="terminate the pipelines running longer than this (in "
+            "seconds)")
+    parser.add_argument('--report',
+            help="file to write the JSON report with the status and the "
+            "timing of the runs to")
+    args = parser.parse_args(argv)
+
+    backend = importlib.import_module(args.backend)
+
+    runs = run_batch(backend, args.files, args.jobs, sys.stdout, args.log_dir,
+            args.timeout, args.report)
+
+    if all(run.status == Status.FINISHED for run in runs):
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
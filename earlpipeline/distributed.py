@@ -0,0 +1,834 @@
+"""
+Running pipelines on remote worker hosts.
+
+A worker daemon ('WorkerServer') listens on a TCP port and runs the
+pipelines it receives, each in a forked process, the same way the server
+runs them locally. A 'PipelineManager' in the coordinator mode (created with
+'remote_workers') keeps a connection to every daemon ('RemoteWorker'), ships
+pipeline runs to the workers with free slots, and puts the log, status and
+profile events, which come back, into the queue of its 'LogEventServer', so
+that they are handled exactly like the events of the local runs.
+
+Start a worker on every host (the backend's modules have to be importable
+there), with a secret shared by the worker and the server:
+
+    $ export EARLPIPELINE_SECRET=...
+    $ python -m earlpipeline.distributed --host 0.0.0.0 --port 5100 \\
+            --slots 8 --import earlpipeline.backends.calculator
+
+and the server with
+
+    server.run(remote_workers=['host1:5100', 'host2:5100'],
+            remote_secret=os.environ['EARLPIPELINE_SECRET'])
+
+Protocol: a connection starts with a handshake, in which both sides prove
+that they know the secret, without sending it: the worker sends a random
+challenge (16 bytes), the coordinator answers with its own challenge and
+HMAC-SHA256(secret, "coordinator" + worker's challenge), and the worker with
+HMAC-SHA256(secret, "worker" + coordinator's challenge). A side receiving a
+wrong answer closes the connection. Only then messages are exchanged: every
+message is a pickled tuple, preceded by its length (4 bytes, big-endian).
+Pickles are executed on receipt, so a worker refuses to listen on an address
+other than the loopback one without a secret (unless started with
+'--insecure'), and the coordinator refuses to connect to such a worker
+without a secret.
+
+    worker -> coordinator
+        ('hello', {'version': ..., 'slots': ..., 'heartbeat': ...})
+        ('event', run_id, attributes of a LogRecord)
+        ('outputs', run_id, retained outputs of the pipeline)
+        ('ping',)  every 'heartbeat' seconds
+    coordinator -> worker
+        ('run', run_id, logger_name, pickled pipeline, retained outputs or
+            None, log level, units to run or None)
+        ('stop', run_id)
+
+The outputs of a run are sent before its final status, over the same
+connection. If a worker doesn't send anything for 3 heartbeats, or the
+connection breaks, all of its runs are failed, and the worker is skipped,
+until it can be connected to again.
+"""
+
+import argparse
+import hashlib
+import hmac
+import importlib
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import Queue
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from logutils.queue import QueueHandler
+
+from earlpipeline.tools import Status, EventTool, run_pipeline
+
+PROTOCOL_VERSION = 2
+
+_header = struct.Struct("!I")
+
+CHALLENGE_SIZE = 16
+
+
+def send_message(sock, msg):
+    """Sends a message (a picklable tuple) over the socket"""
+    data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+
+
+def recv_message(sock):
+    """Receives a message, sent by 'send_message'. Returns None, if the
+    connection has been closed"""
+    header = _recv_exactly(sock, _header.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, _header.unpack(header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def sign(secret, role, challenge):
+    """Returns the answer of the given role ('worker' or 'coordinator') to
+    the challenge of the other side"""
+    return hmac.new(secret or "", role + challenge, hashlib.sha256).digest()
+
+
+def authenticate(sock, secret, role):
+    """
+    Performs the handshake of the protocol (see the module's docstring)
+    before any message is exchanged
+
+    Parameters
+    ----------
+    sock : socket.socket
+        a connected socket with a timeout
+    secret : str or None
+        the shared secret
+    role : str
+        'worker' or 'coordinator'
+
+    Returns
+    -------
+    ok : bool
+        False, if the other side doesn't know the secret, or has closed the
+        connection
+    """
+
+    other = role == 'worker' and 'coordinator' or 'worker'
+    challenge = os.urandom(CHALLENGE_SIZE)
+    size = hashlib.sha256().digest_size
+
+    if role == 'worker':
+        sock.sendall(challenge)
+        answer = _recv_exactly(sock, CHALLENGE_SIZE + size)
+        if answer is None or not hmac.compare_digest(answer[CHALLENGE_SIZE:],
+                sign(secret, other, challenge)):
+            return False
+        sock.sendall(sign(secret, role, answer[:CHALLENGE_SIZE]))
+        return True
+
+    their_challenge = _recv_exactly(sock, CHALLENGE_SIZE)
+    if their_challenge is None:
+        return False
+    sock.sendall(challenge + sign(secret, role, their_challenge))
+    answer = _recv_exactly(sock, size)
+    return answer is not None and \
+            hmac.compare_digest(answer, sign(secret, other, challenge))
+
+
+def is_loopback(host):
+    """Checks whether the host name or address only refers to this host"""
+    try:
+        return socket.gethostbyname(host).startswith("127.")
+    except socket.error:
+        return False
+
+
+def check_secret(secret, host, insecure=False):
+    """Raises a ValueError, if the connections to or from the host would
+    not be authenticated, i.e. anyone reaching the port could run code"""
+    if not secret and not insecure and not is_loopback(host):
+        raise ValueError("A secret is required to use the address '%s', "
+                "which is not a loopback one: without it, anyone who can "
+                "connect could run code on the worker" % host)
+
+
+def parse_address(address):
+    """Converts 'host:port' to a (host, port) tuple"""
+    if isinstance(address, basestring):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return tuple(address)
+
+
+# Worker side
+
+class RunQueueHandler(QueueHandler):
+    """Sends the records of a remote run to the worker's queue, marked with
+    the id of the run"""
+    def __init__(self, queue, run_id):
+        QueueHandler.__init__(self, queue)
+        self.run_id = run_id
+
+    def prepare(self, record):
+        record = QueueHandler.prepare(self, record)
+        record.run_id = self.run_id
+        return record
+
+
+class OutputsQueue(object):
+    """Passed to 'run_pipeline' instead of a queue, so that the outputs are
+    sent over the worker's queue, in order with the events"""
+    def __init__(self, queue, run_id):
+        super(OutputsQueue, self).__init__()
+        self.queue = queue
+        self.run_id = run_id
+
+    def put(self, outputs):
+        self.queue.put(('outputs', self.run_id, outputs))
+
+
+def remote_run_main(run_id, task, queue, sockets=()):
+    """Runs a pipeline, received from the coordinator, in a forked process.
+    The inherited 'sockets' are closed, so that the coordinators notice, if
+    the worker itself dies"""
+    for sock in sockets:
+        sock.close()
+
+    logger_name, data, retained, log_level, units = task
+
+    # the pipeline's logger may have handlers, inherited from the worker,
+    # and its records are not printed by the worker
+    logger = logging.getLogger(logger_name)
+    del logger.handlers[:]
+    logger.addHandler(RunQueueHandler(queue, run_id))
+    logger.setLevel(log_level)
+    logger.propagate = False
+
+    try:
+        ppl = pickle.loads(data)
+        if retained is not None:
+            ppl.import_outputs(retained)
+    except:
+        # the coordinator waits for the outputs
+        if retained is not None:
+            queue.put(('outputs', run_id, None))
+        logger.info(EventTool.create_status_msg(Status.FAILED))
+        logger.error(traceback.format_exc())
+        return
+
+    output_queue = retained is not None and OutputsQueue(queue, run_id) \
+            or None
+    run_pipeline(ppl, output_queue, units)
+
+
+class WorkerConnection(object):
+    """A connection of a coordinator to the 'WorkerServer'. The pipelines
+    are run in forked processes, and their events are forwarded to the
+    coordinator by a separate thread"""
+    def __init__(self, server, sock):
+        super(WorkerConnection, self).__init__()
+        self.server = server
+        self.sock = sock
+        self.queue = mp.Queue()
+        # {run_id: mp.Process}
+        self.runs = {}
+        # runs, stopped by the coordinator, which doesn't expect anything
+        # from them any more
+        self.stopped = set()
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def send(self, msg):
+        """Sends a message. Returns False, if the connection is broken"""
+        with self._send_lock:
+            try:
+                send_message(self.sock, msg)
+            except (socket.error, socket.timeout):
+                return False
+        return True
+
+    def serve(self):
+        """Receives the commands of the coordinator, until it disconnects"""
+        try:
+            self.sock.settimeout(self.server.handshake_timeout)
+            ok = authenticate(self.sock, self.server.secret, 'worker')
+            self.sock.settimeout(None)
+        except (socket.error, socket.timeout):
+            ok = False
+        if not ok:
+            logging.warning("The coordinator has failed to authenticate")
+            self.close()
+            return
+
+        self.send(('hello', {
+            'version': PROTOCOL_VERSION,
+            'slots': self.server.slots,
+            'heartbeat': self.server.heartbeat,
+            }))
+
+        forwarder = threading.Thread(target=self.forward_events)
+        forwarder.daemon = True
+        forwarder.start()
+
+        heartbeat = threading.Thread(target=self.send_heartbeats)
+        heartbeat.daemon = True
+        heartbeat.start()
+
+        try:
+            while True:
+                try:
+                    msg = recv_message(self.sock)
+                except (socket.error, EOFError):
+                    msg = None
+                if msg is None:
+                    break
+
+                if msg[0] == 'run':
+                    self.start_run(msg[1], msg[2:])
+                elif msg[0] == 'stop':
+                    self.stop_run(msg[1])
+        finally:
+            self.close()
+
+    def start_run(self, run_id, task):
+        p = mp.Process(target=remote_run_main, args=(run_id, task,
+            self.queue, self.server.get_sockets()))
+        with self._lock:
+            p.start()
+            self.runs[run_id] = p
+
+        logging.info("Run %s of '%s' started" % (run_id, task[0]))
+
+        # task[2]: the retained outputs, which are sent back
+        watcher = threading.Thread(target=self.watch_run,
+                args=(run_id, task[0], p, task[2] is not None))
+        watcher.daemon = True
+        watcher.start()
+
+    def watch_run(self, run_id, logger_name, p, sends_outputs=False):
+        """Reports a failure, if the process of a run has crashed. If the
+        outputs of the run were expected, None is sent instead of them, so
+        that the coordinator doesn't wait for them"""
+        p.join()
+        with self._lock:
+            del self.runs[run_id]
+            stopped = run_id in self.stopped
+            self.stopped.discard(run_id)
+
+        logging.info("Run %s of '%s' %s" % (run_id, logger_name,
+            stopped and "stopped" or "exited with code %s" % p.exitcode))
+
+        if p.exitcode != 0 and not stopped and not self.closed:
+            if sends_outputs:
+                self.queue.put(('outputs', run_id, None))
+            for levelno, msg in (
+                    (logging.ERROR, "The process running the pipeline has "
+                        "exited with code %s" % p.exitcode),
+                    (logging.INFO, EventTool.create_status_msg(
+                        Status.FAILED))):
+                self.queue.put(logging.makeLogRecord({'name': logger_name,
+                    'msg': msg, 'levelno': levelno,
+                    'levelname': logging.getLevelName(levelno),
+                    'run_id': run_id}))
+
+    def stop_run(self, run_id):
+        with self._lock:
+            p = self.runs.get(run_id)
+            if p is None:
+                return
+            self.stopped.add(run_id)
+        p.terminate()
+
+    def forward_events(self):
+        """Sends the events and the outputs of the runs to the coordinator"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            if isinstance(item, logging.LogRecord):
+                run_id = item.__dict__.pop('run_id', None)
+                if run_id in self.stopped:
+                    continue
+                msg = ('event', run_id, item.__dict__)
+            else:
+                msg = item
+
+            if not self.send(msg):
+                return
+
+    def send_heartbeats(self):
+        while not self.closed:
+            time.sleep(self.server.heartbeat)
+            if not self.closed and not self.send(('ping',)):
+                return
+
+    def close(self):
+        """Terminates the runs of the disconnected coordinator"""
+        self.closed = True
+        with self._lock:
+            processes = self.runs.values()
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+
+        self.queue.put(None)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+
+class WorkerServer(object):
+    """
+    Worker daemon, running the pipelines sent by the coordinators
+
+    Parameters
+    ----------
+    address : tuple, optional
+        (host, port) to listen on. Port 0 picks a free one (see 'address'
+        after 'bind')
+    slots : int, optional
+        number of the pipelines the coordinators may run here at the same
+        time. Defaults to the number of CPUs
+    heartbeat : float, optional
+        interval (in seconds) between the keep-alive messages
+    secret : str, optional
+        secret, shared with the coordinators (see the handshake in the
+        module's docstring). Required, unless the address is a loopback one
+    insecure : bool, optional
+        allows listening on any address without a secret
+    """
+
+    # time (in seconds) a coordinator has to complete the handshake
+    handshake_timeout = 10
+
+    def __init__(self, address=('127.0.0.1', 5100), slots=None,
+            heartbeat=2.0, secret=None, insecure=False):
+        super(WorkerServer, self).__init__()
+        self.address = parse_address(address)
+        self.slots = slots or mp.cpu_count()
+        self.heartbeat = heartbeat
+        self.secret = secret
+        self.insecure = insecure
+        self.sock = None
+        self.connections = []
+
+    def bind(self):
+        check_secret(self.secret, self.address[0], self.insecure)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen(5)
+        self.address = self.sock.getsockname()
+
+    def get_sockets(self):
+        """Returns the listening socket and the sockets of the
+        connections"""
+        return [self.sock] + [conn.sock for conn in self.connections]
+
+    def serve_forever(self):
+        """Accepts the coordinators, serving each in a separate thread"""
+        if self.sock is None:
+            self.bind()
+        logging.info("Worker listening on %s:%s with %d slots"
+                % (self.address[0], self.address[1], self.slots))
+        if not self.secret and not is_loopback(self.address[0]):
+            logging.warning("No secret is set (--insecure), anyone who can "
+                    "connect to the worker can run code on it")
+
+        try:
+            while True:
+                try:
+                    sock, peer = self.sock.accept()
+                except socket.error:
+                    if self.sock is None:
+                        # shut down from another thread
+                        return
+                    raise
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                logging.info("Coordinator %s:%s connected" % peer)
+
+                conn = WorkerConnection(self, sock)
+                self.connections.append(conn)
+                thread = threading.Thread(target=self._serve, args=(conn,
+                    peer))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.shutdown()
+
+    def _serve(self, conn, peer):
+        try:
+            conn.serve()
+        finally:
+            self.connections.remove(conn)
+            logging.info("Coordinator %s:%s disconnected" % peer)
+
+    def shutdown(self):
+        for conn in list(self.connections):
+            conn.close()
+        if self.sock is not None:
+            sock, self.sock = self.sock, None
+            try:
+                # wakes up 'accept' in 'serve_forever'
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            sock.close()
+
+
+# Coordinator side
+
+class RemoteRun(object):
+    """A pipeline run on a 'RemoteWorker'. Stands for the process of the run
+    in 'PipelineManager'"""
+    def __init__(self, worker, run_id, name):
+        super(RemoteRun, self).__init__()
+        self.worker = worker
+        self.run_id = run_id
+        self.name = name
+        # retained outputs, sent back by the worker
+        self.outputs = Queue.Queue()
+
+    def terminate(self):
+        """Stops the run. Nothing is received from it afterwards"""
+        self.release()
+        self.worker.send(('stop', self.run_id))
+
+    def release(self):
+        """Forgets the run, which has stopped"""
+        self.worker.release(self)
+
+
+class RemoteWorker(object):
+    """
+    Connection of the coordinator to a 'WorkerServer'
+
+    Parameters
+    ----------
+    address : tuple or str
+        (host, port) or 'host:port' of the worker
+    event_queue : mp.Queue
+        queue of the 'LogEventServer' to put the received events to
+    on_lost : callable, optional
+        called with every RemoteRun, which was running on the worker, when
+        the connection is lost
+    secret : str, optional
+        secret, shared with the worker. Required, unless the worker's address
+        is a loopback one
+    insecure : bool, optional
+        allows connecting to any worker without a secret
+    """
+
+    def __init__(self, address, event_queue, on_lost=None, secret=None,
+            insecure=False):
+        super(RemoteWorker, self).__init__()
+        self.address = parse_address(address)
+        check_secret(secret, self.address[0], insecure)
+        self.event_queue = event_queue
+        self.on_lost = on_lost
+        self.secret = secret
+        self.slots = 0
+        self.sock = None
+        # time of the last connection attempt
+        self.last_attempt = None
+        # {run_id: RemoteRun}
+        self.runs = {}
+        self._run_counter = 0
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def __str__(self):
+        return "%s:%s" % self.address
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    @property
+    def free_slots(self):
+        return self.connected and self.slots - len(self.runs) or 0
+
+    def connect(self, timeout=5):
+        """Connects to the worker. Returns False, if it is not reachable"""
+        self.last_attempt = time.time()
+        try:
+            sock = socket.create_connection(self.address, timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if not authenticate(sock, self.secret, 'coordinator'):
+                logging.warning("Worker %s has failed to authenticate, "
+                        "check the secret" % self)
+                sock.close()
+                return False
+            hello = recv_message(sock)
+        except (socket.error, socket.timeout, EOFError) as e:
+            logging.warning("Can't connect to the worker %s: %s" % (self, e))
+            return False
+
+        if hello is None or hello[0] != 'hello' or \
+                hello[1]['version'] != PROTOCOL_VERSION:
+            logging.warning("Worker %s speaks a different protocol" % self)
+            sock.close()
+            return False
+
+        # silent for 3 heartbeats means gone
+        sock.settimeout(3 * hello[1]['heartbeat'])
+        self.slots = hello[1]['slots']
+        self.sock = sock
+
+        reader = threading.Thread(target=self.receive, args=(sock,))
+        reader.daemon = True
+        reader.start()
+        return True
+
+    def send(self, msg):
+        sock = self.sock
+        if sock is None:
+            return False
+        with self._send_lock:
+            try:
+                send_message(sock, msg)
+            except (socket.error, socket.timeout):
+                return False
+        return True
+
+    def submit(self, ppl, export_outputs=False, units=None):
+        """
+        Runs the pipeline on the worker
+
+        Parameters
+        ----------
+        ppl : GenericPipeline
+            pipeline to run. Has to be picklable
+        export_outputs : bool, optional
+            whether the retained outputs of the pipeline are sent to the
+            worker and back
+        units : set, optional
+            run only these units (a subgraph, including all of their
+            ancestors) instead of the whole pipeline
+
+        Returns
+        -------
+        run : RemoteRun or None
+            None, if the pipeline can't be sent
+        """
+
+        data = pickle.dumps(ppl, pickle.HIGHEST_PROTOCOL)
+        retained = export_outputs and ppl.export_outputs(retained=True) \
+                or None
+        log_level = ppl.logger.getEffectiveLevel()
+
+        with self._lock:
+            self._run_counter += 1
+            run = RemoteRun(self, self._run_counter, ppl.name)
+            self.runs[run.run_id] = run
+
+        if not self.send(('run', run.run_id, ppl.logger.name, data, retained,
+                log_level, units)):
+            self.release(run)
+            return None
+
+        return run
+
+    def release(self, run):
+        with self._lock:
+            self.runs.pop(run.run_id, None)
+
+    def receive(self, sock):
+        """Receives the messages of the worker, until the connection is
+        lost"""
+        while True:
+            try:
+                msg = recv_message(sock)
+            except (socket.error, socket.timeout, EOFError):
+                msg = None
+            if msg is None:
+                break
+
+            if msg[0] == 'event':
+                with self._lock:
+                    known = self.runs.has_key(msg[1])
+                # the run might have been stopped in the meantime
+                if known:
+                    self.event_queue.put(logging.makeLogRecord(msg[2]))
+            elif msg[0] == 'outputs':
+                with self._lock:
+                    run = self.runs.get(msg[1])
+                if run is not None:
+                    run.outputs.put(msg[2])
+
+        self.disconnect(sock)
+
+    def disconnect(self, sock=None, lost=True):
+        """Closes the connection (if it's still 'sock', when given), and fails
+        the runs of the worker"""
+        with self._lock:
+            if self.sock is None or (sock is not None and sock is not
+                    self.sock):
+                return
+            sock, self.sock = self.sock, None
+            runs, self.runs = self.runs.values(), {}
+
+        if lost:
+            logging.warning("Lost the connection to the worker %s" % self)
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+        if self.on_lost is not None:
+            for run in runs:
+                self.on_lost(run)
+
+
+class RemoteCluster(object):
+    """
+    The workers of a coordinator
+
+    Parameters
+    ----------
+    addresses : list
+        (host, port) tuples or 'host:port' strings of the workers
+    event_queue : mp.Queue
+        queue of the 'LogEventServer'
+    on_lost : callable, optional
+        see 'RemoteWorker'
+    retry_interval : float, optional
+        time (in seconds) between the attempts to reconnect to an
+        unreachable worker
+    secret, insecure : optional
+        see 'RemoteWorker'
+    on_connected : callable, optional
+        called with the RemoteWorker, once it is connected (its slots become
+        available). Called from the connecting thread
+
+    The workers are connected in a background thread, so that an
+    unreachable one doesn't block the caller. Runs are only submitted to
+    the connected workers.
+    """
+
+    def __init__(self, addresses, event_queue, on_lost=None,
+            retry_interval=10, secret=None, on_connected=None,
+            insecure=False):
+        super(RemoteCluster, self).__init__()
+        self.retry_interval = retry_interval
+        self.on_connected = on_connected
+        self.workers = [RemoteWorker(address, event_queue, on_lost, secret,
+            insecure) for address in addresses]
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        connector = threading.Thread(target=self.connect_workers)
+        connector.daemon = True
+        connector.start()
+
+    def connect_workers(self):
+        """Connects to the workers, and reconnects to the unreachable ones
+        every 'retry_interval' seconds, until the cluster is closed"""
+        while not self._closed.is_set():
+            for worker in self.workers:
+                if worker.connected or self._closed.is_set():
+                    continue
+                if worker.connect() and self.on_connected is not None:
+                    try:
+                        self.on_connected(worker)
+                    except Exception:
+                        logging.error("Error in the connection callback:\n%s"
+                                % traceback.format_exc())
+            self._closed.wait(self.retry_interval)
+
+    @property
+    def slots(self):
+        """Total number of the slots of the connected workers"""
+        return sum(worker.slots for worker in self.workers if worker.connected)
+
+    def submit(self, ppl, export_outputs=False, units=None):
+        """Runs the pipeline on the worker with the most free slots (see
+        'RemoteWorker.submit'). Returns None, if all workers are busy or
+        unreachable"""
+        with self._lock:
+            workers = [worker for worker in self.workers
+                    if worker.free_slots > 0]
+            if not workers:
+                return None
+            worker = max(workers, key=lambda worker: worker.free_slots)
+
+            return worker.submit(ppl, export_outputs, units)
+
+    def close(self):
+        self._closed.set()
+        for worker in self.workers:
+            worker.disconnect(lost=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worker daemon, running "
+            "the pipelines of remote earlPipeline servers")
+    parser.add_argument('--host', default='127.0.0.1',
+            help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=5100,
+            help="port to listen on (default: %(default)s)")
+    parser.add_argument('--slots', type=int,
+            help="number of pipelines to run at the same time (default: the "
+            "number of CPUs)")
+    parser.add_argument('--heartbeat', type=float, default=2.0,
+            help="interval between the keep-alive messages in seconds "
+            "(default: %(default)s)")
+    parser.add_argument('--import', dest='modules', action='append',
+            default=[], metavar='MODULE',
+            help="module to import in advance, e.g. the backend")
+    parser.add_argument('--secret', default=os.environ.get(
+            'EARLPIPELINE_SECRET'),
+            help="secret, shared with the coordinators (default: the "
+            "EARLPIPELINE_SECRET environment variable)")
+    parser.add_argument('--insecure', action='store_true',
+            help="listen on a non-loopback address without a secret. "
+            "Anyone who can connect will be able to run code on this host")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+            format="%(asctime)s %(levelname)s %(message)s")
+
+    for module in args.modules:
+        importlib.import_module(module)
+
+    server = WorkerServer((args.host, args.port), args.slots, args.heartbeat,
+            args.secret, args.insecure)
+    try:
+        server.bind()
+    except ValueError as e:
+        parser.error("%s. Set --secret, or use --insecure" % e)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,6 @@
 import os
+import sys
+import threading
 
 import tornado.escape
 import tornado.ioloop
@@ -11,7 +13,7 @@ from tools import PipelineManager, WebSocketLogHandler, LogEventServer
 from tornado.options import define, options, parse_command_line
 
 import logging
-import pickle
+import json
 
 backend = None
 pipelines = None
@@ -22,6 +24,64 @@ def find_by_attr(seq, attr, value):
     except:
         raise KeyError('%s not found' % value)
 
+def create_name(ppl, unit_cls, counter, taken=()):
+    """Create unit name. If the passed unit class contains the field
+    'instance_name_template', it is appended with the number of the
+    instances of the same type, already present in the pipeline.
+    Otherwise, the lower cased class name is used as a template for
+    instance naming. Names in 'taken' are avoided as well."""
+
+    # default name
+    name_template = unit_cls.__name__.lower()
+
+    # change, if the field is specified
+    if hasattr(unit_cls, 'instance_name_template'):
+        if isinstance(unit_cls.instance_name_template, basestring) and\
+            unit_cls.instance_name_template:
+            name_template = unit_cls.instance_name_template
+
+    name = name_template + str(counter)
+
+    try:
+        find_by_attr(ppl.units, 'name', name)
+    except: # no such name
+        if name in taken: # but it is reserved
+            name = create_name(ppl, unit_cls, counter+1, taken)
+    else: # if name exists, increment counter
+        name = create_name(ppl, unit_cls, counter+1, taken)
+    finally:
+        return name
+
+def run_in_thread(func, *args):
+    """Calls the function in a separate thread, so that the IOLoop is not
+    blocked. Returns a Future of the result"""
+    future = tornado.concurrent.Future()
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    def target():
+        try:
+            result = func(*args)
+        except Exception:
+            io_loop.add_callback(future.set_exc_info, sys.exc_info())
+        else:
+            io_loop.add_callback(future.set_result, result)
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    return future
+
+def to_json_value(value):
+    """Converts the value to a JSON-serializable one: arrays to lists, and
+    anything else, which is not serializable, to its repr"""
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return repr(value)
+    return value
+
 ## Server RESTfull API
 
 class IndexHandler(tornado.web.RequestHandler):
@@ -30,9 +90,10 @@ class IndexHandler(tornado.web.RequestHandler):
 
 class PipelinesHandler(tornado.web.RequestHandler):
     def get(self):
-        pplmodels = [ppl.to_dict() for ppl in pipelines]
+        pplmodels = pipelines.get_summaries()
         self.write({'pipelines':pplmodels})
 
+    @tornado.gen.coroutine
     def post(self):
         req = tornado.escape.json_decode(self.request.body)['pipeline']
         name = req['id']
@@ -40,7 +101,10 @@ class PipelinesHandler(tornado.web.RequestHandler):
         # if cloning
         if req['server_flag'] == 'clone':
             src_ppl = pipelines.get_pipeline(req['old_name']);
-            ppl = self.piccopy(src_ppl)
+            # the source is serialized here, as it is modified on the IOLoop,
+            # but the copy is created in the background
+            data = pipelines.dump_pipeline(src_ppl)
+            ppl = yield run_in_thread(pipelines.parse_pipeline, data)
             ppl.name = name
 
         # if just creating new
@@ -51,14 +115,6 @@ class PipelinesHandler(tornado.web.RequestHandler):
 
         self.write({'pipeline': ppl.to_dict()})
 
-    def piccopy(self, ppl):
-        """
-        Use pickle to create a copy of the given pipelines. Pickle is used
-        here, because it knows how to handle some of the special fields of the
-        Pipeline class"""
-        new_ppl = pickle.loads(pickle.dumps(ppl))
-        return new_ppl
-
 
 class PipelineHandler(tornado.web.RequestHandler):
     def get(self, pid):
@@ -76,12 +132,24 @@ class PipelineHandler(tornado.web.RequestHandler):
             ppl = pipelines.get_pipeline(new_name)
             self.write({'pipeline': ppl.to_dict()})
 
+        elif req['server_flag'] == 'priority':
+            pipelines.set_priority(pid, req['priority'])
+            ppl = pipelines.get_pipeline(pid)
+            self.write({'pipeline': ppl.to_dict()})
+
     def delete(self, pid):
         pipelines.remove_pipeline(pid)
         print "deleted %s" % pid
         self.write({})
 
 
+class RunQueueHandler(tornado.web.RequestHandler):
+    def get(self):
+        """Responds with the state of the run queue (see
+        'PipelineManager.get_queue_stats')"""
+        self.write({'queue': pipelines.get_queue_stats()})
+
+
 class MetaUnitsHandler(tornado.web.RequestHandler):
     def get(self):
         munits = [munit.cls_to_dict() for munit in backend.get_unit_types()]
@@ -98,38 +166,12 @@ class UnitsHandler(tornado.web.RequestHandler):
         ppl = pipelines.get_pipeline(pid)
         req = tornado.escape.json_decode(self.request.body)['unit']
 
-        def create_name(ppl, unit_cls, counter):
-            """Create unit name. If the passed unit class contains the field
-            'instance_name_template', it is appended with the number of the
-            instances of the same type, already present in the pipeline.
-            Otherwise, the lower cased class name is used as a template for
-            instance naming."""
-
-            # default name
-            name_template = unit_cls.__name__.lower()
-
-            # change, if the field is specified
-            if hasattr(unit_cls, 'instance_name_template'):
-                if isinstance(unit_cls.instance_name_template, basestring) and\
-                    unit_cls.instance_name_template:
-                    name_template = unit_cls.instance_name_template
-
-            name = name_template + str(counter)
-
-            try:
-                find_by_attr(ppl.units, 'name', name)
-            except: # no such name
-                pass
-            else: # if name exists, increment counter
-                name = create_name(ppl, unit_cls, counter+1)
-            finally:
-                return name
-
         cls = find_by_attr(backend.get_unit_types(), '__name__', req['type'])
         unit = cls()
 
         name = create_name(ppl, cls, len(ppl.units))
         ppl.add_unit(unit, name)
+        pipelines.mark_modified(pid)
         
         self.write({'unit': unit.to_dict()})
 
@@ -149,12 +191,14 @@ class UnitHandler(tornado.web.RequestHandler):
         for par_name, parameter in req['parameters'].items():
             type_func = par_info[par_name]['before_write']
             unit.set_parameter(par_name, type_func(parameter['value']))
+        pipelines.mark_modified(pid)
 
         self.write({'unit': unit.to_dict()})
 
     def delete(self, pid, uid):
         ppl = pipelines.get_pipeline(pid)
         ppl.remove_unit(uid)
+        pipelines.mark_modified(pid)
         self.write({})
 
 
@@ -169,17 +213,178 @@ class EdgesHandler(tornado.web.RequestHandler):
         req = tornado.escape.json_decode(self.request.body)['edge']
 
         edge = ppl.connect(req['src'], req['srcPort'], req['dst'], req['dstPort'])
+        pipelines.mark_modified(pid)
         self.write({'edge': edge.to_dict()})
         
 
+class BatchHandler(tornado.web.RequestHandler):
+    def post(self, pid):
+        """Applies a list of graph operations atomically. The request is of
+        the form {'operations': [...]}, where each operation is one of:
+
+        {'op': 'add_unit', 'type': unit type, 'id': optional name,
+            'top': optional, 'left': optional}
+        {'op': 'remove_unit', 'id': unit name}
+        {'op': 'connect' or 'disconnect', 'src', 'srcPort', 'dst', 'dstPort'}
+        {'op': 'update_unit', 'id': unit name, 'top': optional,
+            'left': optional, 'parameters': optional {name: {'value': value}}}
+
+        Responds with the updated pipeline, its units and edges"""
+
+        ppl = pipelines.get_pipeline(pid)
+        req = tornado.escape.json_decode(self.request.body)['operations']
+
+        unit_types = backend.get_unit_types()
+        existing = set(unit.name for unit in ppl.units)
+
+        # units created by this batch
+        new_units = {}
+        def get_unit(name):
+            if new_units.has_key(name):
+                return new_units[name]
+            return ppl.get_unit(name)
+
+        operations = []
+        for item in req:
+            op = item['op']
+
+            if op == 'add_unit':
+                cls = find_by_attr(unit_types, '__name__', item['type'])
+                name = item.get('id') or create_name(ppl, cls,
+                        len(existing), existing)
+                existing.add(name)
+                new_units[name] = cls()
+                operations.append({'op': 'add_unit', 'unit': new_units[name],
+                    'name': name})
+                if item.has_key('top') and item.has_key('left'):
+                    operations.append({'op': 'set_position', 'unit': name,
+                        'top': item['top'], 'left': item['left']})
+
+            elif op == 'remove_unit':
+                existing.discard(item['id'])
+                operations.append({'op': 'remove_unit', 'name': item['id']})
+
+            elif op in ('connect', 'disconnect'):
+                operations.append({'op': op, 'src': item['src'],
+                    'srcPort': item['srcPort'], 'dst': item['dst'],
+                    'dstPort': item['dstPort']})
+
+            elif op == 'update_unit':
+                name = item['id']
+                if item.has_key('top') and item.has_key('left'):
+                    operations.append({'op': 'set_position', 'unit': name,
+                        'top': item['top'], 'left': item['left']})
+
+                parameters = item.get('parameters', {})
+                if parameters:
+                    par_info = get_unit(name).parameters_info
+                for par_name, parameter in parameters.items():
+                    type_func = par_info[par_name]['before_write']
+                    operations.append({'op': 'set_parameter', 'unit': name,
+                        'name': par_name,
+                        'value': type_func(parameter['value'])})
+
+            else:
+                raise ValueError("Unknown batch operation: %s" % op)
+
+        ppl.apply_batch(operations)
+        pipelines.mark_modified(pid)
+
+        self.write({
+            'pipeline': ppl.to_dict(),
+            'units': [unit.to_dict() for unit in ppl.units],
+            'edges': [edge.to_dict() for edge in ppl.edges],
+            })
+
+
 class EdgeHandler(tornado.web.RequestHandler):
     def delete(self, pid, eid):
         ppl = pipelines.get_pipeline(pid)
         edge = find_by_attr(ppl.edges, 'id', eid)
         ppl.disconnect(edge.src, edge.srcPort, edge.dst, edge.dstPort)
+        pipelines.mark_modified(pid)
         self.write({})
 
 
+class PipelineLogHandler(tornado.web.RequestHandler):
+    def get(self, pid):
+        """Responds with a page of the pipeline's log. Query arguments
+        'after' (a cursor returned by the previous request) and 'limit' (the
+        page size) are optional"""
+        ppl = pipelines.get_pipeline(pid)
+        after = int(self.get_argument('after', 0))
+        limit = self.get_argument('limit', None)
+        limit = int(limit) if limit is not None else None
+
+        entries, cursor, first = ppl._log.read(after, limit)
+        self.write({'log': entries, 'cursor': cursor, 'first': first})
+
+
+class PipelineProfileHandler(tornado.web.RequestHandler):
+    def get(self, pid):
+        """Responds with the execution statistics of the units during the
+        last run of the pipeline. The optional query argument 'sort' is the
+        field to sort the units by (descending), 'wall_time' by default.
+        'sort=none' keeps the order the units have finished in"""
+        ppl = pipelines.get_pipeline(pid)
+        sort_by = self.get_argument('sort', 'wall_time')
+        if sort_by == 'none':
+            sort_by = None
+
+        self.write({'profile': ppl._profile.to_dict(sort_by)})
+
+
+class SweepHandler(tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def post(self, pid):
+        """Runs the pipeline for every combination of the parameter values
+        (see 'sweep.py'). The request is of the form
+
+        {'grid': {'unit.parameter': [values]}} or
+        {'variants': [{'unit.parameter': value}, ...]},
+
+        with optional 'outputs' (a list of 'unit.port' paths) and
+        'max_workers'. Responds with {'sweep': table}, where the table is
+        described in 'SweepResult.to_dict'"""
+
+        src_ppl = pipelines.get_pipeline(pid)
+        req = tornado.escape.json_decode(self.request.body)
+
+        def convert(path, value):
+            unit_name, par_name = src_ppl.split_path(path)
+            par_info = src_ppl.get_unit(unit_name).parameters_info
+            return par_info[par_name]['before_write'](value)
+
+        grid = req.get('grid')
+        if grid is not None:
+            grid = dict((path, [convert(path, value) for value in values])
+                    for path, values in grid.items())
+        variants = req.get('variants')
+        if variants is not None:
+            variants = [dict((path, convert(path, value))
+                for path, value in variant.items()) for variant in variants]
+
+        # run like the pipeline itself, in a process of its own
+        future = tornado.concurrent.Future()
+        io_loop = tornado.ioloop.IOLoop.current()
+        def on_done(ok, result):
+            io_loop.add_callback(future.set_result, (ok, result))
+
+        pipelines.start_sweep(pid, on_done, grid, variants,
+                req.get('outputs'), req.get('max_workers'))
+
+        ok, result = yield future
+        if not ok:
+            raise Exception(result)
+
+        table = result.to_dict()
+        for row in table['rows']:
+            if row['outputs'] is not None:
+                row['outputs'] = dict((path, to_json_value(data))
+                        for path, data in row['outputs'].items())
+        self.write({'sweep': table})
+
+
 class PipelinesEventHandler(tornado.websocket.WebSocketHandler):
     def open(self):
         # add to clients
@@ -187,7 +392,10 @@ class PipelinesEventHandler(tornado.websocket.WebSocketHandler):
 
         self.stream.set_nodelay(True)
 
-        self.log_handler = WebSocketLogHandler(self)
+        # events are sent as JSON, or as msgpack with '?format=msgpack'
+        binary = self.get_argument("format", "json") == "msgpack"
+        self.log_handler = WebSocketLogHandler(self,
+                tornado.ioloop.IOLoop.current(), binary=binary)
         pipelines.event_server.add_client(self.id, self.log_handler)
 
         print "Client %s has connected" % self.id
@@ -210,6 +418,7 @@ class PipelineEventHandler(PipelinesEventHandler):
             print "stopping %s" % self.ppl.name
             pipelines.stop_pipeline(self.ppl.name)
         elif message == "SAVE":
+            # the file is written in the background
             print "saving %s" % self.ppl.name
             pipelines.save_pipeline(self.ppl.name)
         else:
@@ -219,10 +428,15 @@ class PipelineEventHandler(PipelinesEventHandler):
 handlers = [
     (r'/', IndexHandler),
     (r'/api/pipelines', PipelinesHandler),
+    (r'/api/queue', RunQueueHandler),
     (r'/api/pipelines/event_bus', PipelinesEventHandler),
     (r'/api/pipelines/([^/]*)', PipelineHandler),
     (r'/api/pipelines/([^/]*)/units', UnitsHandler),
     (r'/api/pipelines/([^/]*)/edges', EdgesHandler),
+    (r'/api/pipelines/([^/]*)/batch', BatchHandler),
+    (r'/api/pipelines/([^/]*)/log', PipelineLogHandler),
+    (r'/api/pipelines/([^/]*)/profile', PipelineProfileHandler),
+    (r'/api/pipelines/([^/]*)/sweep', SweepHandler),
     (r'/api/pipelines/([^/]*)/units/([^/]*)', UnitHandler),
     (r'/api/pipelines/([^/]*)/edges/([^/]*)', EdgeHandler),
     (r'/api/metaUnits', MetaUnitsHandler),
@@ -232,7 +446,10 @@ handlers = [
 
 # Convenience python API
 
-def run(port=5000, address='', debug=True, pipeline_folder='pipelines'):
+def run(port=5000, address='', debug=True, pipeline_folder='pipelines',
+        workers=2, max_worker_runs=100, log_capacity=1000,
+        max_loaded_pipelines=100, autosave_interval=None, max_running=None,
+        remote_workers=None, remote_secret=None):
     if not backend:
         raise Exception("Cannot start the server: backend is not set. Use 'set_backend' method to set the backend before running the server")
 
@@ -248,7 +465,16 @@ def run(port=5000, address='', debug=True, pipeline_folder='pipelines'):
     event_server = LogEventServer()
 
     global pipelines
-    pipelines = PipelineManager(event_server, backend, pipeline_folder)
+    pipelines = PipelineManager(event_server, backend, pipeline_folder,
+            workers, max_worker_runs, log_capacity, max_loaded_pipelines,
+            max_running=max_running, remote_workers=remote_workers,
+            remote_secret=remote_secret)
+
+    # periodically save the pipelines, which have changed
+    if autosave_interval:
+        autosave = tornado.ioloop.PeriodicCallback(pipelines.autosave,
+                autosave_interval * 1000)
+        autosave.start()
 
     logging.info('starting server')
 
@@ -105,6 +105,13 @@ App.PipelineRoute = Em.Route.extend({
         App.set('currentPipeline', pplModel);
 
         pplModel.reload();
+
+        // the log is not a part of the pipeline model, it is loaded
+        // separately
+        $.getJSON(App.util.create_pipeline_url(pplModel.get('id'), 'log'))
+        .then(function(data) {
+            pplController.set('log', data.log);
+        });
         
         // set up controllers with proper models
         this.controllerFor('metaUnits').set('model', this.store.find('metaUnit'));
@@ -162,6 +169,7 @@ App.util = {
         FINISHED: 1,
         RUNNING: 2,
         FAILED: 3,
+        QUEUED: 4,
     },
 
     /* Given an 'edge' data object, looks up the corresponding graphical
@@ -295,7 +303,12 @@ App.util = {
             controller.set("event_bus", ws);
         };
         ws.onmessage = function (evt) {
-            controller.send("handle_server_event", evt.data);
+            var event = $.parseJSON(evt.data);
+
+            // the server sends events in batches
+            var events = event.type == 'batch' ? event.data : [event];
+            for (var i = 0; i < events.length; i++)
+                controller.send("handle_server_event", events[i]);
         };
         ws.onclose = function(evt) {
             if(!evt.wasClean)
@@ -1,8 +1,8 @@
 App.PipelinesController = Ember.ArrayController.extend({
     actions: {
-        /* Handles a server event, sent via the websocket. The message is
-         * supposed to be a JSON-parsable string, of the object of the
-         * following forms:
+        /* Handles a server event, sent via the websocket (and unpacked from
+         * a batch by 'App.util.bind_websocket'). The event is an object of
+         * the following forms:
          * 
          * For status update:
          * {
@@ -18,9 +18,7 @@ App.PipelinesController = Ember.ArrayController.extend({
          * Messages of type 'status' will be interpreted as a signal to change
          * running status of a corresponding pipeline. Other messages
          * will be ignored */
-        handle_server_event: function(data) {
-            var event = $.parseJSON(data);
-            
+        handle_server_event: function(event) {
             // handle the event
             switch(event.type) {
                 case 'status':
@@ -57,7 +55,9 @@ App.Runnable = Ember.Mixin.create({
             this.set('isRunning', false);
             this.set('hasFailed', false);
         }
-        else if (this.get('status') == App.util.status_codes.RUNNING) {
+        else if (this.get('status') == App.util.status_codes.RUNNING ||
+                this.get('status') == App.util.status_codes.QUEUED) {
+            // a queued pipeline can be stopped as well
             this.set('isRunning', true);
             this.set('hasFailed', false);
         }
@@ -342,9 +342,9 @@ App.PipelineController = Ember.ObjectController.extend(App.Runnable, {
             dialog.open();
         },
 
-        /* Handles a server event, sent via the websocket. The message is
-         * supposed to be a JSON-parsable string, of the object of the
-         * following forms:
+        /* Handles a server event, sent via the websocket (and unpacked from
+         * a batch by 'App.util.bind_websocket'). The event is an object of
+         * the following forms:
          * 
          * For log msg:
          * {
@@ -375,9 +375,7 @@ App.PipelineController = Ember.ObjectController.extend(App.Runnable, {
          * running status of a corresponding unit or a pipeline. Other messages
          * will be treated as log messages and will be passed to the results
          * stream */
-        handle_server_event: function(data) {
-            var event = $.parseJSON(data);
-            
+        handle_server_event: function(event) {
             // handle the event
             switch(event.type) {
                 case 'status':
@@ -386,6 +384,9 @@ App.PipelineController = Ember.ObjectController.extend(App.Runnable, {
                 case 'log':
                     this.handle_log_event(event.data);
                     break;
+                case 'profile':
+                    // served by the 'profile' endpoint
+                    break;
                 default:
                     console.log("Unknown event type " + event.type + " caught:")
                     console.log(event.data)
@@ -451,6 +452,10 @@ App.PipelineController = Ember.ObjectController.extend(App.Runnable, {
         // somehow
         if(data.src.pipeline == App.currentPipeline.id) {
             var log = this.get('log');
+            if (!log) {
+                log = [];
+                this.set('log', log);
+            }
             log.push(data);
 
             // call manually
@@ -504,4 +509,6 @@ Ember.Handlebars.helper("statusToString", function(status_code) {
         return "Running"
     else if (status_code == App.util.status_codes.FAILED)
         return "Failed"
+    else if (status_code == App.util.status_codes.QUEUED)
+        return "Queued"
 });
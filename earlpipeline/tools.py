@@ -1,16 +1,35 @@
 import logging
 import traceback
+import json
+import tempfile
 import re
 import multiprocessing as mp
+from multiprocessing import reduction
+import _multiprocessing
 from logutils.queue import QueueHandler, QueueListener
 from functools import wraps
 import pickle
 import os
+import Queue
+import atexit
+import heapq
+import itertools
+import signal
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 class Status(object):
     FINISHED = 1
     RUNNING = 2
     FAILED = 3
+    # waiting in the run queue of the PipelineManager
+    QUEUED = 4
 
     @staticmethod
     def assert_valid(status):
@@ -19,11 +38,22 @@ class Status(object):
         try:
             assert istatus == Status.FINISHED\
                 or istatus == Status.RUNNING\
-                or istatus == Status.FAILED
+                or istatus == Status.FAILED\
+                or istatus == Status.QUEUED
         except:
             raise ValueError("Invalid status: %s" % status)
 
 
+class FrozenDict(dict):
+    """A read-only dictionary. Used to expose precomputed class-level
+    metadata, which must not be modified by the callers"""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("'%s' object is read-only" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
 class EventTool(object):
     """This class contains definitions of all special event-types, which are
     supposed to be understood by the front-end. For custom event type,
@@ -61,6 +91,8 @@ class EventTool(object):
 
         if event_type == "STATUS":
             return EventTool.status_record2dict(record)
+        elif event_type == "PROFILE":
+            return EventTool.profile_record2dict(record)
         elif event_type == "LOG":
             return EventTool.log_record2dict(record)
 
@@ -82,7 +114,8 @@ class EventTool(object):
                             'time': record.created,
                             'status': status,
                             'target_type': target_type,
-                            'target': target
+                            'target': target,
+                            'pipeline': record.pipeline
                         }
                     }
             return res
@@ -96,6 +129,25 @@ class EventTool(object):
         Status.assert_valid(status_code)
         return EventTool.format_string % ("STATUS", status_code)
 
+    @staticmethod
+    def profile_record2dict(record):
+        if not record.unit:
+            return EventTool.log_record2dict(record)
+
+        data = json.loads(record.event_data)
+        data.update({
+            'time': record.created,
+            'unit': record.unit,
+            'pipeline': record.pipeline,
+            })
+        return {'type': 'profile', 'data': data}
+
+    @staticmethod
+    def create_profile_msg(stats):
+        """Creates a profile message, given the execution statistics of a
+        unit (a JSON-serializable dict)"""
+        return EventTool.format_string % ("PROFILE", json.dumps(stats))
+
     @staticmethod
     def log_record2dict(record):
         res = {
@@ -113,6 +165,135 @@ class EventTool(object):
         return res
 
 
+class PipelineLog(object):
+    """
+    Log of a pipeline, keeping only the last 'capacity' entries. Every entry
+    gets a sequence number, which can be used as a cursor to read the log in
+    pages. Safe to use from several threads.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        maximal number of the stored entries
+    """
+    def __init__(self, capacity=1000):
+        super(PipelineLog, self).__init__()
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        with self._lock:
+            self._entries.append((self._next_seq, entry))
+            self._next_seq += 1
+
+    def clear(self):
+        """Drops all entries. Sequence numbers are not reset, so the cursors
+        of the clients stay valid"""
+        with self._lock:
+            self._entries.clear()
+
+    def read(self, after=0, limit=None):
+        """
+        Reads the entries, following the given cursor
+
+        Parameters
+        ----------
+        after : int, optional
+            sequence number of the last entry, which was already read. 0
+            means reading from the oldest stored entry
+        limit : int, optional
+            maximal number of entries to return
+
+        Returns
+        -------
+        entries : list
+            the entries, oldest first
+        cursor : int
+            sequence number of the last returned entry (or 'after', if
+            nothing is returned), to be passed to the next call
+        first : int
+            sequence number of the oldest stored entry. If it's greater than
+            'after' + 1, some of the entries were dropped before being read
+        """
+
+        with self._lock:
+            first = self._entries and self._entries[0][0] or self._next_seq
+            # entries are numbered consecutively, so the position is known
+            start = max(after + 1 - first, 0)
+            stop = len(self._entries)
+            if limit is not None:
+                stop = min(stop, start + limit)
+            page = [self._entries[i] for i in range(start, stop)]
+
+        cursor = page and page[-1][0] or after
+        return [entry for _, entry in page], cursor, first
+
+    def __iter__(self):
+        with self._lock:
+            entries = list(self._entries)
+        return iter([entry for _, entry in entries])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RunProfile(object):
+    """
+    Execution statistics of the units during the last run of a pipeline,
+    collected from the PROFILE events. Safe to use from several threads.
+    """
+
+    # the numbers, which are summed up in the totals
+    totals = ('wall_time', 'cpu_time', 'output_size')
+
+    def __init__(self):
+        super(RunProfile, self).__init__()
+        self.started = None
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drops the statistics, when a new run starts"""
+        with self._lock:
+            self.started = time.time()
+            self._rows = []
+
+    def add(self, data):
+        """Adds the statistics of a unit execution (the data of a profile
+        event)"""
+        with self._lock:
+            self._rows.append(data)
+
+    def to_dict(self, sort_by='wall_time'):
+        """
+        Returns the statistics table
+
+        Parameters
+        ----------
+        sort_by : str, optional
+            the field to sort the units by, in the descending order. If None,
+            the units are in the order they have finished
+
+        Returns
+        -------
+        profile : dict
+            {'started': time, 'units': [stats, ...], 'total': {...}}
+        """
+
+        with self._lock:
+            rows = list(self._rows)
+
+        if sort_by is not None:
+            rows.sort(key=lambda row: row.get(sort_by), reverse=True)
+
+        total = dict((field, sum(row.get(field) or 0 for row in rows))
+                for field in self.totals)
+
+        return {'started': self.started, 'units': rows, 'total': total}
+
+
 class Runnable(object):
     """Adds a 'status' interface to an object, which is writable from other
     processes (uses mp.Value to store status). By design, pipelines are run in
@@ -152,6 +333,9 @@ class Runnable(object):
         # temporary log
         if __dict__.has_key("_log"):
             del __dict__["_log"]
+        # statistics of the last run
+        if __dict__.has_key("_profile"):
+            del __dict__["_profile"]
 
         return __dict__
 
@@ -164,20 +348,772 @@ class Runnable(object):
 
 
 
-# TODO: make it store and read from disc
+def run_pipeline(ppl, output_queue=None, units=None):
+    """Runs the pipeline in the current process, logging the termination
+    message when it has finished. If 'output_queue' is given, the outputs of
+    the pipeline are sent over it before the final status. If 'units' are
+    given, only they (and their ancestors) are run"""
+    try:
+        ppl.logger.info("Starting...")
+        if units is None:
+            ppl.run()
+        else:
+            ppl.run(units)
+    except:
+        status = Status.FAILED
+        msg = traceback.format_exc()
+    else:
+        status = Status.FINISHED
+        ppl.logger.info("...done")
+        msg = None
+    finally:
+        # outputs have to be sent before the final status, which
+        # makes the server collect them
+        if output_queue:
+            output_queue.put(ppl.export_outputs())
+
+        # inform the server
+        ppl.status = status
+        if msg:
+            ppl.logger.error(msg)
+
+
+class PipeQueue(object):
+    """Queue-like end of a duplex pipe between the server and a pool worker.
+    'put' sends an item, 'get' receives one. A closed pipe is reported as
+    Queue.Empty"""
+    def __init__(self, conn):
+        super(PipeQueue, self).__init__()
+        self.conn = conn
+
+    def put(self, item):
+        self.conn.send(item)
+
+    def get(self, block=True, timeout=None):
+        try:
+            if not self.conn.poll(timeout if block else 0):
+                raise Queue.Empty
+            return self.conn.recv()
+        except (EOFError, IOError):
+            raise Queue.Empty
+
+    def close(self):
+        self.conn.close()
+
+
+def run_sweep(ppl, sweep_args, result_queue):
+    """Runs a parameter sweep of the pipeline (see its 'sweep' method) in the
+    current process, which owns a copy of the pipeline, logging the
+    termination message like 'run_pipeline'. (ok, SweepResult or traceback)
+    is sent over 'result_queue' before the final status"""
+    try:
+        ppl.logger.info("Starting the sweep...")
+        result = ppl.sweep(copy=False, **sweep_args)
+    except SystemExit:
+        # terminated by the server, which reports the failure itself
+        raise
+    except:
+        msg = traceback.format_exc()
+        # the result has to be sent before the final status, which makes
+        # the server collect it
+        result_queue.put((False, msg))
+        ppl.status = Status.FAILED
+        ppl.logger.error(msg)
+    else:
+        ppl.logger.info("...done")
+        result_queue.put((True, result))
+        ppl.status = Status.FINISHED
+
+
+def get_result_cache_config(ppl):
+    """
+    Returns the configuration of the pipeline's result cache (see the simple
+    engine's 'result_cache.py'), which is sent to the pool workers with
+    every run: they are forked from the 'WorkerZygote', so they don't see a
+    cache, which was set up after the zygote has started
+
+    Returns
+    -------
+    config : tuple or None
+        (cache class, keyword arguments), or None if there is no cache
+    """
+    cache = getattr(ppl, 'result_cache', None)
+    if cache is None or not hasattr(cache, 'get_config'):
+        return None
+    return cache.__class__, cache.get_config()
+
+
+def set_result_cache(ppl, config):
+    """Makes the class of the pipeline use the result cache of the given
+    configuration (see 'get_result_cache_config') in a pool worker. The
+    cache is only created again, if the configuration has changed"""
+    if not hasattr(ppl, 'result_cache'):
+        return
+
+    cache = ppl.result_cache
+    if config is None:
+        if cache is not None:
+            type(ppl).result_cache = None
+        return
+
+    cls, kwargs = config
+    if cache is None or cache.__class__ is not cls or \
+            cache.get_config() != kwargs:
+        type(ppl).result_cache = cls(**kwargs)
+
+
+def pool_worker_main(tasks, outputs, event_queue):
+    """Main loop of a 'PoolWorker' process. Runs the pipelines received over
+    the 'tasks' queue, until None is received, or the server is gone"""
+    handler = QueueHandler(event_queue)
+
+    while True:
+        try:
+            task = tasks.get()
+        except Queue.Empty:
+            return
+        if task is None:
+            return
+
+        logger_name, data, retained, log_level, sweep_args, units, \
+                cache_config = task
+
+        # the pipeline's logger may have handlers, inherited from the server
+        logger = logging.getLogger(logger_name)
+        del logger.handlers[:]
+        logger.addHandler(handler)
+        logger.setLevel(log_level)
+
+        try:
+            try:
+                ppl = pickle.loads(data)
+                if retained is not None:
+                    ppl.import_outputs(retained)
+                set_result_cache(ppl, cache_config)
+            except:
+                # keeps the outputs queue in step with the runs
+                if retained is not None or sweep_args is not None:
+                    outputs.put(None)
+                logger.info(EventTool.create_status_msg(Status.FAILED))
+                logger.error(traceback.format_exc())
+                continue
+
+            if sweep_args is not None:
+                run_sweep(ppl, sweep_args, outputs)
+            else:
+                run_pipeline(ppl, retained is not None and outputs or None,
+                        units)
+        finally:
+            logger.removeHandler(handler)
+
+
+def zygote_worker_main(control, conn, event_queue):
+    """Main function of a pool worker, started by the 'WorkerZygote'"""
+    # only the zygote talks to the server over this one
+    control.close()
+    pipe = PipeQueue(conn)
+    pool_worker_main(pipe, pipe, event_queue)
+
+
+def zygote_main(control, server_end, event_queue):
+    """Main loop of the 'WorkerZygote' process. Starts a pool worker for
+    every pipe end, received over 'control', until the server closes it"""
+    # inherited from the server, it would keep the pipe open
+    server_end.close()
+
+    while True:
+        # reaps the exited workers
+        mp.active_children()
+        if not control.poll(0.1):
+            continue
+
+        try:
+            control.recv()
+            fd = reduction.recv_handle(control)
+        except (EOFError, IOError, OSError):
+            return
+
+        conn = _multiprocessing.Connection(fd)
+        p = mp.Process(target=zygote_worker_main,
+                args=(control, conn, event_queue))
+        p.start()
+        conn.close()
+        control.send(p.pid)
+
+
+class WorkerZygote(object):
+    """
+    Small process, which starts the workers of the 'WorkerPool'. It is forked
+    once, when the pool is created, so that the workers are forked from it,
+    and not from the live server with all of its loaded pipelines, threads
+    and sockets. A worker talks to the server over a pipe, which is passed
+    to the zygote as a file descriptor.
+
+    Parameters
+    ----------
+    event_queue : mp.Queue
+        queue of the 'LogEventServer', inherited by the workers
+    """
+    def __init__(self, event_queue):
+        super(WorkerZygote, self).__init__()
+        self.event_queue = event_queue
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self.control, child = mp.Pipe()
+        # not a daemon, as it has children
+        self.process = mp.Process(target=zygote_main,
+                args=(child, self.control, self.event_queue))
+        self.process.start()
+        child.close()
+
+    def start_worker(self):
+        """
+        Starts a new worker process
+
+        Returns
+        -------
+        conn : Connection
+            the server's end of the worker's pipe
+        pid : int
+            process id of the worker
+        """
+
+        conn, child = mp.Pipe()
+        try:
+            with self._lock:
+                if not self.process.is_alive():
+                    self.control.close()
+                    self._start()
+
+                self.control.send('start')
+                reduction.send_handle(self.control, child.fileno(),
+                        self.process.pid)
+                pid = self.control.recv()
+        except:
+            conn.close()
+            raise
+        finally:
+            child.close()
+
+        return conn, pid
+
+    def stop(self):
+        """Lets the process exit, once its workers have exited"""
+        with self._lock:
+            self.control.close()
+        self.process.join()
+
+
+class PoolWorker(object):
+    """A pre-started process of the 'WorkerPool'. It runs one pipeline at a
+    time, receiving it and sending its outputs back over the same pipe, so
+    'tasks' and 'outputs' are the same queue"""
+    def __init__(self, zygote):
+        super(PoolWorker, self).__init__()
+        conn, self.pid = zygote.start_worker()
+        self.tasks = self.outputs = PipeQueue(conn)
+        self.runs = 0
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def stop(self):
+        """Lets the process exit, once it has finished the current pipeline"""
+        try:
+            self.tasks.put(None)
+        except IOError:
+            # already gone
+            pass
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            pass
+        self.join()
+
+    def join(self, timeout=5):
+        """Waits for the process to exit, and closes the server's end of the
+        pipe. The process is reaped by the zygote, and its end of the pipe
+        can be kept open by its children"""
+        deadline = time.time() + timeout
+        try:
+            while self.is_alive() and time.time() < deadline:
+                if self.tasks.conn.poll(0.05):
+                    self.tasks.conn.recv()
+        except (EOFError, IOError):
+            pass
+        self.tasks.close()
+
+
+class WorkerPool(object):
+    """
+    Pool of pre-started processes, which run the pipelines, so that the whole
+    server doesn't have to be forked for every run. The pipeline, together
+    with its retained outputs, is pickled and sent to an idle worker. The
+    events of the pipeline are sent to the event server's queue. The workers,
+    including the ones replacing the recycled workers, are started by a
+    'WorkerZygote'.
+
+    Parameters
+    ----------
+    event_queue : mp.Queue
+        queue of the 'LogEventServer'
+    size : int, optional
+        number of the worker processes
+    max_runs : int, optional
+        number of runs, after which a worker is replaced by a fresh one. None
+        means never
+    """
+    def __init__(self, event_queue, size=2, max_runs=100):
+        super(WorkerPool, self).__init__()
+        self.event_queue = event_queue
+        self.size = size
+        self.max_runs = max_runs
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._busy = set()
+        self._zygote = WorkerZygote(event_queue)
+        self._replenish()
+
+        atexit.register(self.shutdown)
+
+    def _replenish(self):
+        """Starts new workers, until the pool is full"""
+        with self._lock:
+            n_missing = self.size - len(self._idle) - len(self._busy)
+        for i in range(n_missing):
+            worker = PoolWorker(self._zygote)
+            with self._lock:
+                self._idle.append(worker)
+
+    def submit(self, ppl, export_outputs=False, sweep_args=None,
+            units=None):
+        """
+        Runs the pipeline, or its sweep, in an idle worker
+
+        Parameters
+        ----------
+        ppl : GenericPipeline
+            pipeline to run. Has to be picklable
+        export_outputs : bool, optional
+            whether the retained outputs of the pipeline are sent to the
+            worker and back (requires 'export_outputs' and 'import_outputs'
+            methods of the pipeline)
+        sweep_args : dict, optional
+            keyword arguments of the pipeline's 'sweep'. If given, the sweep
+            is run, and its result is sent back instead of the outputs
+        units : list, optional
+            run only these units (and their ancestors), see 'run_pipeline'
+
+        Returns
+        -------
+        worker : PoolWorker or None
+            the worker, running the pipeline, or None if all workers are busy
+        """
+
+        data = pickle.dumps(ppl, pickle.HIGHEST_PROTOCOL)
+        retained = export_outputs and ppl.export_outputs(retained=True) \
+                or None
+        log_level = ppl.logger.getEffectiveLevel()
+
+        with self._lock:
+            worker = None
+            while self._idle and worker is None:
+                worker = self._idle.pop()
+                if not worker.is_alive():
+                    worker = None
+            if worker is not None:
+                self._busy.add(worker)
+
+        if worker is None:
+            return None
+
+        worker.tasks.put((ppl.logger.name, data, retained, log_level,
+            sweep_args, units, get_result_cache_config(ppl)))
+
+        # dead workers are replaced, when the pipeline is already running
+        self._replenish()
+
+        return worker
+
+    def release(self, worker, reuse=True):
+        """Returns the worker, which has finished running a pipeline, to the
+        pool, or stops it, if it has done 'max_runs' runs, or if 'reuse' is
+        False"""
+        with self._lock:
+            if worker not in self._busy:
+                return
+            self._busy.remove(worker)
+
+            worker.runs += 1
+            if reuse and (self.max_runs is None or
+                    worker.runs < self.max_runs):
+                self._idle.append(worker)
+                return
+
+        # replaced on the next submit
+        worker.stop()
+
+    def terminate(self, worker):
+        """Kills the worker, which runs a pipeline, and replaces it"""
+        with self._lock:
+            self._busy.discard(worker)
+        worker.terminate()
+        self._replenish()
+
+    def shutdown(self):
+        """Stops all workers"""
+        with self._lock:
+            idle, busy = self._idle, self._busy
+            self._idle, self._busy = [], set()
+            self.size = 0
+
+        for worker in idle:
+            worker.stop()
+        for worker in busy:
+            worker.terminate()
+        for worker in idle:
+            worker.join()
+        self._zygote.stop()
+
+
+class PipelineIndex(object):
+    """
+    Index of the pipelines, saved in a folder. For every '.ppl' file, it
+    stores the name of the pipeline, the file's modification time and the
+    pipeline's summary (its 'to_dict()'), so that the pipelines can be listed
+    without loading them. The index is stored in the same folder as JSON.
+
+    Parameters
+    ----------
+    folder : str
+        the folder with the pipelines
+    """
+
+    fname = "index.json"
+
+    def __init__(self, folder):
+        super(PipelineIndex, self).__init__()
+        self.folder = folder
+        self.path = os.path.join(folder, self.fname)
+
+        # {file_name: {'name': ..., 'mtime': ..., 'summary': ...}}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def scan(self, read_pipeline):
+        """
+        Brings the index up to date with the content of the folder. Only the
+        new and modified files are read.
+
+        Parameters
+        ----------
+        read_pipeline : callable
+            function, loading a pipeline from the given path
+        """
+
+        changed = False
+        files = set()
+        for fname in os.listdir(self.folder):
+            path = os.path.join(self.folder, fname)
+            if not (os.path.isfile(path) and path.lower().endswith(".ppl")):
+                continue
+            files.add(fname)
+
+            entry = self.entries.get(fname)
+            if entry is None or entry['mtime'] != os.path.getmtime(path):
+                try:
+                    ppl = read_pipeline(path)
+                except Exception:
+                    logging.warning("Can't load the pipeline from %s:\n%s"
+                            % (path, traceback.format_exc()))
+                    continue
+                self.set(path, ppl.name, ppl.to_dict())
+                changed = True
+
+        for fname in set(self.entries) - files:
+            del self.entries[fname]
+            changed = True
+
+        if changed:
+            self.save()
+
+    def set(self, path, name, summary):
+        """Updates the entry of the file, a pipeline was saved to"""
+        self.entries[os.path.basename(path)] = {
+                'name': name,
+                'mtime': os.path.getmtime(path),
+                'summary': summary,
+                }
+
+    def remove(self, path):
+        self.entries.pop(os.path.basename(path), None)
+
+    def get(self, path):
+        return self.entries[os.path.basename(path)]
+
+    def save(self):
+        """Writes the index to disk atomically"""
+        write_atomic(self.path, json.dumps(self.entries))
+
+
+def write_atomic(path, data):
+    """Writes the data to a temporary file in the same folder, which then
+    replaces the file, so that readers never see a partially written file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+            suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PipelineWriter(object):
+    """
+    Writes files in a background thread, so that saving doesn't block the
+    caller. Every file is written atomically (see 'write_atomic'). Writes of
+    a file, requested while an earlier one is still waiting, are coalesced:
+    only the latest data is written, and all of the callbacks are called.
+
+    Parameters
+    ----------
+    delay : float, optional
+        time (in seconds) a write waits for the newer ones. It is counted
+        from the first request, so that a file, which is saved over and over
+        again, is still written
+    """
+
+    def __init__(self, delay=0.2):
+        super(PipelineWriter, self).__init__()
+        self.delay = delay
+
+        # {path: [data, callbacks, deadline]} in the order of the deadlines
+        self._pending = OrderedDict()
+        # path of the file being written
+        self._current = None
+        self._flushing = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+        # write everything, before the server exits
+        atexit.register(self.close)
+
+    def write(self, path, data, callback=None):
+        """
+        Schedules writing of the file
+
+        Parameters
+        ----------
+        path : str
+            file to write
+        data : str
+            new content of the file
+        callback : callable, optional
+            called in the writer thread with None, once the data (or the
+            newer data, it was replaced with) is written, or with the
+            exception, if the writing has failed
+        """
+
+        with self._cond:
+            if self._pending.has_key(path):
+                entry = self._pending[path]
+                entry[0] = data
+            else:
+                entry = [data, [], time.time() + self.delay]
+                self._pending[path] = entry
+
+            if callback is not None:
+                entry[1].append(callback)
+            self._cond.notify_all()
+
+    def cancel(self, path):
+        """Drops the pending write of the file, and waits for the one in
+        progress, so that the file is not written after this call returns"""
+        with self._cond:
+            self._pending.pop(path, None)
+            while self._current == path:
+                self._cond.wait()
+
+    def flush(self):
+        """Writes all of the pending files immediately, and waits for them"""
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            try:
+                while self._pending or self._current is not None:
+                    self._cond.wait(0.1)
+            finally:
+                self._flushing = False
+
+    def close(self):
+        """Writes all of the pending files, and stops the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._pending:
+                        return
+                    if self._pending:
+                        path, entry = next(self._pending.iteritems())
+                        timeout = entry[2] - time.time()
+                        if self._flushing or self._closed or timeout <= 0:
+                            break
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+
+                del self._pending[path]
+                self._current = path
+
+            data, callbacks, _ = entry
+            try:
+                write_atomic(path, data)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+
+            for callback in callbacks:
+                try:
+                    callback(error)
+                except Exception:
+                    logging.error("Error in a save callback:\n%s"
+                            % traceback.format_exc())
+
+            with self._cond:
+                self._current = None
+                self._cond.notify_all()
+
+
 # TODO: add docstrings here
 # TODO: put it in a separate file
+def dump_pipeline(backend, ppl):
+    """Serializes the pipeline, using the backend's own format, if it has
+    one, or pickle"""
+    if hasattr(backend.Pipeline, 'dumps') and \
+        hasattr(backend.Pipeline, 'loads'):
+        return backend.Pipeline.dumps(ppl)
+    return pickle.dumps(ppl)
+
+
+def parse_pipeline(backend, data):
+    """Inverse of 'dump_pipeline'"""
+    if hasattr(backend.Pipeline, 'dumps') and \
+        hasattr(backend.Pipeline, 'loads'):
+        return backend.Pipeline.loads(data)
+    return pickle.loads(data)
+
+
+def read_pipeline(backend, fname):
+    """Reads a pipeline of the backend from the file"""
+    with open(fname, 'rb') as f:
+        ppl = parse_pipeline(backend, f.read())
+
+    ppl.fname = fname
+    return ppl
+
+
 class PipelineManager(object):
-    def __init__(self, event_server, backend, pipelines_folder = 'pipelines'):
-        # dict {ppl_name : ppl_instance}
+    def __init__(self, event_server, backend, pipelines_folder = 'pipelines',
+            workers=2, max_worker_runs=100, log_capacity=1000,
+            max_loaded=100, save_delay=0.2, max_running=None,
+            remote_workers=None, remote_secret=None):
+        # dict {ppl_name : ppl_instance} of the loaded pipelines, least
+        # recently used first
         self._backend = backend
-        self._pipelines = {}
+        self._pipelines = OrderedDict()
+        # {ppl_name: fname} of the saved pipelines, which are not loaded
+        self._unloaded = {}
+        # {ppl_name: [revision, saved revision]}. The revision is increased
+        # by 'mark_modified', the saved one is None for the new pipelines
+        self._revisions = {}
+        # pipelines are loaded from the server's and the event server's
+        # threads
+        self._lock = threading.RLock()
+        # maximal number of loaded pipelines. The least recently used ones,
+        # which are not running and have no unsaved changes, are unloaded.
+        # None means no limit
+        self.max_loaded = max_loaded
+        # {ppl_name: mp.Process, PoolWorker or RemoteRun}
         self._running_processes = {}
+        # heap of [-priority, sequence number, ppl_name, time of queueing,
+        # units to run or None], so that the runs of the same priority are
+        # started in the FIFO order
+        self._run_queue = []
+        # {ppl_name: entry of _run_queue}
+        self._queued = {}
+        self._run_counter = itertools.count()
+        # waiting times (in seconds) of the recently started runs
+        self._wait_times = deque(maxlen=100)
+        # queues delivering the retained outputs from the running processes
+        self._output_queues = {}
+        # {ppl_name: [sweep_args, callback, result queue]} of the queued and
+        # running sweeps
+        self._sweeps = {}
+        # number of the log entries kept per pipeline
+        self.log_capacity = log_capacity
+        # pipelines are written to disk in the background
+        self.writer = PipelineWriter(save_delay)
 
         # create event server and add necessary handlers
         self.event_server = event_server
         self.event_server.start()
 
+        # pre-started processes to run the pipelines in. If all of them are
+        # busy, or there are none, the server is forked for a run
+        if workers:
+            self.worker_pool = WorkerPool(event_server.queue, workers,
+                    max_worker_runs)
+        else:
+            self.worker_pool = None
+
+        # coordinator mode: the pipelines are run by the remote workers, if
+        # they have free slots (see 'distributed.py')
+        if remote_workers:
+            from earlpipeline.distributed import RemoteCluster
+            self.cluster = RemoteCluster(remote_workers, event_server.queue,
+                    self.on_remote_run_lost, secret=remote_secret,
+                    on_connected=self.on_remote_worker_connected)
+        else:
+            self.cluster = None
+
+        # maximal number of the pipelines running at the same time. The
+        # other runs wait in the queue. None means the number of CPUs plus
+        # the slots of the connected remote workers
+        self._max_running = max_running
+
+        # status of the pipelines, run by the worker pool, is not shared with
+        # the server, so it is synchronized using the status events
+        status_handler = CallbackHandler(
+                lambda evt: self.pipeline_status_callback(evt))
+        self.event_server.add_client("PplStatusHandler", status_handler)
+
         # stopping handler
         stop_handler = CallbackHandler(
                 lambda evt: self.pipeline_stopper_callback(evt))
@@ -204,26 +1140,119 @@ class PipelineManager(object):
 
         self.pipelines_folder = pipelines_folder
 
-        for fname in os.listdir(self.pipelines_folder):
+        # pipelines are loaded, when they are accessed for the first time
+        self._index = PipelineIndex(self.pipelines_folder)
+        self._index.scan(self.read_pipeline)
+        for fname, entry in self._index.entries.items():
             path = os.path.join(self.pipelines_folder, fname)
-            if os.path.isfile(path) and path.lower().endswith(".ppl"):
-                self.load_pipeline(path)
+            self._unloaded[entry['name']] = path
 
     def __iter__(self):
-        for ppl in self._pipelines.values():
+        """Iterates over the loaded pipelines"""
+        with self._lock:
+            pipelines = self._pipelines.values()
+        for ppl in pipelines:
             yield ppl
 
+    def dump_pipeline(self, ppl):
+        """Serializes the pipeline, using the backend's own format, if it has
+        one, or pickle"""
+        return dump_pipeline(self._backend, ppl)
+
+    def parse_pipeline(self, data):
+        """Inverse of 'dump_pipeline'"""
+        return parse_pipeline(self._backend, data)
+
+    def read_pipeline(self, fname):
+        """Reads a pipeline from the file"""
+        return read_pipeline(self._backend, fname)
+
     def load_pipeline(self, fname):
-        if hasattr(self._backend.Pipeline, 'save') and \
-            hasattr(self._backend.Pipeline, 'load'):
-            ppl = self._backend.Pipeline.load(fname)
-        else:
-            with open(fname) as f:
-                ppl = pickle.load(f)
+        ppl = self.read_pipeline(fname)
+
+        with self._lock:
+            self.add_pipeline(ppl)
+            self._revisions[ppl.name] = [0, 0]
+            self.unload_idle()
+
+        return ppl
+
+    def has_pipeline(self, name):
+        """Checks whether the pipeline exists, loaded or not"""
+        with self._lock:
+            return self._pipelines.has_key(name) or \
+                    self._unloaded.has_key(name)
+
+    def get_summaries(self):
+        """Returns the summaries ('to_dict()') of all pipelines, without
+        loading them"""
+        with self._lock:
+            summaries = [ppl.to_dict() for ppl in self._pipelines.values()]
+            for name, fname in self._unloaded.items():
+                summary = dict(self._index.get(fname)['summary'])
+                summary['id'] = name
+                summaries.append(summary)
+
+        return summaries
+
+    def mark_modified(self, name):
+        """Records a change of the pipeline, so that it is saved by
+        'autosave' and not unloaded. Called by the server's handlers, which
+        modify the pipelines"""
+        with self._lock:
+            self._revisions.setdefault(name, [0, None])[0] += 1
+
+    def is_modified(self, name):
+        """Checks whether the pipeline has changed since it was loaded or
+        saved"""
+        with self._lock:
+            if not self._pipelines.has_key(name):
+                return False
+            revision, saved = self._revisions.get(name, (0, None))
+            return revision != saved
+
+    def unload_idle(self):
+        """Unloads the least recently used pipelines, which can be loaded
+        again without losing anything, until at most 'max_loaded' pipelines
+        are loaded"""
+        if self.max_loaded is None:
+            return
+
+        with self._lock:
+            # the most recently used one is being accessed
+            for name in self._pipelines.keys()[:-1]:
+                if len(self._pipelines) <= self.max_loaded:
+                    break
+
+                ppl = self._pipelines[name]
+                if self._running_processes.has_key(name) or \
+                        self._queued.has_key(name) or \
+                        not hasattr(ppl, 'fname') or \
+                        not os.path.exists(ppl.fname):
+                    continue
+
+                if self.is_modified(name):
+                    continue
+
+                del self._pipelines[name]
+                del self._revisions[name]
+                self._unloaded[name] = ppl.fname
+
+    def save_pipeline(self, name, callback=None):
+        """
+        Saves the pipeline. Only the serialization is done in the calling
+        thread, the file is written in the background (see 'PipelineWriter').
 
-        self.add_pipeline(ppl)
+        Parameters
+        ----------
+        name : str
+            name of the pipeline
+        callback : callable, optional
+            called with None, once the pipeline is saved, or with the
+            exception, if saving has failed. It is called in the writer
+            thread
+        """
 
-    def save_pipeline(self, name):
         ppl = self.get_pipeline(name)
 
         if not hasattr(ppl, 'fname'):
@@ -232,16 +1261,53 @@ class PipelineManager(object):
         else:
             fname = ppl.fname
 
-        if hasattr(self._backend.Pipeline, 'save') and \
-            hasattr(self._backend.Pipeline, 'load'):
-            self._backend.Pipeline.save(ppl, fname)
-        else:
-            with open(fname, 'w') as f:
-                pickle.dump(ppl, f)
+        # the snapshot is taken here, because the pipeline is modified in
+        # the calling thread
+        data = self.dump_pipeline(ppl)
+        summary = ppl.to_dict()
+        with self._lock:
+            revision = self._revisions.setdefault(name, [0, None])[0]
+
+        def on_written(error):
+            if error is not None:
+                logging.error("Can't save the pipeline %s to %s: %s"
+                        % (ppl.name, fname, error))
+            elif ppl.fname == fname:
+                with self._lock:
+                    # the later changes are still to be saved
+                    if self._pipelines.get(ppl.name) is ppl:
+                        self._revisions[ppl.name][1] = revision
+                    self._index.set(fname, ppl.name, summary)
+                    self._index.save()
+
+            if callback is not None:
+                callback(error)
+
+        self.writer.write(fname, data, on_written)
+
+    def autosave(self):
+        """Saves the loaded pipelines, which have changed since they were
+        loaded or saved. The changes are only known, if they are reported
+        with 'mark_modified'"""
+        with self._lock:
+            names = [name for name in self._pipelines.keys()
+                    if self.is_modified(name)]
+
+        for name in names:
+            try:
+                self.save_pipeline(name)
+            except Exception:
+                logging.error("Can't save the pipeline %s:\n%s"
+                        % (name, traceback.format_exc()))
+
+    def flush(self):
+        """Waits for the pending saves to complete"""
+        self.writer.flush()
 
     def remove_pipeline(self, name):
         # check if not running
-        if self._running_processes.has_key(name):
+        if self._running_processes.has_key(name) or \
+                self._queued.has_key(name):
             raise Exception("Can't delete %s, it is still running" % name)
 
         ppl = self.get_pipeline(name)
@@ -252,79 +1318,342 @@ class PipelineManager(object):
         else:
             fname = ppl.fname
 
+        # the pipeline could be saved in the background
+        self.writer.cancel(fname)
         if os.path.exists(fname):
             os.remove(fname)
 
-        del self._pipelines[name]
+        with self._lock:
+            self._index.remove(fname)
+            self._index.save()
+            del self._pipelines[name]
+            self._revisions.pop(name, None)
         del ppl
 
     def add_pipeline(self, ppl):
-        self._pipelines[ppl.name] = ppl
-        ppl._log = []
+        with self._lock:
+            self._pipelines[ppl.name] = ppl
+            self._unloaded.pop(ppl.name, None)
+        ppl._log = PipelineLog(self.log_capacity)
+        ppl._profile = RunProfile()
 
     def rename_pipeline(self, name, new_name):
         ppl = self.get_pipeline(name)
         
-        if not new_name in self._pipelines.keys():
-            ppl.name = new_name
-            self._pipelines[new_name] = ppl
-            del self._pipelines[name]
+        if not self.has_pipeline(new_name):
+            with self._lock:
+                ppl.name = new_name
+                self._pipelines[new_name] = ppl
+                del self._pipelines[name]
+                if self._revisions.has_key(name):
+                    self._revisions[new_name] = self._revisions.pop(name)
+            self.mark_modified(new_name)
 
             if name in self._running_processes.keys():
                 self._running_processes[new_name] = self._running_processes[name]
                 del self._running_processes[name]
+
+            with self._lock:
+                if self._queued.has_key(name):
+                    entry = self._queued.pop(name)
+                    entry[2] = new_name
+                    self._queued[new_name] = entry
+
+            if name in self._output_queues.keys():
+                self._output_queues[new_name] = self._output_queues[name]
+                del self._output_queues[name]
+
+            # the index entry of the file is updated, once the file is
+            # written, so that it never names a pipeline the file doesn't
+            # contain
+            if hasattr(ppl, 'fname'):
+                self.save_pipeline(new_name)
         else:
             raise Exception("Cannot rename pipeline, name %s already exists" % new_name)
 
     def get_pipeline(self, name):
-        return self._pipelines[name]
+        """Returns the pipeline, loading it if necessary"""
+        with self._lock:
+            if self._pipelines.has_key(name):
+                # mark as the most recently used
+                ppl = self._pipelines.pop(name)
+                self._pipelines[name] = ppl
+                return ppl
+
+            if not self._unloaded.has_key(name):
+                raise KeyError(name)
+
+            return self.load_pipeline(self._unloaded[name])
+
+    @property
+    def max_running(self):
+        """Maximal number of the pipelines running at the same time"""
+        if self._max_running is not None:
+            return self._max_running
+        max_running = mp.cpu_count()
+        if self.cluster is not None:
+            max_running += self.cluster.slots
+        return max_running
+
+    def start_pipeline(self, name, priority=None, units=None):
+        """
+        Starts the pipeline, or puts it in the queue, if 'max_running'
+        pipelines are already running
+
+        Parameters
+        ----------
+        name : str
+            name of the pipeline
+        priority : int, optional
+            priority of this run. Defaults to the pipeline's 'priority'
+        units : list, optional
+            run only these units and the units they depend on. Wherever the
+            pipeline runs: locally, in the worker pool or on a remote worker
+        """
 
-    def start_pipeline(self, name):
         ppl = self.get_pipeline(name)
 
-        # check if not already running
-        if self._running_processes.has_key(name):
-            raise Exception("Can't start %s, it is still running" % name)
+        with self._lock:
+            # check if not already running
+            if self._running_processes.has_key(name) or \
+                    self._queued.has_key(name):
+                raise Exception("Can't start %s, it is still running" % name)
+
+            # clear the object log and the statistics of the previous run
+            ppl._log.clear()
+            ppl._profile.clear()
+
+            self.event_server.add_pipeline(ppl)
+
+            if len(self._running_processes) < self.max_running and \
+                    not self._run_queue:
+                self._wait_times.append(0.0)
+                self.launch_pipeline(ppl, units)
+                return
+
+            if priority is None:
+                priority = getattr(ppl, 'priority', 0)
+            entry = [-priority, next(self._run_counter), name, time.time(),
+                    units]
+            heapq.heappush(self._run_queue, entry)
+            self._queued[name] = entry
+
+            ppl.status = Status.QUEUED
+            ppl.logger.info("Waiting for one of %d running pipelines to "
+                    "finish" % len(self._running_processes))
+
+    def start_sweep(self, name, callback, grid=None, variants=None,
+            outputs=None, max_workers=None, priority=None):
+        """
+        Runs a parameter sweep of the pipeline (see 'sweep.sweep' of the
+        simple engine) like a run of the pipeline: in the worker pool or in a
+        new process, after waiting in the queue, if 'max_running' pipelines
+        are already running. The pipeline itself is not modified.
 
-        # clear the object log
-        ppl._log = []
+        Parameters
+        ----------
+        name : str
+            name of the pipeline
+        callback : callable
+            called with (ok, result), once the sweep has stopped, where
+            'result' is the SweepResult, or the error message. Called from
+            the event server's thread
+        grid, variants, outputs, max_workers : optional
+            see 'sweep.sweep'
+        priority : int, optional
+            priority of the sweep. Defaults to the pipeline's 'priority'
+        """
 
-        self.event_server.add_pipeline(ppl)
+        sweep_args = {'grid': grid, 'variants': variants, 'outputs': outputs,
+                'max_workers': max_workers}
+        with self._lock:
+            if self._running_processes.has_key(name) or \
+                    self._queued.has_key(name):
+                raise Exception("Can't sweep %s, it is still running" % name)
 
-        # a wrapper function which logs the termination message when the
-        # pipeline has finished running
-        def run_wrapper():
+            self._sweeps[name] = [sweep_args, callback, None]
             try:
-                ppl.logger.info("Starting...")
-                ppl.run()
+                self.start_pipeline(name, priority)
             except:
-                status = Status.FAILED
-                msg = traceback.format_exc()
-            else:
-                status = Status.FINISHED
-                ppl.logger.info("...done")
-                msg = None
-            finally:
-                # inform the server
-                ppl.status = status
-                if msg:
-                    ppl.logger.error(msg)
+                del self._sweeps[name]
+                raise
+
+    def launch_pipeline(self, ppl, units=None):
+        """Runs the pipeline (or only the given units, see 'start_pipeline')
+        on a remote worker, in the worker pool, or in a new process"""
 
+        # if the backend can retain unit outputs between the runs, they have
+        # to be sent back from the forked process
+        exports_outputs = hasattr(ppl, 'export_outputs') and \
+                hasattr(ppl, 'import_outputs')
+        output_queue = exports_outputs and mp.Queue() or None
 
-        p = mp.Process(target=run_wrapper)
         ppl.status = Status.RUNNING
+
+        sweep = self._sweeps.get(ppl.name)
+        if sweep is not None:
+            self.launch_sweep(ppl, sweep, exports_outputs)
+            return
+
+        if self.cluster is not None:
+            try:
+                run = self.cluster.submit(ppl, exports_outputs, units)
+            except Exception as e:
+                ppl.logger.warning("Can't run on a remote worker (%s), "
+                        "running locally" % e)
+                run = None
+
+            if run is not None:
+                ppl.logger.info("Running on the worker %s" % run.worker)
+                self._running_processes[ppl.name] = run
+                if exports_outputs:
+                    self._output_queues[ppl.name] = run.outputs
+                return
+
+        worker = None
+        if self.worker_pool is not None:
+            try:
+                worker = self.worker_pool.submit(ppl, exports_outputs,
+                        units=units)
+            except Exception as e:
+                ppl.logger.warning("Can't run in the worker pool (%s), "
+                        "starting a separate process" % e)
+
+        if worker is not None:
+            self._running_processes[ppl.name] = worker
+            if exports_outputs:
+                self._output_queues[ppl.name] = worker.outputs
+            return
+
+        p = mp.Process(target=run_pipeline, args=(ppl, output_queue, units))
         p.start()
         self._running_processes[ppl.name] = p
+        if output_queue:
+            self._output_queues[ppl.name] = output_queue
+
+    def launch_sweep(self, ppl, sweep, exports_outputs):
+        """Runs the sweep in the worker pool, or in a new process. The sweeps
+        are not sent to the remote workers"""
+        sweep_args = sweep[0]
+
+        worker = None
+        if self.worker_pool is not None:
+            try:
+                worker = self.worker_pool.submit(ppl, exports_outputs,
+                        sweep_args)
+            except Exception as e:
+                ppl.logger.warning("Can't run in the worker pool (%s), "
+                        "starting a separate process" % e)
+
+        if worker is not None:
+            self._running_processes[ppl.name] = worker
+            sweep[2] = worker.outputs
+            return
+
+        sweep[2] = mp.Queue()
+        p = mp.Process(target=run_sweep, args=(ppl, sweep_args, sweep[2]))
+        p.start()
+        self._running_processes[ppl.name] = p
+
+    def start_queued(self):
+        """Starts the queued runs, while there are free slots"""
+        with self._lock:
+            while self._run_queue and \
+                    len(self._running_processes) < self.max_running:
+                entry = heapq.heappop(self._run_queue)
+                name = entry[2]
+                del self._queued[name]
+                self._wait_times.append(time.time() - entry[3])
+
+                ppl = self.get_pipeline(name)
+                try:
+                    self.launch_pipeline(ppl, entry[4])
+                except Exception as e:
+                    # this will remove it from the event server
+                    ppl.status = Status.FAILED
+                    ppl.logger.error("Can't start the pipeline: %s" % e)
+
+    def set_priority(self, name, priority):
+        """Sets the priority of the pipeline's runs, including the queued
+        one"""
+        ppl = self.get_pipeline(name)
+        ppl.priority = int(priority)
+        self.mark_modified(name)
+
+        with self._lock:
+            if self._queued.has_key(name):
+                self._queued[name][0] = -ppl.priority
+                heapq.heapify(self._run_queue)
+
+    def get_queue_stats(self):
+        """
+        Returns the state of the run queue
+
+        Returns
+        -------
+        stats : dict
+            'max_running', 'running' (names of the running pipelines),
+            'queued' (list of {'pipeline', 'priority', 'waiting'} in the order
+            they will be started), 'depth' (number of the queued runs) and
+            'wait_time' ({'mean', 'max', 'last'} over the recently started
+            runs, in seconds)
+        """
+
+        now = time.time()
+        with self._lock:
+            queued = [{'pipeline': name, 'priority': -neg_priority,
+                'waiting': now - queued_at} for neg_priority, _, name,
+                queued_at in sorted(self._run_queue)]
+            running = sorted(self._running_processes.keys())
+            wait_times = list(self._wait_times)
+
+        if wait_times:
+            wait_time = {
+                    'mean': sum(wait_times) / len(wait_times),
+                    'max': max(wait_times),
+                    'last': wait_times[-1],
+                    }
+        else:
+            wait_time = {'mean': None, 'max': None, 'last': None}
+
+        return {
+                'max_running': self.max_running,
+                'running': running,
+                'queued': queued,
+                'depth': len(queued),
+                'wait_time': wait_time,
+                }
 
     def stop_pipeline(self, name):
         ppl = self.get_pipeline(name)
 
+        with self._lock:
+            if self._queued.has_key(name):
+                entry = self._queued.pop(name)
+                self._run_queue.remove(entry)
+                heapq.heapify(self._run_queue)
+
+                # this will remove it from the event server
+                ppl.status = Status.FAILED
+                ppl.logger.error("Removed from the queue by user")
+                return
+
         # check if already running
         if not self._running_processes.has_key(name):
             raise Exception("Can't stop %s, it doesn't seem to be running" % name)
 
         p = self._running_processes[name]
-        p.terminate()
+        if isinstance(p, PoolWorker):
+            self.worker_pool.terminate(p)
+        else:
+            p.terminate()
+
+        # nothing will be sent by the terminated process
+        with self._lock:
+            if self._output_queues.has_key(name):
+                del self._output_queues[name]
+            if self._sweeps.has_key(name):
+                self._sweeps[name][2] = None
 
         # this will automatically invoke stopping code via stop handler
         ppl.status = Status.FAILED
@@ -332,9 +1661,131 @@ class PipelineManager(object):
         ppl.logger.error("Interrupted by user")
 
     def on_pipeline_stop(self, ppl):
-        del self._running_processes[ppl.name]
+        with self._lock:
+            # None, if the pipeline hasn't left the queue
+            p = self._running_processes.pop(ppl.name, None)
+            sweep = self._sweeps.pop(ppl.name, None)
+        if sweep is not None:
+            received = self.collect_sweep(ppl, sweep)
+        else:
+            received = p is None or self.collect_outputs(ppl)
+        if isinstance(p, PoolWorker):
+            # late outputs would be taken for the ones of the worker's next
+            # pipeline
+            self.worker_pool.release(p, reuse=received)
+        elif hasattr(p, 'release'):
+            # RemoteRun
+            p.release()
         self.event_server.remove_pipeline(ppl)
-        
+
+        self.start_queued()
+
+    def on_remote_worker_connected(self, worker):
+        """Starts the queued runs on the slots of the newly connected remote
+        worker. Called from the cluster's connecting thread"""
+        self.start_queued()
+
+    def on_remote_run_lost(self, run):
+        """Fails the pipeline, the remote worker of which has disconnected.
+        Called from the connection's thread"""
+        with self._lock:
+            if self._running_processes.get(run.name) is not run:
+                return
+            # nothing will be sent by the worker
+            self._output_queues.pop(run.name, None)
+
+        ppl = self.get_pipeline(run.name)
+        ppl.logger.error("Lost the connection to the worker %s, which was "
+                "running the pipeline" % run.worker)
+
+        # this will automatically invoke stopping code via stop handler
+        ppl.status = Status.FAILED
+
+    def collect_outputs(self, ppl, timeout=1):
+        """
+        Retains the unit outputs, sent by the process which has just
+        finished running the pipeline. Called from the event server's thread,
+        so it never waits long: the outputs are put before the final status,
+        and 'timeout' only covers them travelling over a different queue
+
+        Returns
+        -------
+        received : bool
+            False, if the outputs were expected, but haven't arrived
+        """
+
+        if not self._output_queues.has_key(ppl.name):
+            return True
+
+        output_queue = self._output_queues.pop(ppl.name)
+        try:
+            outputs = output_queue.get(True, timeout)
+        except Queue.Empty:
+            ppl.logger.warning("Unit outputs were not received, everything "
+                    "will be recomputed on the next run")
+            return False
+
+        # None is sent, if the pipeline has failed before running
+        if outputs is not None:
+            ppl.import_outputs(outputs)
+        return True
+
+    def collect_sweep(self, ppl, sweep, timeout=1):
+        """
+        Calls the callback of the sweep with its result, sent by the process
+        which has just finished it (see 'collect_outputs')
+
+        Returns
+        -------
+        received : bool
+            False, if the result was expected, but hasn't arrived
+        """
+
+        result_queue, callback = sweep[2], sweep[1]
+
+        received = True
+        payload = None
+        # None, if the sweep hasn't started, or has been stopped
+        if result_queue is not None:
+            try:
+                payload = result_queue.get(True, timeout)
+            except Queue.Empty:
+                received = False
+        if payload is None:
+            payload = (False, "The sweep of %s was interrupted" % ppl.name)
+
+        try:
+            callback(*payload)
+        except Exception:
+            logging.error("Error in the sweep callback of %s:\n%s"
+                    % (ppl.name, traceback.format_exc()))
+
+        return received
+
+    def pipeline_status_callback(self, event):
+        """Copies the status from a status event to the pipeline or unit, if
+        the pipeline is run by the worker pool or by a remote worker"""
+        if event['type'] == "status":
+            data = event['data']
+            name = data['pipeline']
+            p = self._running_processes.get(name)
+            # the status is shared with the forked processes
+            if p is None or isinstance(p, mp.Process):
+                return
+
+            ppl = self.get_pipeline(name)
+            if data['target_type'] == 'pipeline':
+                target = ppl
+            else:
+                try:
+                    target = ppl.get_unit(data['target'])
+                except Exception:
+                    return
+
+            # not using the 'status' property, which would emit the event
+            # again
+            target._status.value = int(data['status'])
+
     def pipeline_stopper_callback(self, event):
         """Process a parsed log event and call 'on_pipeline_stop', if has
         stopped for some reason"""
@@ -349,13 +1800,17 @@ class PipelineManager(object):
 
     def pipeline_logger_callback(self, event):
         """Stores all pipeline events to a _log entry of a corresponding
-        pipeline object"""
+        pipeline object, and the profile events to its _profile"""
         if event['type'] == 'log':
             data = event['data']
             name = data['src']['pipeline']
             if name:
                 ppl = self.get_pipeline(name)
                 ppl._log.append(data)
+        elif event['type'] == 'profile':
+            data = event['data']
+            ppl = self.get_pipeline(data['pipeline'])
+            ppl._profile.add(data)
 
 
 
@@ -371,11 +1826,23 @@ def if_running(f):
     return wrapper
 
 class LogEventServer(object):
+    """Receives the log records of the running pipelines over a queue, and
+    dispatches them to the client handlers, in the order the clients were
+    added. A single listener thread runs all the time, so adding or removing
+    clients never interrupts the event flow"""
     def __init__(self):
         self.queue = mp.Queue()
         self.queue_listener = None
         self._pipelines = {}
-        self._clients = {}
+
+        # {client_id: log_handler}, modified under the lock
+        self._clients = OrderedDict()
+        self._clients_lock = threading.Lock()
+
+        # tuple of the handlers, used by the listener thread. Rebuilt lazily,
+        # after the clients have changed
+        self._handlers = ()
+        self._handlers_stale = False
 
     @property
     def running(self):
@@ -383,28 +1850,29 @@ class LogEventServer(object):
 
     @if_running
     def add_client(self, id, log_handler):
-        self._clients[id] = log_handler
-
-        # add handler to a QueueListener
-        # TODO: this is bad because all other clients have to wait until this
-        # function returns
-        self.queue_listener.stop()
-        handlers = list(self.queue_listener.handlers)
-        handlers.append(log_handler)
-        self.queue_listener = QueueListener(self.queue, *handlers)
-        self.queue_listener.start()
+        with self._clients_lock:
+            self._clients[id] = log_handler
+            self._handlers_stale = True
 
     @if_running
     def remove_client(self, id):
+        with self._clients_lock:
+            del self._clients[id]
+            self._handlers_stale = True
 
-        log_handler = self._clients[id]
-        del self._clients[id]
+    def get_handlers(self):
+        """Returns the handlers of the current clients"""
+        if self._handlers_stale:
+            with self._clients_lock:
+                self._handlers = tuple(self._clients.values())
+                self._handlers_stale = False
 
-        self.queue_listener.stop()
-        handlers = list(self.queue_listener.handlers)
-        handlers.remove(log_handler)
-        self.queue_listener = QueueListener(self.queue, *handlers)
-        self.queue_listener.start()
+        return self._handlers
+
+    def handle(self, record):
+        """Dispatches a record to all clients. Called by the listener"""
+        for handler in self.get_handlers():
+            handler.handle(record)
 
     @if_running
     def add_pipeline(self, ppl):
@@ -423,7 +1891,7 @@ class LogEventServer(object):
 
     def start(self):
         if not self.running:
-            self.queue_listener = QueueListener(self.queue)
+            self.queue_listener = QueueListener(self.queue, self)
             self.queue_listener.start()
         else:
             raise Exception("already running")
@@ -436,20 +1904,75 @@ class LogEventServer(object):
 
 class WebSocketLogHandler(logging.Handler):
     """Packs the received event to a JSON-serializable data format and sends it
-    to a client over a given websocket connection """
-    def __init__(self, stream):
+    to a client over a given websocket connection. Events arrive in the event
+    server's thread, so they are queued and sent from the IOLoop, collected
+    into batches of the form {'type': 'batch', 'data': [event, ...]}, keeping
+    their order"""
+    def __init__(self, stream, io_loop, flush_interval=0.005, binary=False):
         """
         Parameters
         ----------
         stream : tornado.websocket.WebSocketHandler
             a websocket connection to send events over
+        io_loop : tornado.ioloop.IOLoop
+            the loop serving the connection
+        flush_interval : float, optional
+            time (in seconds) to collect the events for, before sending them
+        binary : bool, optional
+            send msgpack-encoded binary messages, instead of JSON ones.
+            Requires the 'msgpack' package
         """
         super(WebSocketLogHandler, self).__init__()
+        if binary and msgpack is None:
+            raise ImportError("Package 'msgpack' is required to send binary "
+                    "event messages")
+
         self.stream = stream
+        self.io_loop = io_loop
+        self.flush_interval = flush_interval
+        self.binary = binary
+
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._send_scheduled = False
 
     def emit(self, record):
         res = EventTool.parse_log_record(record)
-        self.stream.write_message(res)
+        if res is None:
+            return
+
+        with self._pending_lock:
+            self._pending.append(res)
+            if self._send_scheduled:
+                return
+            self._send_scheduled = True
+
+        # the only IOLoop method, which is safe to call from other threads
+        self.io_loop.add_callback(self._schedule_send)
+
+    def _schedule_send(self):
+        self.io_loop.call_later(self.flush_interval, self.send_pending)
+
+    def send_pending(self):
+        """Sends the queued events as a single message. Has to be called from
+        the IOLoop thread"""
+        with self._pending_lock:
+            events = self._pending
+            self._pending = []
+            self._send_scheduled = False
+
+        if not events:
+            return
+
+        msg = {'type': 'batch', 'data': events}
+        try:
+            if self.binary:
+                self.stream.write_message(msgpack.packb(msg), binary=True)
+            else:
+                self.stream.write_message(msg)
+        except Exception:
+            # the connection has been closed in the meantime
+            pass
 
 
 class CallbackHandler(logging.Handler):
@@ -11,6 +11,12 @@ setup(
     description='A simplistic backend-agnostic web application for visualizing and constructing modular data-processing pipelines',
     long_description=open('README').read(),
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'earlpipeline-run = earlpipeline.batch:main',
+            'earlpipeline-worker = earlpipeline.distributed:main',
+        ],
+    },
     install_requires=[
         "tornado",
         "logutils",
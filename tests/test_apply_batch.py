@@ -0,0 +1,93 @@
+"""
+Tests of the atomic batch graph mutations ('GenericPipeline.apply_batch').
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+
+from earlpipeline.backends import calculator
+
+
+class ApplyBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.ppl = calculator.Pipeline('batch_test')
+        self.x = calculator.Number()
+        self.ppl.add_unit(self.x, 'x')
+        self.ppl.add_unit(calculator.ToLog(), 't')
+        self.ppl.connect('x', 'out', 't', 'inp')
+
+    def assertUnchanged(self):
+        self.assertEqual(sorted(unit.name for unit in self.ppl.units),
+                ['t', 'x'])
+        self.assertTrue(self.ppl.get_unit('x') is self.x)
+        self.assertEqual([(edge.src, edge.srcPort, edge.dst, edge.dstPort)
+            for edge in self.ppl.edges], [('x', 'out', 't', 'inp')])
+
+    def test_rollback_on_failing_last_operation(self):
+        operations = [
+                {'op': 'add_unit', 'unit': calculator.Add(), 'name': 'a'},
+                {'op': 'connect', 'src': 'x', 'srcPort': 'out', 'dst': 'a',
+                    'dstPort': 'num1'},
+                {'op': 'set_parameter', 'unit': 'x', 'name': 'value',
+                    'value': 1.0},
+                {'op': 'connect', 'src': 'x', 'srcPort': 'out',
+                    'dst': 'missing', 'dstPort': 'num1'},
+                ]
+        self.assertRaises(Exception, self.ppl.apply_batch, operations)
+
+        self.assertUnchanged()
+        self.assertEqual(self.x.value, 5.9)
+
+    def test_existing_name_is_rejected_before_applying(self):
+        operations = [
+                {'op': 'add_unit', 'unit': calculator.Number(), 'name': 'x'},
+                {'op': 'connect', 'src': 'x', 'srcPort': 'out',
+                    'dst': 'missing', 'dstPort': 'num1'},
+                ]
+        self.assertRaises(ValueError, self.ppl.apply_batch, operations)
+
+        self.assertUnchanged()
+
+    def test_name_freed_in_the_same_batch(self):
+        unit = calculator.Number()
+        self.ppl.apply_batch([
+                {'op': 'remove_unit', 'name': 'x'},
+                {'op': 'add_unit', 'unit': unit, 'name': 'x'},
+                ])
+
+        self.assertTrue(self.ppl.get_unit('x') is unit)
+        self.assertEqual(self.ppl.edges, [])
+
+    def test_add_unit_rejects_existing_name(self):
+        self.assertRaises(ValueError, self.ppl.add_unit, calculator.Number(),
+                'x')
+        self.assertUnchanged()
+
+    def test_failing_revert_doesnt_stop_rollback(self):
+        operations = [
+                {'op': 'set_parameter', 'unit': 'x', 'name': 'value',
+                    'value': 1.0},
+                {'op': 'add_unit', 'unit': calculator.Add(), 'name': 'a'},
+                {'op': 'connect', 'src': 'x', 'srcPort': 'out',
+                    'dst': 'missing', 'dstPort': 'num1'},
+                ]
+
+        # reverting 'add_unit' fails
+        def failing_remove_unit(name):
+            raise RuntimeError("can't remove %s" % name)
+        self.ppl.remove_unit = failing_remove_unit
+        try:
+            # the original error is re-raised
+            self.assertRaises(ValueError, self.ppl.apply_batch, operations)
+        finally:
+            del self.ppl.remove_unit
+
+        # the earlier operation is reverted nevertheless
+        self.assertEqual(self.x.value, 5.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests of the coroutine units and the 'async' executor
+('earlpipeline.backends.coroutines', 'executors.AsyncExecutor').
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import time
+import unittest
+
+from tornado import gen
+
+from earlpipeline.backends import calculator
+from earlpipeline.backends.base_simple_engine import Unit, OutPort
+from earlpipeline.tools import Status
+
+
+class Generator(Unit):
+    """A plain generator 'run', which is not a coroutine"""
+    out = OutPort('out')
+
+    def run(self):
+        yield 1
+
+
+class Decorated(Unit):
+    out = OutPort('out')
+
+    @gen.coroutine
+    def run(self):
+        yield gen.moment
+        self.out = 1
+
+
+class CoroutineTest(unittest.TestCase):
+    def test_explicit_marker(self):
+        self.assertFalse(Generator._async)
+        self.assertTrue(Decorated._async)
+        self.assertTrue(calculator.AsyncDelay._async)
+
+    def test_failure_abandons_coroutines(self):
+        ppl = calculator.Pipeline('abandon_test')
+        ppl.set_executor('async')
+        ppl.add_unit(calculator.Number(), 'n')
+        delay = calculator.AsyncDelay()
+        delay.delay_sec = 5
+        ppl.add_unit(delay, 'd')
+        ppl.connect('n', 'out', 'd', 'inp')
+        ppl.add_unit(calculator.Failer(), 'f')
+        ppl.connect('n', 'out', 'f', 'inp')
+
+        start = time.time()
+        self.assertRaises(Exception, ppl.run)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(ppl.get_unit('d').status, Status.FAILED)
+
+
+if __name__ == '__main__':
+    unittest.main()
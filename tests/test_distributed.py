@@ -0,0 +1,180 @@
+"""
+Tests of running the pipelines on the remote workers
+('earlpipeline.distributed'), with two workers on localhost.
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from earlpipeline import distributed
+from earlpipeline.backends import calculator
+from earlpipeline.tools import PipelineManager, LogEventServer, Status
+
+SECRET = 'test secret'
+
+
+class Capture(logging.Handler):
+    """Keeps the messages of the log records"""
+    def __init__(self):
+        super(Capture, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def wait_for(condition, timeout=10):
+    """Waits until the condition is true. Returns its last value"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self):
+        # status events are INFO messages
+        self.level = logging.getLogger().level
+        logging.getLogger().setLevel(logging.INFO)
+
+        self.servers = []
+        for _ in range(2):
+            server = distributed.WorkerServer(('127.0.0.1', 0), slots=1,
+                    heartbeat=0.5, secret=SECRET)
+            server.bind()
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            self.servers.append(server)
+
+        self.folder = tempfile.mkdtemp()
+        self.pipelines = PipelineManager(LogEventServer(), calculator,
+                self.folder, workers=0, max_running=2,
+                remote_workers=["%s:%d" % server.address
+                    for server in self.servers],
+                remote_secret=SECRET)
+        self.assertTrue(wait_for(lambda: self.pipelines.cluster.slots == 2))
+
+    def tearDown(self):
+        self.pipelines.cluster.close()
+        self.pipelines.event_server.stop()
+        for server in self.servers:
+            server.shutdown()
+        shutil.rmtree(self.folder)
+        logging.getLogger().setLevel(self.level)
+
+    def add_pipeline(self, name, delay):
+        ppl = calculator.Pipeline(name)
+        ppl.add_unit(calculator.Number(), 'n')
+        d = calculator.Delay()
+        d.delay_sec = delay
+        ppl.add_unit(d, 'd')
+        ppl.connect('n', 'out', 'd', 'inp')
+        self.pipelines.add_pipeline(ppl)
+        return ppl
+
+    def run_pipeline(self, ppl):
+        self.pipelines.start_pipeline(ppl.name)
+        self.assertTrue(wait_for(lambda: not
+            self.pipelines._running_processes.has_key(ppl.name)))
+        return ppl.status
+
+    def running_on(self):
+        """Returns the server, which runs a pipeline, and the process of
+        the run"""
+        for server in self.servers:
+            for conn in list(server.connections):
+                for p in conn.runs.values():
+                    return server, p
+        return None
+
+    def test_run(self):
+        ppl = self.add_pipeline('remote_run', 0)
+        self.assertEqual(self.run_pipeline(ppl), Status.FINISHED)
+
+    def test_partial_run(self):
+        ppl = self.add_pipeline('remote_partial', 5)
+        start = time.time()
+        self.pipelines.start_pipeline(ppl.name, units=['n'])
+        self.assertTrue(wait_for(lambda: not
+            self.pipelines._running_processes.has_key(ppl.name)))
+        self.assertEqual(ppl.status, Status.FINISHED)
+        # the delay unit hasn't run
+        self.assertLess(time.time() - start, 4)
+
+    def test_run_process_killed(self):
+        ppl = self.add_pipeline('remote_killed', 5)
+        capture = Capture()
+        ppl.logger.addHandler(capture)
+        try:
+            self.pipelines.start_pipeline(ppl.name)
+            self.assertTrue(wait_for(lambda: self.running_on() is not None))
+            server, p = self.running_on()
+            os.kill(p.pid, signal.SIGKILL)
+
+            self.assertTrue(wait_for(lambda: not
+                self.pipelines._running_processes.has_key(ppl.name)))
+            self.assertEqual(ppl.status, Status.FAILED)
+            # the worker has sent None instead of the outputs
+            self.assertFalse([msg for msg in capture.messages
+                if 'outputs were not received' in msg])
+        finally:
+            ppl.logger.removeHandler(capture)
+
+        # the worker is still usable
+        self.assertEqual(self.pipelines.cluster.slots, 2)
+        ppl.get_unit('d').delay_sec = 0
+        self.assertEqual(self.run_pipeline(ppl), Status.FINISHED)
+
+    def test_worker_shut_down(self):
+        ppl = self.add_pipeline('remote_lost', 5)
+        self.pipelines.start_pipeline(ppl.name)
+        self.assertTrue(wait_for(lambda: self.running_on() is not None))
+        server, p = self.running_on()
+        server.shutdown()
+
+        self.assertTrue(wait_for(lambda: not
+            self.pipelines._running_processes.has_key(ppl.name)))
+        self.assertEqual(ppl.status, Status.FAILED)
+        self.assertEqual(self.pipelines.cluster.slots, 1)
+
+    def test_wrong_secret(self):
+        worker = distributed.RemoteWorker("%s:%d" % self.servers[0].address,
+                self.pipelines.event_server.queue, secret='wrong')
+        self.assertFalse(worker.connect())
+        self.assertFalse(worker.connected)
+
+
+
+class SecretTest(unittest.TestCase):
+    def test_worker_refuses_public_address_without_secret(self):
+        server = distributed.WorkerServer(('0.0.0.0', 0))
+        self.assertRaises(ValueError, server.bind)
+        self.assertTrue(server.sock is None)
+        self.assertRaises(SystemExit, distributed.main,
+                ['--host', '0.0.0.0', '--port', '0', '--secret', ''])
+
+    def test_insecure_worker(self):
+        server = distributed.WorkerServer(('0.0.0.0', 0), insecure=True)
+        server.bind()
+        server.shutdown()
+
+    def test_coordinator_refuses_public_worker_without_secret(self):
+        self.assertRaises(ValueError, distributed.RemoteWorker,
+                '192.0.2.1:5100', None)
+        distributed.RemoteWorker('192.0.2.1:5100', None, secret=SECRET)
+        distributed.RemoteWorker('localhost:5100', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
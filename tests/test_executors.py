@@ -0,0 +1,97 @@
+"""
+Tests of the failures of the units run in a pool
+('earlpipeline.backends.executors').
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+
+from tornado import gen
+
+from earlpipeline.backends.base_simple_engine import Pipeline, Unit, \
+        InPort, OutPort
+from earlpipeline.tools import Status
+
+
+class LambdaSource(Unit):
+    """Outputs a value, which can't be pickled"""
+    out = OutPort('out')
+
+    def run(self):
+        self.out = lambda x: x
+
+
+class Unmeasurable(object):
+    """Data, the size of which can't be estimated (see 'profiling.py')"""
+    def __sizeof__(self):
+        raise TypeError("size unknown")
+
+
+class UnmeasurableSource(Unit):
+    out = OutPort('out')
+
+    def run(self):
+        self.out = [Unmeasurable()]
+
+
+class AsyncUnmeasurableSource(Unit):
+    out = OutPort('out')
+
+    @gen.coroutine
+    def run(self):
+        yield gen.moment
+        self.out = [Unmeasurable()]
+
+
+class Constant(Unit):
+    out = OutPort('out')
+
+    def run(self):
+        self.out = 1
+
+
+class Consumer(Unit):
+    inp = InPort('inp')
+    out = OutPort('out')
+
+    def run(self):
+        self.out = 1
+
+
+class PoolFailureTest(unittest.TestCase):
+    def make_pipeline(self, executor, source):
+        ppl = Pipeline('pool_failure_%s' % executor, executor, 2)
+        ppl.add_unit(source, 'source')
+        ppl.add_unit(Consumer(), 'consumer')
+        ppl.connect('source', 'out', 'consumer', 'inp')
+        return ppl
+
+    def test_unpicklable_output(self):
+        ppl = self.make_pipeline('processes', LambdaSource())
+        self.assertRaises(RuntimeError, ppl.run)
+        self.assertEqual(ppl.get_unit('source').status, Status.FAILED)
+
+    def test_unpicklable_state(self):
+        source = Constant()
+        source.transform = lambda x: x
+        ppl = self.make_pipeline('processes', source)
+        self.assertRaises(RuntimeError, ppl.run)
+        self.assertEqual(ppl.get_unit('source').status, Status.FAILED)
+
+    def test_failure_outside_run_in_threads(self):
+        ppl = self.make_pipeline('threads', UnmeasurableSource())
+        self.assertRaises(RuntimeError, ppl.run)
+        self.assertEqual(ppl.get_unit('source').status, Status.FAILED)
+
+    def test_failure_outside_run_in_async(self):
+        for source in (UnmeasurableSource(), AsyncUnmeasurableSource()):
+            ppl = self.make_pipeline('async', source)
+            self.assertRaises(RuntimeError, ppl.run)
+            self.assertEqual(ppl.get_unit('source').status, Status.FAILED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Tests of the pipeline file format ('earlpipeline.backends.storage').
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import unittest
+
+from earlpipeline.backends import calculator, storage
+from earlpipeline.backends.base_simple_engine import Unit, OutPort, Parameter
+
+
+class Label(Unit):
+    out = OutPort('out')
+    text = Parameter('text', 'input', str, 'label')
+    count = Parameter('count', 'input', int, 1, datatype='number')
+    extra = Parameter('extra', 'input', str, None)
+
+    def run(self):
+        self.out = self.text * self.count
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.ppl = calculator.Pipeline('storage_test')
+        self.label = Label()
+        self.label.text = 'hello'
+        self.label.count = 3
+        self.label.extra = (1, 2)
+        self.ppl.add_unit(self.label, 'label')
+
+    def reload(self):
+        return storage.loads(calculator.Pipeline, storage.dumps(self.ppl))
+
+    def test_parameters_keep_declared_type(self):
+        label = self.reload().get_unit('label')
+        self.assertEqual(label.text, 'hello')
+        self.assertTrue(type(label.text) is str)
+        self.assertTrue(type(label.count) is int)
+        # pickled values are not cast
+        self.assertEqual(label.extra, (1, 2))
+
+    def test_cache_key_survives_reload(self):
+        ppl = self.reload()
+        self.assertEqual(ppl.get_cache_key('label', {}),
+                self.ppl.get_cache_key('label', {}))
+
+    def test_uncastable_value_is_kept(self):
+        self.label.text = u'\xe9t\xe9'
+        label = self.reload().get_unit('label')
+        self.assertEqual(label.text, u'\xe9t\xe9')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Tests of running the pipelines in the worker pool of the server
+('earlpipeline.tools.WorkerPool').
+
+Run from the root of the repository:
+
+    python -m unittest discover -s tests
+"""
+
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import unittest
+
+from earlpipeline import tools
+from earlpipeline.backends import calculator
+from earlpipeline.backends.base_simple_engine import Pipeline
+from earlpipeline.backends.result_cache import ResultCache
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = tools.WorkerPool(mp.Queue(), size=1, max_runs=None)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        Pipeline.result_cache = None
+        self.pool.shutdown()
+        shutil.rmtree(self.folder)
+
+    def run_pipeline(self, ppl):
+        worker = self.pool.submit(ppl, export_outputs=True)
+        self.assertTrue(worker is not None)
+        outputs = worker.outputs.get(True, 10)
+        self.pool.release(worker)
+        return outputs
+
+    def test_result_cache_set_after_start(self):
+        # the workers are forked before the cache is set up
+        Pipeline.result_cache = ResultCache(self.folder)
+
+        ppl = calculator.Pipeline('pool_cache')
+        ppl.add_unit(calculator.Number(), 'n')
+        self.assertTrue(self.run_pipeline(ppl) is not None)
+
+        self.assertEqual(len([fname for fname in os.listdir(self.folder)
+            if fname.endswith(ResultCache.extension)]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()